@@ -2,182 +2,3092 @@ import sys
 import os
 import shutil
 import platform
+import stat
+import errno
+import time
+import threading
+import queue
+import concurrent.futures
+import mmap
+import struct
+import tempfile
+import hashlib
+import bisect
+import sqlite3
+import pathlib
+import heapq
+import calendar
+import re
+from array import array
 from datetime import datetime, timedelta
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QLabel, QLineEdit, QPushButton, 
                              QFileDialog, QTextEdit, QSpinBox, QComboBox,
                              QGroupBox, QMessageBox, QCheckBox, QTimeEdit, 
-                             QGridLayout, QListWidget, QTabWidget,
+                             QGridLayout, QListWidget, QListWidgetItem, QTabWidget,
                              QSizePolicy, QProgressBar, QStackedWidget, 
                              QToolBar, QAction, QFrame)
 from PyQt5.QtCore import QTimer, Qt, QTime, QSettings, QSize
 from PyQt5.QtGui import QIcon
-from PyQt5.QtCore import QThread, pyqtSignal, QStandardPaths
+from PyQt5.QtCore import QObject, pyqtSignal, QStandardPaths
+
+# NumPy необязателен: ускоряет сравнение манифестов, без него работает слияние
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Максимальное количество записей в очереди между сканированием и копированием
+SCAN_QUEUE_SIZE = 4096
+
+# Объем колонок манифеста в памяти, после которого они выгружаются на диск
+MANIFEST_MEMORY_BUDGET = 64 * 1024 * 1024
+# Без NumPy снимок сортируется отрезками такой длины, которые затем сливаются
+SNAPSHOT_SORT_RUN = 65536
+
+# Флаги записей манифеста
+ENTRY_FILE = 0
+ENTRY_SYMLINK = 1
+ENTRY_HARDLINKED = 2  # обычный файл, у которого несколько жестких ссылок (st_nlink > 1)
+ENTRY_SPARSE = 4      # файл с дырами: занятых блоков меньше, чем размер
+
+# Файлы меньше этого размера не проверяются на разреженность
+SPARSE_MIN_SIZE = 64 * 1024
+
+# Размер блока при поблочном копировании данных
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Сколько файлов вкладки накапливается перед выполнением пакетом
+COPY_BATCH_SIZE = 256
+
+# Файлы меньше этого размера копируются пакетом: сначала чтение всех, затем запись
+SMALL_FILE_SIZE = 16 * 1024
+
+# Записи, которые всегда копируются по одному: ссылки и разреженные файлы
+SMALL_FILE_EXCLUDED_KINDS = ENTRY_SYMLINK | ENTRY_HARDLINKED | ENTRY_SPARSE
+
+# Отложенные метаданные файлов переносятся пакетами такого размера в нескольких потоках
+METADATA_SWEEP_SIZE = 4096
+METADATA_WORKERS = 8
+# Списки доступа POSIX ACL хранятся в расширенных атрибутах с этим префиксом
+ACL_XATTR_PREFIX = 'system.posix_acl_'
+
+# FIEMAP: запрос физического расположения экстентов файла (linux/fiemap.h)
+FS_IOC_FIEMAP = 0xC020660B
+FIEMAP_HEADER = struct.Struct('=QQIIII')
+FIEMAP_EXTENT = struct.Struct('=QQQ16xI12x')
+FIEMAP_EXTENT_UNKNOWN = 0x2
+FIEMAP_EXTENT_DATA_INLINE = 0x200
+
+# Через сколько байт освобождать прочитанные и записанные страницы кэша
+CACHE_DROP_WINDOW = 8 * 1024 * 1024
+
+# Запас свободного места, который копирование оставляет на устройстве назначения
+FREE_SPACE_RESERVE = 16 * 1024 * 1024
+# Свободное место перепроверяется после стольких записанных байт или секунд
+FREE_SPACE_CHECK_BYTES = 256 * 1024 * 1024
+FREE_SPACE_CHECK_INTERVAL = 5.0
+
+# Файлы, изменившиеся во время копирования, копируются повторно в конце запуска
+CHANGED_RETRY_LIMIT = 1000      # сколько файлов может ждать повтора
+CHANGED_RETRY_ATTEMPTS = 3      # сколько раз повторять, прежде чем признать копию несогласованной
+CHANGED_RETRY_DELAY = 0.5       # пауза перед повтором в секундах, растет с каждой попыткой
+INCONSISTENT_REPORT_LIMIT = 10  # сколько таких файлов перечислять в отчете
+
+# Файлы, занятые другой программой или временно недоступные, повторяются с растущей паузой,
+# пока копирование продолжается; после всех попыток они попадают в список неудавшихся
+FAILED_RETRY_ATTEMPTS = 4       # сколько раз повторять копирование файла
+FAILED_RETRY_DELAY = 1.0        # пауза перед первым повтором в секундах, удваивается с каждой попыткой
+FAILED_REPORT_LIMIT = 10        # сколько неудавшихся файлов перечислять в отчете
+TRANSIENT_ERRNOS = {errno.EBUSY, errno.EAGAIN, errno.EINTR, errno.EIO, errno.ETIMEDOUT,
+                    errno.ETXTBSY, errno.ESTALE}
+# Нет доступа: чаще всего постоянно, но бывает и временным (блокировка, сетевой ресурс) - один повтор
+ACCESS_ERRNOS = {errno.EACCES}
+ACCESS_RETRY_ATTEMPTS = 1
+# Windows: файл открыт другим процессом или заблокирован его участок
+TRANSIENT_WINERRORS = {32, 33}
+
+# Запись одного прочитанного файла в несколько папок назначения: у каждой копии своя очередь
+# не больше TEE_BUFFER_SIZE байт; файлы меньше TEE_THREAD_SIZE пишутся по очереди без потоков
+TEE_BUFFER_SIZE = 64 * 1024 * 1024
+TEE_THREAD_SIZE = 1024 * 1024
+
+# Данные, переживающие запуск копирования: номера копий путей назначения и снимки вкладок
+NAMING_INDEX_SIZE = 65536                  # сколько путей назначения помнят последний выданный номер
+SNAPSHOT_CACHE_BUDGET = 64 * 1024 * 1024   # сколько памяти могут занимать снимки прошлых запусков
+
+# Базы SQLite копируются через online backup API порциями страниц, не блокируя пишущих
+SQLITE_EXTENSIONS = ('.sqlite', '.sqlite3', '.db', '.db3')
+SQLITE_SIDECAR_SUFFIXES = ('-wal', '-shm', '-journal')
+# Без этих файлов копия базы, снятая как обычный файл, теряет подтвержденные транзакции (-shm SQLite строит заново)
+SQLITE_FALLBACK_SIDECARS = ('-wal', '-journal')
+SQLITE_HEADER = b'SQLite format 3\x00'
+SQLITE_BACKUP_PAGES = 256     # страниц за один шаг резервного копирования
+SQLITE_BACKUP_SLEEP = 0.05    # пауза между шагами, если база занята, в секундах
+SQLITE_BUSY_TIMEOUT = 5.0
+
+# Режимы надежности записи: когда скопированные данные сбрасываются на диск
+DURABILITY_NONE = 'none'  # полагаться на систему, данные последних файлов могут пропасть при сбое питания
+DURABILITY_RUN = 'run'    # один барьер в конце запуска: syncfs или fsync файлов и папок пакетами
+DURABILITY_FILE = 'file'  # fsync каждого файла сразу после записи данных
+
+# Политики обработки символических ссылок в источниках
+SYMLINK_PRESERVE = 'preserve'  # воссоздать ссылку в папке назначения
+SYMLINK_FOLLOW = 'follow'      # копировать то, на что указывает ссылка, каждую папку один раз
+SYMLINK_SKIP = 'skip'          # не копировать ссылки
+
+
+def get_peak_rss():
+    """Пиковый объем резидентной памяти процесса в байтах, 0 - если недоступно"""
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # В macOS значение в байтах, в Linux - в килобайтах
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+# Файловые системы, к которым обращение идет по сети
+NETWORK_FILESYSTEMS = {
+    'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'ncpfs', '9p', 'afs', 'ceph', 'glusterfs',
+    'fuse.sshfs', 'fuse.glusterfs', 'fuse.davfs2', 'davfs', 'fuse.rclone', 'fuse.s3fs'
+}
+
+
+class DeviceClassifier:
+    """Определяет тип устройства пути: ssd, hdd, network или unknown.
+
+    Тип файловой системы берется из /proc/self/mountinfo, вращение диска -
+    из /sys/block/<диск>/queue/rotational. Если ни то ни другое недоступно,
+    для папки, куда разрешено писать, выполняется короткий замер задержки
+    записи. Результаты кэшируются по st_dev.
+    """
+
+    PROBE_WRITES = 8
+    # Средняя задержка записи 4 KB с fsync, выше которой устройство считается диском с головками
+    PROBE_HDD_LATENCY = 0.004
 
+    def __init__(self):
+        self.cache = {}
+        self.lock = threading.Lock()
 
-class BackupWorker(QThread):
-    progress_updated = pyqtSignal(int)
-    status_updated = pyqtSignal(str)
-    finished_signal = pyqtSignal(bool, str)
+    def classify(self, path, probe=False):
+        """Сведения об устройстве пути: kind, fstype, source (откуда взят тип)"""
+        path = nearest_existing_path(path)
+        try:
+            st_dev = os.stat(path).st_dev
+        except OSError:
+            return {'kind': 'unknown', 'fstype': None, 'source': "нет доступа"}
+        with self.lock:
+            cached = self.cache.get(st_dev)
+        if cached is not None and (cached['kind'] != 'unknown' or not probe):
+            return cached
+
+        fstype, mount_source = self.find_mount(st_dev, path)
+        info = {'kind': 'unknown', 'fstype': fstype, 'source': "не определен"}
+        if fstype in NETWORK_FILESYSTEMS:
+            info.update(kind='network', source="тип файловой системы")
+        else:
+            rotational = self.read_rotational(st_dev, mount_source)
+            if rotational is not None:
+                info.update(kind='hdd' if rotational else 'ssd', source="sysfs")
+        if info['kind'] == 'unknown' and probe:
+            latency = self.probe_write_latency(path)
+            if latency is not None:
+                info.update(kind='hdd' if latency > self.PROBE_HDD_LATENCY else 'ssd',
+                            source=f"замер ({latency * 1000:.1f} мс на запись)")
+
+        with self.lock:
+            self.cache[st_dev] = info
+        return info
+
+    @staticmethod
+    def find_mount(st_dev, path):
+        """(тип файловой системы, источник монтирования) для st_dev, (None, None) - не найдено"""
+        try:
+            with open('/proc/self/mountinfo') as f:
+                lines = f.readlines()
+        except OSError:
+            return None, None
+        device_id = f"{os.major(st_dev)}:{os.minor(st_dev)}"
+        real_path = os.path.realpath(path)
+        best = (None, None)
+        best_length = -1
+        for line in lines:
+            left, separator, right = line.partition(' - ')
+            fields = left.split()
+            right_fields = right.split()
+            if not separator or len(fields) < 5 or len(right_fields) < 2:
+                continue
+            if fields[2] == device_id:
+                return right_fields[0], right_fields[1]
+            # Запасной вариант - самая длинная точка монтирования, содержащая путь
+            mount_point = re.sub(r'\\([0-7]{3})', lambda match: chr(int(match.group(1), 8)), fields[4])
+            if (real_path == mount_point or real_path.startswith(mount_point.rstrip('/') + '/')) \
+                    and len(mount_point) > best_length:
+                best = (right_fields[0], right_fields[1])
+                best_length = len(mount_point)
+        return best
+
+    @staticmethod
+    def read_rotational(st_dev, mount_source=None):
+        """Признак вращающегося диска из sysfs, None - недоступно"""
+        major, minor = os.major(st_dev), os.minor(st_dev)
+        if major == 0 and mount_source and mount_source.startswith('/dev/'):
+            # Анонимное устройство (btrfs и подобные): берем блочное устройство из источника монтирования
+            try:
+                rdev = os.stat(mount_source).st_rdev
+                major, minor = os.major(rdev), os.minor(rdev)
+            except OSError:
+                return None
+        device_dir = os.path.realpath(f"/sys/dev/block/{major}:{minor}")
+        # У раздела нет своей очереди, она есть у родительского диска
+        for candidate in (device_dir, os.path.dirname(device_dir)):
+            try:
+                with open(os.path.join(candidate, 'queue', 'rotational')) as f:
+                    return f.read().strip() == '1'
+            except OSError:
+                continue
+        return None
 
-    def __init__(self, source_folders, source_files, destination_folder, 
-                 copy_folder_contents, keep_history, create_backup_folder):
-        super().__init__()
-        self.source_folders = source_folders
-        self.source_files = source_files
-        self.destination_folder = destination_folder
-        self.copy_folder_contents = copy_folder_contents
-        self.keep_history = keep_history
-        self.create_backup_folder = create_backup_folder
+    def probe_write_latency(self, path):
+        """Средняя задержка записи 4 KB с fsync во временный файл, None - замер невозможен"""
+        if not os.path.isdir(path) or not os.access(path, os.W_OK):
+            return None
+        try:
+            fd, probe_path = tempfile.mkstemp(prefix='.backup-probe-', dir=path)
+        except OSError:
+            return None
+        try:
+            block = b'\0' * 4096
+            started = time.perf_counter()
+            for index in range(self.PROBE_WRITES):
+                # Блоки разнесены по файлу, чтобы диску с головками пришлось их искать
+                os.pwrite(fd, block, index * 8 * 1024 * 1024)
+                os.fsync(fd)
+            return (time.perf_counter() - started) / self.PROBE_WRITES
+        except OSError:
+            return None
+        finally:
+            os.close(fd)
+            try:
+                os.remove(probe_path)
+            except OSError:
+                pass
+
+
+DEVICE_CLASSIFIER = DeviceClassifier()
+
+
+class EngineCache:
+    """Сведения, которые запуски копирования передают следующим запускам в том же процессе.
+
+    names: путь назначения -> последний выданный номер копии (имя_(N)), чтобы
+    не перебирать заново все уже занятые имена. snapshots: файл снимка
+    вкладки -> (st_ino, st_mtime_ns, st_size, снимок); снимок берется из
+    памяти, только если файл на диске с тех пор не менялся. Оба словаря
+    ограничены и вытесняют записи, которые дольше всего не использовались.
+    """
+
+    def __init__(self, naming_size=NAMING_INDEX_SIZE, snapshot_budget=SNAPSHOT_CACHE_BUDGET):
+        self.naming_size = naming_size
+        self.snapshot_budget = snapshot_budget
+        self.names = {}
+        self.snapshots = {}
+        self.snapshot_bytes = 0
+        self.lock = threading.Lock()
+
+    def last_name_number(self, path):
+        """Последний выданный номер копии для пути, None - неизвестен"""
+        with self.lock:
+            number = self.names.pop(path, None)
+            if number is not None:
+                self.names[path] = number
+            return number
+
+    def remember_name_number(self, path, number):
+        with self.lock:
+            self.names.pop(path, None)
+            self.names[path] = number
+            while len(self.names) > self.naming_size:
+                del self.names[next(iter(self.names))]
+
+    @staticmethod
+    def file_key(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def get_snapshot(self, path):
+        """Снимок из памяти, если файл снимка не менялся с момента, когда его запомнили"""
+        key = self.file_key(path)
+        with self.lock:
+            cached = self.snapshots.pop(path, None)
+            if cached is None:
+                return None
+            if cached[0] != key:
+                self.snapshot_bytes -= cached[2]
+                return None
+            self.snapshots[path] = cached
+            return cached[1]
+
+    def put_snapshot(self, path, snapshot):
+        """Запоминает снимок, совпадающий с файлом path на диске"""
+        key = self.file_key(path)
+        size = sum(column.itemsize * len(column) for column in snapshot.columns.values())
+        with self.lock:
+            previous = self.snapshots.pop(path, None)
+            if previous is not None:
+                self.snapshot_bytes -= previous[2]
+            if key is None or size > self.snapshot_budget:
+                return
+            self.snapshots[path] = (key, snapshot, size)
+            self.snapshot_bytes += size
+            while self.snapshot_bytes > self.snapshot_budget:
+                oldest = self.snapshots.pop(next(iter(self.snapshots)))
+                self.snapshot_bytes -= oldest[2]
+
+
+ENGINE_CACHE = EngineCache()
+
+COPY_ORDER_NAMES = {
+    'scan': "как при сканировании",
+    'inode': "по inode",
+    'physical': "по физическому расположению",
+}
+
+DEFAULT_COPY_STRATEGY = {'workers': 1, 'chunk_size': COPY_CHUNK_SIZE, 'order': 'scan',
+                         'reason': "подбор по типу устройств отключен"}
+
+
+def choose_copy_strategy(source_kinds, destination_kind):
+    """Число потоков, размер блока и порядок чтения для вкладки по типам ее устройств"""
+    kinds = set(source_kinds) | {destination_kind}
+    if 'hdd' in source_kinds:
+        return {'workers': 1, 'chunk_size': 4 * COPY_CHUNK_SIZE, 'order': 'physical',
+                'reason': "источник на диске с головками: один поток, крупные блоки, "
+                          "чтение по физическому расположению"}
+    if 'hdd' in kinds:
+        return {'workers': 1, 'chunk_size': 4 * COPY_CHUNK_SIZE, 'order': 'inode',
+                'reason': "назначение на диске с головками: один поток, крупные блоки, чтение по порядку inode"}
+    if 'network' in kinds:
+        return {'workers': 8, 'chunk_size': 4 * COPY_CHUNK_SIZE, 'order': 'scan',
+                'reason': "сетевая файловая система: больше одновременных запросов"}
+    if kinds == {'ssd'}:
+        return {'workers': min(8, 2 * (os.cpu_count() or 1)), 'chunk_size': COPY_CHUNK_SIZE, 'order': 'scan',
+                'reason': "твердотельные накопители: параллельное копирование"}
+    return {'workers': 2, 'chunk_size': COPY_CHUNK_SIZE, 'order': 'scan',
+            'reason': "тип устройства не определен: умеренная параллельность"}
+
+
+class ScanManifest:
+    """Компактный колоночный манифест сканирования.
+
+    Вместо объекта на каждый файл хранит интернированные относительные пути
+    папок и параллельные массивы (корень, папка, конец имени, размер, mtime,
+    устройство, inode, тип).
+    Имена файлов лежат подряд в одном байтовом буфере. При превышении бюджета
+    памяти колонки дописываются в файлы в spill_dir и читаются через mmap.
+    """
+
+    COLUMNS = (('roots', 'I'), ('dirs', 'I'), ('name_ends', 'Q'),
+               ('sizes', 'Q'), ('mtimes', 'q'), ('devs', 'Q'), ('inodes', 'Q'), ('kinds', 'B'))
+
+    def __init__(self, spill_dir=None, memory_budget=MANIFEST_MEMORY_BUDGET):
+        self.prefixes = []
+        self.prefix_index = {}
+        self.dir_roots = array('I')
+        self.dir_prefixes = array('I')
+        self.columns = {name: array(code) for name, code in self.COLUMNS}
+        self.names = bytearray()
+        self.names_total = 0
+        self.count = 0
+        # Занятое место разреженных файлов (номер записи -> байт), у остальных оно равно размеру
+        self.allocated = {}
+        self.spill_dir = spill_dir
+        self.spill_path = None
+        self.memory_budget = memory_budget
+        self.spilled_count = 0
+        self.spilled_names = 0
+        self.maps = {}
+        self.mapped_count = 0
+        self.lock = threading.Lock()
+
+    def intern(self, prefix):
+        """Возвращает номер относительного пути папки, добавляя его при первом появлении"""
+        index = self.prefix_index.get(prefix)
+        if index is None:
+            index = len(self.prefixes)
+            self.prefixes.append(prefix)
+            self.prefix_index[prefix] = index
+        return index
+
+    def add_dir(self, root_index, rel_dir):
+        """Добавляет папку, возвращает ее номер"""
+        with self.lock:
+            self.dir_roots.append(root_index)
+            self.dir_prefixes.append(self.intern(rel_dir))
+            return len(self.dir_roots) - 1
+
+    def add_file(self, root_index, rel_dir, name, stat_result, kind=ENTRY_FILE):
+        """Добавляет файл или ссылку, возвращает номер записи в манифесте"""
+        encoded = os.fsencode(name)
+        with self.lock:
+            self.names += encoded
+            self.names_total += len(encoded)
+            columns = self.columns
+            columns['roots'].append(root_index)
+            columns['dirs'].append(self.intern(rel_dir))
+            columns['name_ends'].append(self.names_total)
+            columns['sizes'].append(stat_result.st_size)
+            columns['mtimes'].append(stat_result.st_mtime_ns)
+            columns['devs'].append(stat_result.st_dev)
+            columns['inodes'].append(stat_result.st_ino)
+            if kind == ENTRY_FILE:
+                if stat_result.st_nlink > 1:
+                    kind |= ENTRY_HARDLINKED
+                if is_sparse(stat_result):
+                    kind |= ENTRY_SPARSE
+                    self.allocated[self.count] = allocated_size(stat_result)
+            columns['kinds'].append(kind)
+            self.count += 1
+            if self.spill_dir and self.count % 4096 == 0 and self.memory_usage() > self.memory_budget:
+                self.spill()
+            return self.count - 1
+
+    def memory_usage(self):
+        """Объем колонок, хранящихся в памяти, в байтах"""
+        used = len(self.names) + len(self.dir_roots) * 8
+        for column in self.columns.values():
+            used += len(column) * column.itemsize
+        return used
+
+    def spill(self):
+        """Дописывает колонки из памяти в файлы на диске и освобождает память"""
+        if self.spill_path is None:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            self.spill_path = tempfile.mkdtemp(prefix="manifest_", dir=self.spill_dir)
+        for name, column in self.columns.items():
+            with open(os.path.join(self.spill_path, name), 'ab') as f:
+                column.tofile(f)
+            del column[:]
+        with open(os.path.join(self.spill_path, 'names'), 'ab') as f:
+            f.write(self.names)
+        self.names = bytearray()
+        self.spilled_count = self.count
+        self.spilled_names = self.names_total
+
+    def remap(self):
+        """Отображает выгруженные колонки в память после очередной выгрузки"""
+        self.close_maps()
+        for name, code in self.COLUMNS + (('names', 'B'),):
+            with open(os.path.join(self.spill_path, name), 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.maps[name] = (mapped, memoryview(mapped).cast(code))
+        self.mapped_count = self.spilled_count
+
+    def close_maps(self):
+        for mapped, view in self.maps.values():
+            view.release()
+            mapped.close()
+        self.maps = {}
+
+    def get(self, index):
+        """Возвращает (корень, относительный путь, размер, mtime_ns, устройство, inode, тип) записи"""
+        with self.lock:
+            if index >= self.spilled_count:
+                local = index - self.spilled_count
+                values = {name: column[local] for name, column in self.columns.items()}
+                name_start = self.columns['name_ends'][local - 1] if local > 0 else self.spilled_names
+                name = bytes(self.names[name_start - self.spilled_names:values['name_ends'] - self.spilled_names])
+            else:
+                if self.mapped_count != self.spilled_count:
+                    self.remap()
+                values = {name: self.maps[name][1][index] for name, code in self.COLUMNS}
+                name_start = self.maps['name_ends'][1][index - 1] if index > 0 else 0
+                name = bytes(self.maps['names'][1][name_start:values['name_ends']])
+            rel_path = os.path.join(self.prefixes[values['dirs']], os.fsdecode(name))
+        return (values['roots'], rel_path, values['sizes'], values['mtimes'],
+                values['devs'], values['inodes'], values['kinds'])
+
+    def allocated_size(self, index, size):
+        """Место, которое займет копия файла записи index размером size"""
+        return self.allocated.get(index, size)
+
+    def get_dir(self, index):
+        """Возвращает (корень, относительный путь) папки"""
+        with self.lock:
+            return self.dir_roots[index], self.prefixes[self.dir_prefixes[index]]
+
+    def close(self):
+        """Освобождает отображения и удаляет выгруженные на диск колонки"""
+        with self.lock:
+            self.close_maps()
+            if self.spill_path:
+                shutil.rmtree(self.spill_path, ignore_errors=True)
+                self.spill_path = None
+
+
+def is_sparse(stat_result):
+    """Занимает ли файл на диске заметно меньше места, чем его размер"""
+    blocks = getattr(stat_result, 'st_blocks', None)
+    if blocks is None or stat_result.st_size < SPARSE_MIN_SIZE:
+        return False
+    return blocks * 512 < stat_result.st_size
+
+
+def allocated_size(stat_result):
+    """Сколько места займет копия файла: разреженный файл копируется с дырами (copy_sparse_file)"""
+    if is_sparse(stat_result) and hasattr(os, 'SEEK_DATA'):
+        return stat_result.st_blocks * 512
+    return stat_result.st_size
+
+
+def read_xattrs(target, include_xattrs=True, include_acls=True):
+    """Расширенные атрибуты файла по пути или дескриптору: [(имя, значение)]"""
+    if not (include_xattrs or include_acls) or not hasattr(os, 'listxattr'):
+        return []
+    xattrs = []
+    try:
+        for name in os.listxattr(target):
+            if include_acls if name.startswith(ACL_XATTR_PREFIX) else include_xattrs:
+                xattrs.append((name, os.getxattr(target, name)))
+    except OSError as e:
+        if e.errno not in (errno.EPERM, errno.ENOTSUP, errno.ENODATA, errno.EINVAL):
+            raise
+    return xattrs
+
+
+def read_small_file(path, include_xattrs=True, include_acls=True, source_stats=None):
+    """Читает мелкий файл целиком: (данные, stat после чтения, расширенные атрибуты).
+
+    source_stats, если задан (список), получает fstat файла до чтения и после него.
+    """
+    fd = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        stat_result = os.fstat(fd)
+        if source_stats is not None:
+            source_stats.append(stat_result)
+        # Обычный файл отдает все данные одним чтением, короче - только в конце файла
+        data = os.read(fd, stat_result.st_size + 1)
+        if len(data) > stat_result.st_size:
+            # Файл вырос после fstat: дочитываем остаток
+            parts = [data]
+            while True:
+                chunk = os.read(fd, COPY_CHUNK_SIZE)
+                if not chunk:
+                    break
+                parts.append(chunk)
+            data = b''.join(parts)
+        # Состояние после чтения: по нему проверяется, что файл не менялся во время копирования
+        stat_result = os.fstat(fd)
+        if source_stats is not None:
+            source_stats.append(stat_result)
+        xattrs = read_xattrs(fd, include_xattrs, include_acls)
+    finally:
+        os.close(fd)
+    return data, stat_result, xattrs
+
+
+def apply_file_metadata(path, stat_result, xattrs=(), extra_mode=0):
+    """Переносит на копию время изменения, права и атрибуты так же, как shutil.copystat.
+
+    extra_mode добавляется к правам источника.
+    """
+    os.utime(path, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns))
+    for name, value in xattrs:
+        try:
+            os.setxattr(path, name, value)
+        except OSError as e:
+            if e.errno not in (errno.EPERM, errno.ENOTSUP, errno.ENODATA, errno.EINVAL):
+                raise
+    os.chmod(path, stat.S_IMODE(stat_result.st_mode) | extra_mode)
+    flags = getattr(stat_result, 'st_flags', 0)
+    if flags and hasattr(os, 'chflags'):
+        try:
+            os.chflags(path, flags)
+        except OSError as e:
+            if e.errno not in (errno.EOPNOTSUPP, errno.ENOTSUP):
+                raise
+
+
+def first_physical_offset(path):
+    """Физическое смещение первого экстента файла через FIEMAP, None - у файла нет экстентов.
+
+    OSError, если файловая система или платформа FIEMAP не поддерживает.
+    """
+    if fcntl is None or not sys.platform.startswith('linux'):
+        raise OSError(errno.EOPNOTSUPP, "FIEMAP недоступен")
+    # struct fiemap (32 байта) и место под один struct fiemap_extent (56 байт)
+    request = bytearray(FIEMAP_HEADER.size + FIEMAP_EXTENT.size)
+    FIEMAP_HEADER.pack_into(request, 0, 0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0)
+    fd = os.open(path, os.O_RDONLY | getattr(os, 'O_NOFOLLOW', 0))
+    try:
+        fcntl.ioctl(fd, FS_IOC_FIEMAP, request)
+    finally:
+        os.close(fd)
+    mapped_extents = FIEMAP_HEADER.unpack_from(request, 0)[3]
+    if not mapped_extents:
+        return None
+    logical, physical, length, flags = FIEMAP_EXTENT.unpack_from(request, FIEMAP_HEADER.size)
+    if flags & (FIEMAP_EXTENT_UNKNOWN | FIEMAP_EXTENT_DATA_INLINE):
+        # Расположение еще не назначено или данные хранятся внутри inode
+        return None
+    return physical
+
+
+def write_all(fd, data, offset=None):
+    """Пишет данные целиком, продолжая после частичной записи; offset - запись с позиции через pwrite"""
+    with memoryview(data) as view:
+        written = 0
+        while written < len(view):
+            if offset is None:
+                written += os.write(fd, view[written:])
+            else:
+                written += os.pwrite(fd, view[written:], offset + written)
+
+
+class ExtraCopies:
+    """Дополнительные копии файла: данные, прочитанные один раз, пишутся еще в несколько файлов.
+
+    При threaded каждая копия пишется своим потоком из очереди, в которой ждет
+    не больше buffer_size байт. Копия, не успевающая за чтением, отключается
+    с ошибкой EAGAIN (ее скопируют отдельно), ошибка записи закрывает только
+    свою копию. errors после close: путь -> OSError.
+    """
+
+    def __init__(self, paths, buffer_size=TEE_BUFFER_SIZE, threaded=True):
+        self.buffer_size = buffer_size
+        self.threaded = threaded
+        self.writers = {}
+        self.errors = {}
+        self.lagging = 0
+        self.lock = threading.Lock()
+        for path in paths:
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o666)
+            except OSError as e:
+                self.errors[path] = e
+                continue
+            writer = {'fd': fd, 'queue': queue.Queue(), 'queued': 0, 'error': None, 'thread': None}
+            if threaded:
+                writer['thread'] = threading.Thread(target=self.run_writer, args=(writer,), daemon=True)
+                writer['thread'].start()
+            self.writers[path] = writer
+
+    def run_writer(self, writer):
+        """Поток записи одной копии: выполняет операции по порядку до первой ошибки"""
+        while True:
+            item = writer['queue'].get()
+            if item is None:
+                writer['queue'].task_done()
+                return
+            function, args, size = item
+            if writer['error'] is None:
+                try:
+                    function(writer['fd'], *args)
+                except OSError as e:
+                    writer['error'] = e
+            with self.lock:
+                writer['queued'] -= size
+            writer['queue'].task_done()
+
+    def submit(self, function, args, size=0):
+        """Передает операцию всем исправным копиям; без потоков выполняет ее сразу"""
+        for path, writer in self.writers.items():
+            if writer['error'] is not None:
+                continue
+            if not self.threaded:
+                try:
+                    function(writer['fd'], *args)
+                except OSError as e:
+                    writer['error'] = e
+                continue
+            with self.lock:
+                # Хотя бы один блок в очереди допускается всегда, даже если он больше буфера
+                lagging = writer['queued'] > 0 and writer['queued'] + size > self.buffer_size
+                if not lagging:
+                    writer['queued'] += size
+            if lagging:
+                self.lagging += 1
+                writer['error'] = OSError(errno.EAGAIN, "папка назначения не успевает за чтением", path)
+                continue
+            writer['queue'].put((function, args, size))
+
+    def apply(self, function, *args):
+        """Вызывает function(fd, *args) для каждой исправной копии"""
+        self.submit(function, args)
+
+    def write(self, data, offset=None):
+        # Буфер чтения используется повторно, поэтому копии получают свой экземпляр данных
+        self.submit(write_all, (bytes(data), offset), len(data))
+
+    def copy_from(self, path):
+        """Пишет во все копии содержимое уже записанного файла (когда источник читался другим способом)"""
+        with open(path, 'rb') as src:
+            while any(writer['error'] is None for writer in self.writers.values()):
+                chunk = src.read(COPY_CHUNK_SIZE)
+                if not chunk:
+                    break
+                self.write(chunk)
+                # Чтение готового файла быстрее записи: ждем очереди, чтобы копии не отключились
+                for writer in self.writers.values():
+                    if writer['thread'] is not None:
+                        writer['queue'].join()
+
+    def close(self):
+        """Дожидается записи всех копий и закрывает их"""
+        for writer in self.writers.values():
+            if writer['thread'] is not None:
+                writer['queue'].put(None)
+        for path, writer in self.writers.items():
+            if writer['thread'] is not None:
+                writer['thread'].join()
+            try:
+                os.close(writer['fd'])
+            except OSError as e:
+                # Сетевые файловые системы сообщают об ошибке отложенной записи при закрытии
+                if writer['error'] is None:
+                    writer['error'] = e
+            if writer['error'] is not None:
+                self.errors[path] = writer['error']
+        self.writers = {}
+
+
+def copy_sparse_file(source_path, dest_path, throttle=None, chunk_size=COPY_CHUNK_SIZE, copy_metadata=True,
+                     extra=None, source_stats=None):
+    """Копирует только области данных через SEEK_DATA/SEEK_HOLE, дыры остаются дырами.
+
+    Возвращает количество байт в дырах, которые не пришлось читать и писать.
+    throttle, если задан, вызывается с размером каждого скопированного блока.
+    Без copy_metadata метаданные переносит вызывающий код. extra (ExtraCopies)
+    получает те же данные по тем же смещениям. source_stats, если задан
+    (список), получает fstat источника до чтения и после него.
+    """
+    with open(source_path, 'rb') as src, open(dest_path, 'wb') as dst:
+        src_fd = src.fileno()
+        dst_fd = dst.fileno()
+        stat_before = os.fstat(src_fd)
+        if source_stats is not None:
+            source_stats.append(stat_before)
+        size = stat_before.st_size
+        offset = 0
+        data_bytes = 0
+        while offset < size:
+            try:
+                data_start = os.lseek(src_fd, offset, os.SEEK_DATA)
+            except OSError as e:
+                if e.errno == errno.ENXIO:
+                    # Дальше до конца файла только дыра
+                    break
+                raise
+            data_end = os.lseek(src_fd, data_start, os.SEEK_HOLE)
+            position = data_start
+            while position < data_end:
+                chunk = os.pread(src_fd, min(chunk_size, data_end - position), position)
+                if not chunk:
+                    break
+                os.pwrite(dst_fd, chunk, position)
+                if extra is not None:
+                    extra.write(chunk, position)
+                position += len(chunk)
+                if throttle is not None:
+                    throttle(len(chunk))
+            data_bytes += position - data_start
+            offset = data_end
+        # Размер задается без записи нулей, хвостовая дыра сохраняется
+        os.ftruncate(dst_fd, size)
+        if extra is not None:
+            extra.apply(os.ftruncate, size)
+        if source_stats is not None:
+            source_stats.append(os.fstat(src_fd))
+    if copy_metadata:
+        shutil.copystat(source_path, dest_path)
+    return size - data_bytes
+
+
+def load_sync_file_range():
+    """sync_file_range из libc для фоновой записи диапазона файла, None - если недоступно"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        function = libc.sync_file_range
+    except (OSError, AttributeError):
+        return None
+    function.argtypes = [ctypes.c_int, ctypes.c_int64, ctypes.c_int64, ctypes.c_uint]
+    return function
+
+
+sync_file_range = load_sync_file_range()
+SYNC_FILE_RANGE_WRITE = 2
+
+
+def load_syncfs():
+    """syncfs из libc: сброс на диск всей файловой системы по дескриптору, None - если недоступно"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        function = libc.syncfs
+    except (OSError, AttributeError):
+        return None
+    function.argtypes = [ctypes.c_int]
+
+    def syncfs(fd):
+        if function(fd) != 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+    return syncfs
+
+
+syncfs = load_syncfs()
+
+
+def fsync_path(path):
+    """Сбрасывает на диск файл или папку по пути"""
+    # В Windows FlushFileBuffers требует открытия на запись
+    fd = os.open(path, os.O_RDWR if os.name == 'nt' else os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def map_in_threads(function, items, workers, pool=None):
+    """Вызывает function для элементов, поделив их между потоками; возвращает [(элемент, OSError)].
+
+    pool - готовый пул не меньше чем из workers потоков, без него пул создается на время вызова.
+    """
+    def run_part(part):
+        failed = []
+        for item in part:
+            try:
+                function(item)
+            except OSError as e:
+                failed.append((item, e))
+        return failed
+
+    if not items:
+        return []
+    step = -(-len(items) // workers)
+    parts = [items[start:start + step] for start in range(0, len(items), step)]
+    if pool is not None:
+        return [result for part_failed in pool.map(run_part, parts) for result in part_failed]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        return [result for part_failed in pool.map(run_part, parts) for result in part_failed]
+
+
+def copy_file_cache_friendly(source_path, dest_path, direct_io_threshold=0, throttle=None,
+                             chunk_size=COPY_CHUNK_SIZE, copy_metadata=True, extra=None, source_stats=None):
+    """Копирует файл, не вытесняя из кэша страницы других программ.
+
+    Чтение идет с POSIX_FADV_SEQUENTIAL, место под копию предвыделяется
+    posix_fallocate, уже обработанные страницы источника и копии сбрасываются
+    через POSIX_FADV_DONTNEED. Файлы не меньше direct_io_threshold (если он
+    задан) читаются и пишутся с O_DIRECT мимо кэша. throttle, если задан,
+    вызывается с размером каждого скопированного блока. Без copy_metadata
+    метаданные переносит вызывающий код. extra (ExtraCopies) получает те же
+    блоки; с дополнительными копиями O_DIRECT не используется. source_stats,
+    если задан (список), получает fstat источника до чтения и после него.
+    """
+    src_fd = os.open(source_path, os.O_RDONLY)
+    dst_fd = None
+    try:
+        stat_before = os.fstat(src_fd)
+        if source_stats is not None:
+            source_stats.append(stat_before)
+        size = stat_before.st_size
+        direct = (bool(direct_io_threshold) and size >= direct_io_threshold and extra is None
+                  and hasattr(os, 'O_DIRECT') and fcntl is not None)
+        if direct:
+            try:
+                dst_fd = os.open(dest_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_DIRECT, 0o666)
+                fcntl.fcntl(src_fd, fcntl.F_SETFL, fcntl.fcntl(src_fd, fcntl.F_GETFL) | os.O_DIRECT)
+            except OSError:
+                # Файловая система не поддерживает O_DIRECT (например, tmpfs)
+                if dst_fd is not None:
+                    os.close(dst_fd)
+                    dst_fd = None
+                direct = False
+        if dst_fd is None:
+            dst_fd = os.open(dest_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+
+        def preallocate(fd):
+            try:
+                os.posix_fallocate(fd, 0, size)
+            except OSError:
+                pass
+
+        def drop_written(fd, start, end):
+            if sync_file_range is not None:
+                sync_file_range(fd, start, end - start, SYNC_FILE_RANGE_WRITE)
+            # Страницы предыдущего окна уже ушли на запись и могут быть освобождены
+            os.posix_fadvise(fd, 0, start, os.POSIX_FADV_DONTNEED)
+
+        if size > 0:
+            preallocate(dst_fd)
+            if extra is not None:
+                extra.apply(preallocate)
+        if not direct:
+            os.posix_fadvise(src_fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+        # Буфер из mmap выровнен по странице, как требует O_DIRECT
+        buffer = mmap.mmap(-1, chunk_size)
+        try:
+            view = memoryview(buffer)
+            offset = 0
+            dropped = 0
+            while True:
+                count = os.readv(src_fd, [buffer])
+                if count <= 0:
+                    break
+                if direct and count % mmap.PAGESIZE:
+                    # Хвост не кратен блоку: дописываем его без O_DIRECT
+                    fcntl.fcntl(dst_fd, fcntl.F_SETFL, fcntl.fcntl(dst_fd, fcntl.F_GETFL) & ~os.O_DIRECT)
+                    direct = False
+                written = 0
+                while written < count:
+                    written += os.write(dst_fd, view[written:count])
+                if extra is not None:
+                    extra.write(view[:count])
+                offset += count
+                if throttle is not None:
+                    throttle(count)
+
+                if not direct and offset - dropped >= CACHE_DROP_WINDOW:
+                    os.posix_fadvise(src_fd, dropped, offset - dropped, os.POSIX_FADV_DONTNEED)
+                    drop_written(dst_fd, dropped, offset)
+                    if extra is not None:
+                        extra.apply(drop_written, dropped, offset)
+                    dropped = offset
+            view.release()
+        finally:
+            buffer.close()
+
+        os.ftruncate(dst_fd, offset)
+        if extra is not None:
+            extra.apply(os.ftruncate, offset)
+        if not direct:
+            os.posix_fadvise(src_fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        if source_stats is not None:
+            source_stats.append(os.fstat(src_fd))
+    finally:
+        os.close(src_fd)
+        if dst_fd is not None:
+            os.close(dst_fd)
+    if copy_metadata:
+        shutil.copystat(source_path, dest_path)
+
+
+def nearest_existing_path(path):
+    """Сам путь или ближайший существующий родитель (папка назначения может быть еще не создана)"""
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+
+def get_free_space(path):
+    """Доступное пользователю место на файловой системе пути в байтах, OSError - не удалось узнать"""
+    path = nearest_existing_path(path)
+    if hasattr(os, 'statvfs'):
+        stat_result = os.statvfs(path)
+        return stat_result.f_bavail * stat_result.f_frsize
+    import ctypes
+    free_bytes = ctypes.c_ulonglong(0)
+    if not ctypes.windll.kernel32.GetDiskFreeSpaceExW(
+        ctypes.c_wchar_p(path), None, None, ctypes.pointer(free_bytes)
+    ):
+        raise ctypes.WinError()
+    return free_bytes.value
+
+
+def path_hash(path):
+    """64-битный хеш пути для сравнения манифестов"""
+    return int.from_bytes(hashlib.blake2b(os.fsencode(path), digest_size=8).digest(), 'little')
+
+
+def read_sqlite_version(path):
+    """Версия содержимого базы SQLite по заголовкам базы и WAL, None - файл не база SQLite.
+
+    PRAGMA data_version сравнима только в пределах одного соединения, поэтому
+    между запусками используются счетчик изменений и число страниц из заголовка
+    базы и размер, номер контрольной точки и соли из заголовка WAL.
+    """
+    with open(path, 'rb') as f:
+        header = f.read(100)
+        size = os.fstat(f.fileno()).st_size
+    if len(header) < 100 or not header.startswith(SQLITE_HEADER):
+        return None
+    version = [int.from_bytes(header[24:28], 'big'), int.from_bytes(header[28:32], 'big'), size]
+    try:
+        with open(path + '-wal', 'rb') as f:
+            wal_header = f.read(32)
+            version.append(os.fstat(f.fileno()).st_size)
+        if len(wal_header) == 32:
+            version.extend(int.from_bytes(wal_header[start:start + 4], 'big') for start in (12, 16, 20))
+    except FileNotFoundError:
+        pass
+    return tuple(version)
+
+
+def load_sqlite_versions(path):
+    """Версии баз SQLite прошлого запуска: хеш пути -> версия"""
+    versions = {}
+    try:
+        with open(path, 'r', encoding='ascii') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) > 1:
+                    versions[int(fields[0])] = tuple(int(field) for field in fields[1:])
+    except (OSError, ValueError):
+        return {}
+    return versions
+
+
+def save_sqlite_versions(path, versions, durable=False):
+    """Сохраняет версии баз SQLite через временный файл"""
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w', encoding='ascii') as f:
+        for hash_value, version in versions.items():
+            f.write(" ".join(str(value) for value in (hash_value,) + version) + "\n")
+        if durable:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def hash_order(hashes):
+    """Номера элементов колонки по возрастанию значений, равные - по номеру.
+
+    С NumPy - устойчивый argsort. Без него колонка сортируется отрезками по
+    SNAPSHOT_SORT_RUN номеров, которые сливаются через heapq.merge, поэтому
+    в памяти нет списка на все записи.
+    """
+    if numpy is not None:
+        return numpy.argsort(numpy.frombuffer(hashes, dtype=hashes.typecode), kind='stable')
+    runs = [array('Q', sorted(range(start, min(start + SNAPSHOT_SORT_RUN, len(hashes))), key=hashes.__getitem__))
+            for start in range(0, len(hashes), SNAPSHOT_SORT_RUN)]
+    return heapq.merge(*runs, key=hashes.__getitem__)
+
+
+class ManifestSnapshot:
+    """Снимок манифеста вкладки, отсортированный по хешу пути.
+
+    Колонки - массивы, совместимые с NumPy (буферный протокол), поэтому
+    сравнение запусков выполняется векторно, если NumPy установлен.
+    Колонка entries (номера записей манифеста) на диск не сохраняется, как и
+    duplicates: позиция -> остальные записи того же пути (его находят
+    несколько корней вкладки, например папка и вложенная в нее папка).
+    """
+
+    COLUMNS = (('hashes', 'Q'), ('sizes', 'Q'), ('mtimes', 'q'), ('inodes', 'Q'))
+    MAGIC = b'BKMANIF1'
+
+    def __init__(self):
+        self.columns = {name: array(code) for name, code in self.COLUMNS}
+        self.entries = array('Q')
+        self.duplicates = {}
+
+    def __len__(self):
+        return len(self.columns['hashes'])
+
+    @classmethod
+    def from_manifest(cls, scanner, excluded=()):
+        """Строит снимки всех вкладок из манифеста текущего сканирования за один проход.
+
+        Записи сразу складываются в колонки (40 байт на запись), затем
+        колонки переставляются по порядку хешей.
+        """
+        manifest = scanner.manifest
+        unsorted = [cls() for _ in scanner.tab_sizes]
+        excluded_hashes = [set() for _ in scanner.tab_sizes]
+        for entry in range(manifest.count):
+            root_index, rel_path, size, mtime_ns, dev, inode, kind = manifest.get(entry)
+            root = scanner.roots[root_index]
+            source_path = root['path'] if root['kind'] == 'file' else os.path.join(root['path'], rel_path)
+            if entry in excluded:
+                # Путь, хотя бы одна копия которого не удалась, в снимок не попадает
+                excluded_hashes[root['tab']].add(path_hash(source_path))
+                continue
+            snapshot = unsorted[root['tab']]
+            columns = snapshot.columns
+            columns['hashes'].append(path_hash(source_path))
+            columns['sizes'].append(size)
+            columns['mtimes'].append(mtime_ns)
+            columns['inodes'].append(inode)
+            snapshot.entries.append(entry)
+        return [snapshot.sorted_by_hash(tab_excluded)
+                for snapshot, tab_excluded in zip(unsorted, excluded_hashes)]
+
+    def sorted_by_hash(self, excluded=()):
+        """Возвращает снимок из тех же строк, отсортированный по хешу пути, без путей из excluded"""
+        snapshot = type(self)()
+        columns = snapshot.columns
+        hashes = self.columns['hashes']
+        last_hash = None
+        for index in hash_order(hashes):
+            row_hash = hashes[index]
+            if row_hash in excluded:
+                continue
+            # Один и тот же путь из пересекающихся источников - одна строка со всеми записями
+            if row_hash == last_hash:
+                snapshot.duplicates.setdefault(len(snapshot) - 1, []).append(self.entries[index])
+                continue
+            last_hash = row_hash
+            for name, column in columns.items():
+                column.append(self.columns[name][index])
+            snapshot.entries.append(self.entries[index])
+        return snapshot
+
+    @classmethod
+    def load(cls, path):
+        """Загружает снимок с диска, None - если его нет или он поврежден"""
+        snapshot = cls()
+        try:
+            with open(path, 'rb') as f:
+                if f.read(len(cls.MAGIC)) != cls.MAGIC:
+                    return None
+                count = int.from_bytes(f.read(8), 'little')
+                for name, code in cls.COLUMNS:
+                    snapshot.columns[name].fromfile(f, count)
+        except (OSError, EOFError):
+            return None
+        return snapshot
+
+    def save(self, path, durable=False):
+        """Сохраняет снимок на диск через временный файл; durable - со сбросом на диск до замены"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(self.MAGIC)
+            f.write(len(self).to_bytes(8, 'little'))
+            for name, code in self.COLUMNS:
+                self.columns[name].tofile(f)
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_path, path)
+
+    def lookup(self, hash_value):
+        """Позиция записи с данным хешем пути или -1"""
+        hashes = self.columns['hashes']
+        position = bisect.bisect_left(hashes, hash_value)
+        if position < len(hashes) and hashes[position] == hash_value:
+            return position
+        return -1
+
+    def is_unchanged(self, hash_value, size, mtime_ns):
+        """Совпадают ли размер и время изменения файла с прошлым снимком"""
+        position = self.lookup(hash_value)
+        return (position >= 0 and self.columns['sizes'][position] == size
+                and self.columns['mtimes'][position] == mtime_ns)
+
+    def diff(self, previous):
+        """Сравнивает снимок с прошлым, возвращает ManifestDiff"""
+        if numpy is not None:
+            return self.diff_vectorized(previous)
+        return self.diff_merge(previous)
+
+    def diff_vectorized(self, previous):
+        """Сравнение отсортированных колонок средствами NumPy"""
+        new = {name: numpy.frombuffer(column, dtype=column.typecode) for name, column in self.columns.items()}
+        old = {name: numpy.frombuffer(column, dtype=column.typecode) for name, column in previous.columns.items()}
+
+        common, old_idx, new_idx = numpy.intersect1d(
+            old['hashes'], new['hashes'], assume_unique=True, return_indices=True
+        )
+        modified = ((old['sizes'][old_idx] != new['sizes'][new_idx])
+                    | (old['mtimes'][old_idx] != new['mtimes'][new_idx]))
+        changed = new_idx[modified]
+
+        added_mask = numpy.ones(len(self), dtype=bool)
+        added_mask[new_idx] = False
+        deleted_mask = numpy.ones(len(previous), dtype=bool)
+        deleted_mask[old_idx] = False
+        added = numpy.flatnonzero(added_mask)
+        deleted = numpy.flatnonzero(deleted_mask)
+
+        # Перемещение: удаленная и новая запись с тем же ключом (inode, размер, mtime).
+        # Как и при слиянии, из повторяющихся ключей в паре участвуют первые записи
+        _, del_pos, add_pos = numpy.intersect1d(
+            self.move_keys(old, deleted), self.move_keys(new, added), return_indices=True
+        )
+        moved_old = deleted[del_pos]
+        moved_new = added[add_pos]
+        added = numpy.setdiff1d(added, moved_new, assume_unique=True)
+        deleted = numpy.setdiff1d(deleted, moved_old, assume_unique=True)
+
+        return ManifestDiff(self, previous, added.tolist(), changed.tolist(),
+                            deleted.tolist(), list(zip(moved_old.tolist(), moved_new.tolist())))
+
+    @staticmethod
+    def move_keys(columns, positions):
+        """Ключи перемещения (inode, размер, mtime) строк positions одним массивом NumPy"""
+        keys = numpy.empty(len(positions), dtype=[('inodes', '<u8'), ('sizes', '<u8'), ('mtimes', '<i8')])
+        for name in keys.dtype.names:
+            keys[name] = columns[name][positions]
+        return keys
+
+    def diff_merge(self, previous):
+        """Сравнение отсортированных колонок слиянием, если NumPy недоступен"""
+        new_hashes = self.columns['hashes']
+        old_hashes = previous.columns['hashes']
+        added, changed, deleted = [], [], []
+        i = j = 0
+        while i < len(old_hashes) and j < len(new_hashes):
+            if old_hashes[i] == new_hashes[j]:
+                if (previous.columns['sizes'][i] != self.columns['sizes'][j]
+                        or previous.columns['mtimes'][i] != self.columns['mtimes'][j]):
+                    changed.append(j)
+                i += 1
+                j += 1
+            elif old_hashes[i] < new_hashes[j]:
+                deleted.append(i)
+                i += 1
+            else:
+                added.append(j)
+                j += 1
+        deleted.extend(range(i, len(old_hashes)))
+        added.extend(range(j, len(new_hashes)))
+
+        deleted_by_inode = {}
+        for position in deleted:
+            key = (previous.columns['inodes'][position], previous.columns['sizes'][position],
+                   previous.columns['mtimes'][position])
+            deleted_by_inode.setdefault(key, position)
+        moved = []
+        for position in added:
+            key = (self.columns['inodes'][position], self.columns['sizes'][position],
+                   self.columns['mtimes'][position])
+            old_position = deleted_by_inode.pop(key, None)
+            if old_position is not None:
+                moved.append((old_position, position))
+        moved_old = {pair[0] for pair in moved}
+        moved_new = {pair[1] for pair in moved}
+        added = [position for position in added if position not in moved_new]
+        deleted = [position for position in deleted if position not in moved_old]
+        return ManifestDiff(self, previous, added, changed, deleted, moved)
+
+
+class ManifestDiff:
+    """Результат сравнения двух снимков: позиции новых, измененных, удаленных и перемещенных файлов"""
+
+    def __init__(self, current, previous, added, changed, deleted, moved):
+        self.current = current
+        self.previous = previous
+        self.added = added
+        self.changed = changed
+        self.deleted = deleted
+        self.moved = moved
+
+    def entries_to_copy(self):
+        """Номера записей манифеста, которые нужно скопировать при инкрементальном копировании"""
+        entries = self.current.entries
+        duplicates = self.current.duplicates
+        # Перемещенный файл в папке назначения под новым именем еще отсутствует
+        positions = self.added + self.changed + [pair[1] for pair in self.moved]
+        result = {entries[position] for position in positions}
+        for position in positions:
+            result.update(duplicates.get(position, ()))
+        return result
+
+    def summary(self):
+        """Краткое текстовое описание изменений"""
+        current_sizes = self.current.columns['sizes']
+        previous_sizes = self.previous.columns['sizes']
+        added_size = sum(current_sizes[position] for position in self.added)
+        changed_size = sum(current_sizes[position] for position in self.changed)
+        deleted_size = sum(previous_sizes[position] for position in self.deleted)
+        return (f"новых {len(self.added)} ({added_size/1024/1024:.1f} MB), "
+                f"изменённых {len(self.changed)} ({changed_size/1024/1024:.1f} MB), "
+                f"удалённых {len(self.deleted)} ({deleted_size/1024/1024:.1f} MB), "
+                f"перемещённых {len(self.moved)}")
+
+
+class BackupScanner(threading.Thread):
+    """Сканирует источники вкладок и передает найденные файлы на копирование по мере обнаружения"""
+
+    def __init__(self, tabs, manifest, symlink_policy=SYMLINK_FOLLOW):
+        super().__init__(daemon=True)
+        # Плоский список корней: папки и отдельные файлы всех вкладок по порядку
+        self.roots = []
+        for tab_index, tab in enumerate(tabs):
+            for folder_path in tab['folders']:
+                self.roots.append({'tab': tab_index, 'kind': 'folder', 'path': folder_path})
+            for file_path in tab['files']:
+                self.roots.append({'tab': tab_index, 'kind': 'file', 'path': file_path})
+        self.manifest = manifest
+        self.symlink_policy = symlink_policy
+        self.skipped_cycles = 0
+        self.skipped_symlinks = 0
+        self.duplicate_roots = 0
+        self.shared_roots = 0
+        self.shared_size = 0
+        self.plan_overlaps()
+        self.entries = queue.Queue(maxsize=SCAN_QUEUE_SIZE)
+        self.tab_sizes = [0] * len(tabs)
+        # Место, которое займут копии вкладки: без дыр разреженных файлов и повторных жестких ссылок
+        self.tab_allocated = [0] * len(tabs)
+        self.linked_inodes = set()
+        self.scanned_size = 0
+        self.scanned_count = 0
+        self.completed = False
         self.cancelled = False
-        self.total_size = 0
+        # Снятое событие приостанавливает обход до возобновления
+        self.resumed = threading.Event()
+        self.resumed.set()
 
     def cancel(self):
         self.cancelled = True
+        self.resumed.set()
+
+    def pause(self):
+        self.resumed.clear()
+
+    def resume(self):
+        self.resumed.set()
 
     def run(self):
         try:
-            if self.total_size == 0:
-                self.total_size = self.calculate_total_backup_size()
-            
-            if self.total_size == 0:
-                self.finished_signal.emit(False, "Нет файлов для копирования")
-                return
-                
-            self.status_updated.emit(f"Начинаем копирование ({self.total_size/1024/1024:.1f} MB)")
-            
-            success, message = self.perform_backup_safe()
-            self.finished_signal.emit(success, message)
-            
-        except Exception as e:
-            self.finished_signal.emit(False, f"Ошибка: {str(e)}")
+            for entry in self.scan():
+                if not self.put(entry):
+                    return
+        finally:
+            self.completed = True
+            self.put(None)
 
-    def calculate_total_backup_size(self):
-        total_size = 0
-        for folder_path in self.source_folders:
-            if os.path.isdir(folder_path) and not self.cancelled:
+    def put(self, entry):
+        """Кладет запись в очередь, не блокируясь навсегда при отмене"""
+        while not self.cancelled:
+            try:
+                self.entries.put(entry, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def plan_overlaps(self):
+        """Находит повторяющиеся и вложенные источники по realpath и (st_dev, st_ino).
+
+        Повтор источника в той же вкладке отбрасывается. Источник внутри другой
+        папки-источника (или совпадающий с источником другой вкладки) отдельно
+        не обходится: его записи выдаются при обходе внешней папки сразу после
+        ее собственных, и общий файл копируется во все места назначения за одно чтение.
+        """
+        roots = []
+        seen = set()
+        for root in self.roots:
+            root['real'] = os.path.normcase(os.path.realpath(root['path']))
+            try:
+                stat_result = os.stat(root['path'])
+                root['identity'] = (stat_result.st_dev, stat_result.st_ino)
+            except OSError:
+                root['identity'] = None
+            key = (root['tab'], root['kind'], root['identity'] or root['real'])
+            if key in seen:
+                self.duplicate_roots += 1
+                continue
+            seen.add(key)
+            root['aliases'] = []
+            roots.append(root)
+        self.roots = roots
+
+        candidates = [index for index, root in enumerate(roots) if root['identity'] is not None]
+        for index in candidates:
+            root = roots[index]
+            best = None
+            for outer_index in candidates:
+                outer = roots[outer_index]
+                if outer_index == index:
+                    continue
+                same = outer['identity'] == root['identity'] or outer['real'] == root['real']
+                if same and outer['kind'] == root['kind'] and outer_index < index:
+                    rel_path = ''
+                elif (outer['kind'] == 'folder' and not same
+                      and root['real'].startswith(outer['real'].rstrip(os.sep) + os.sep)):
+                    rel_path = os.path.relpath(root['real'], outer['real'])
+                else:
+                    continue
+                if best is None or (len(outer['real']), outer_index) < (len(roots[best[0]]['real']), best[0]):
+                    best = (outer_index, rel_path)
+            if best is not None:
+                root['alias_of'], root['alias_rel'] = best
+
+        for index, root in enumerate(roots):
+            if 'alias_of' not in root:
+                continue
+            # Цепочка вложенности сводится к самому внешнему обходимому источнику
+            outer_index, rel_path = root['alias_of'], root['alias_rel']
+            while 'alias_of' in roots[outer_index]:
+                outer = roots[outer_index]
+                rel_path = os.path.join(outer['alias_rel'], rel_path) if rel_path else outer['alias_rel']
+                outer_index = outer['alias_of']
+            root['alias_of'], root['alias_rel'] = outer_index, rel_path
+            roots[outer_index]['aliases'].append(index)
+            self.shared_roots += 1
+
+    def scan(self):
+        """Заполняет манифест и выдает номера записей: файл - n, папка - -(n + 1)"""
+        for root_index, root in enumerate(self.roots):
+            self.resumed.wait()
+            if self.cancelled:
+                return
+            if 'alias_of' in root:
+                # Записи вложенного источника выдаются при обходе внешнего
+                continue
+            if root['kind'] == 'file':
+                yield from self.scan_file(root_index, root)
+                continue
+
+            if not os.path.isdir(root['path']):
+                continue
+            reached = set()
+            yield from self.walk_folder(root_index, root, reached)
+            for alias_index in root['aliases']:
+                if alias_index not in reached and not self.cancelled:
+                    # Обход внешней папки не дошел до вложенной (нет доступа, ссылка): обходим ее отдельно
+                    alias = dict(self.roots[alias_index], aliases=[])
+                    if alias['kind'] == 'file':
+                        yield from self.scan_file(alias_index, alias)
+                    elif os.path.isdir(alias['path']):
+                        yield from self.walk_folder(alias_index, alias)
+
+    def scan_file(self, root_index, root):
+        """Запись отдельного файла-источника и тех же файлов в других вкладках"""
+        path = root['path']
+        if not os.path.isfile(path):
+            return
+        try:
+            stat_result = os.stat(path)
+        except OSError:
+            return
+        self.account(root, stat_result)
+        yield self.manifest.add_file(root_index, '', os.path.basename(path), stat_result)
+        for alias_index in root['aliases']:
+            alias = self.roots[alias_index]
+            self.account(alias, stat_result, shared=True)
+            yield self.manifest.add_file(alias_index, '', os.path.basename(alias['path']), stat_result)
+
+    def walk_folder(self, root_index, root, reached=None):
+        """Итеративный обход папки с явным стеком и защитой от циклов по (st_dev, st_ino).
+
+        Для каждого элемента используется один stat из записи scandir, тип
+        элемента берется из scandir без дополнительных системных вызовов.
+        Записи вложенных источников (root['aliases']) выдаются следом за
+        записями обходимой папки, в reached попадают достигнутые источники.
+        """
+        path = root['path']
+        try:
+            root_stat = os.stat(path)
+        except OSError:
+            return
+        visited = {(root_stat.st_dev, root_stat.st_ino)}
+        folder_aliases = {}
+        file_aliases = {}
+        for alias_index in root['aliases']:
+            alias = self.roots[alias_index]
+            target = folder_aliases if alias['kind'] == 'folder' else file_aliases
+            target.setdefault(alias['alias_rel'], []).append(alias_index)
+        yield -(self.manifest.add_dir(root_index, '') + 1)
+        yield from self.emit_alias_dirs(folder_aliases.get('', ()), reached)
+
+        stack = ['']
+        while stack:
+            self.resumed.wait()
+            rel_dir = stack.pop()
+            try:
+                with os.scandir(os.path.join(path, rel_dir)) as it:
+                    dir_entries = list(it)
+            except OSError:
+                continue
+            # Вложенные источники, внутри которых лежит эта папка: (номер, путь папки внутри источника)
+            inside = []
+            for alias_rel, alias_indexes in folder_aliases.items():
+                if not alias_rel or rel_dir == alias_rel or rel_dir.startswith(alias_rel + os.sep):
+                    alias_dir = os.path.relpath(rel_dir, alias_rel) if alias_rel else rel_dir
+                    if alias_dir == os.curdir:
+                        alias_dir = ''
+                    inside.extend((alias_index, alias_dir) for alias_index in alias_indexes)
+
+            subdirs = []
+            for dir_entry in dir_entries:
+                if self.cancelled:
+                    return
                 try:
-                    for root, dirs, files in os.walk(folder_path):
-                        for file in files:
-                            if self.cancelled:
-                                return total_size
-                            file_path = os.path.join(root, file)
-                            if os.path.exists(file_path):
-                                total_size += os.path.getsize(file_path)
+                    if dir_entry.is_symlink():
+                        if self.symlink_policy == SYMLINK_SKIP:
+                            self.skipped_symlinks += 1
+                            continue
+                        if self.symlink_policy == SYMLINK_PRESERVE:
+                            stat_result = dir_entry.stat(follow_symlinks=False)
+                            yield self.manifest.add_file(root_index, rel_dir, dir_entry.name,
+                                                         stat_result, ENTRY_SYMLINK)
+                            for alias_index, alias_dir in inside:
+                                yield self.manifest.add_file(alias_index, alias_dir, dir_entry.name,
+                                                             stat_result, ENTRY_SYMLINK)
+                            continue
+                        stat_result = dir_entry.stat()
+                    else:
+                        stat_result = dir_entry.stat(follow_symlinks=False)
                 except OSError:
+                    # Битая ссылка или элемент, исчезнувший во время сканирования
                     continue
-        
-        for file_path in self.source_files:
-            if not self.cancelled and os.path.isfile(file_path) and os.path.exists(file_path):
-                total_size += os.path.getsize(file_path)
-        
-        return total_size
-
-    def perform_backup_safe(self):
-        """БЕЗОПАСНОЕ выполнение резервного копирования БЕЗ удаления каких-либо файлов"""
-        if self.cancelled:
-            return False, "Операция отменена"
 
+                if stat.S_ISDIR(stat_result.st_mode):
+                    key = (stat_result.st_dev, stat_result.st_ino)
+                    if key in visited:
+                        self.skipped_cycles += 1
+                        continue
+                    visited.add(key)
+                    rel_path = os.path.join(rel_dir, dir_entry.name)
+                    yield -(self.manifest.add_dir(root_index, rel_path) + 1)
+                    for alias_index, alias_dir in inside:
+                        yield -(self.manifest.add_dir(alias_index, os.path.join(alias_dir, dir_entry.name)) + 1)
+                    if folder_aliases:
+                        yield from self.emit_alias_dirs(folder_aliases.get(rel_path, ()), reached)
+                    subdirs.append(rel_path)
+                elif stat.S_ISREG(stat_result.st_mode):
+                    self.account(root, stat_result)
+                    yield self.manifest.add_file(root_index, rel_dir, dir_entry.name, stat_result)
+                    for alias_index, alias_dir in inside:
+                        self.account(self.roots[alias_index], stat_result, shared=True)
+                        yield self.manifest.add_file(alias_index, alias_dir, dir_entry.name, stat_result)
+                    if file_aliases:
+                        for alias_index in file_aliases.get(os.path.join(rel_dir, dir_entry.name), ()):
+                            alias = self.roots[alias_index]
+                            self.account(alias, stat_result, shared=True)
+                            if reached is not None:
+                                reached.add(alias_index)
+                            yield self.manifest.add_file(alias_index, '', os.path.basename(alias['path']),
+                                                         stat_result)
+
+            # Обратный порядок сохраняет обход папок в порядке их перечисления
+            stack.extend(reversed(subdirs))
+
+    def emit_alias_dirs(self, alias_indexes, reached):
+        """Корневые записи вложенных источников, до которых дошел обход внешней папки"""
+        for alias_index in alias_indexes:
+            if reached is not None:
+                reached.add(alias_index)
+            yield -(self.manifest.add_dir(alias_index, '') + 1)
+
+    def account(self, root, stat_result, shared=False):
+        """Учитывает найденный файл в общем и повкладочном размере и в месте для копий вкладки"""
+        size = stat_result.st_size
+        self.scanned_size += size
+        self.scanned_count += 1
+        self.tab_sizes[root['tab']] += size
+        if shared:
+            self.shared_size += size
+        if stat_result.st_nlink > 1:
+            # Остальные жесткие ссылки на те же данные воссоздаются ссылками (link_hardlinked)
+            key = (root['tab'], stat_result.st_dev, stat_result.st_ino)
+            if key in self.linked_inodes:
+                return
+            self.linked_inodes.add(key)
+        self.tab_allocated[root['tab']] += allocated_size(stat_result)
+
+
+class LoadMonitor:
+    """Следит за загрузкой системы: средняя нагрузка на ядро и очередь запросов к дискам.
+
+    Коэффициент скорости уменьшается вдвое, пока система занята, и плавно
+    возвращается к 1.0, когда она простаивает.
+    """
+
+    SAMPLE_INTERVAL = 2.0
+    MIN_FACTOR = 0.05
+
+    def __init__(self, load_threshold=1.0, queue_threshold=8):
+        self.load_threshold = load_threshold
+        self.queue_threshold = queue_threshold
+        self.factor = 1.0
+        self.last_sample = 0.0
+        self.lock = threading.Lock()
+
+    def sample(self):
+        """Текущий коэффициент скорости от MIN_FACTOR до 1.0"""
+        with self.lock:
+            now = time.monotonic()
+            if now - self.last_sample < self.SAMPLE_INTERVAL:
+                return self.factor
+            self.last_sample = now
+
+            load = self.system_load()
+            queue_depth = self.disk_queue_depth()
+            busy = ((load is not None and load > self.load_threshold)
+                    or (queue_depth is not None and queue_depth > self.queue_threshold))
+            idle = ((load is None or load < self.load_threshold / 2)
+                    and (queue_depth is None or queue_depth <= 1))
+            if busy:
+                self.factor = max(self.MIN_FACTOR, self.factor / 2)
+            elif idle:
+                self.factor = min(1.0, self.factor * 1.5)
+            return self.factor
+
+    def system_load(self):
+        """Средняя нагрузка за минуту в пересчете на одно ядро, None - если недоступно"""
         try:
-            if not self.check_disk_space(self.total_size):
-                return False, "Недостаточно свободного места"
-
-            actual_destination = self.destination_folder
-            if self.create_backup_folder:
-                current_date = datetime.now().strftime("%d-%m-%Y")
-                backup_folder_name = f"Резервное копирование {current_date}"
-                actual_destination = os.path.join(self.destination_folder, backup_folder_name)
-                if not os.path.exists(actual_destination):
-                    os.makedirs(actual_destination)
+            return os.getloadavg()[0] / (os.cpu_count() or 1)
+        except (AttributeError, OSError):
+            return None
 
-            copied_count = 0
-            copied_size = 0
+    def disk_queue_depth(self):
+        """Число запросов ввода-вывода в работе по всем дискам из /proc/diskstats"""
+        try:
+            with open('/proc/diskstats') as f:
+                lines = f.readlines()
+        except OSError:
+            return None
+        in_progress = 0
+        for line in lines:
+            fields = line.split()
+            if len(fields) < 12:
+                continue
+            name = fields[2]
+            # Учитываем только целые устройства, без разделов и виртуальных дисков
+            if name.startswith(('loop', 'ram', 'zram')) or not os.path.exists(f"/sys/block/{name}"):
+                continue
+            in_progress += int(fields[11])
+        return in_progress
+
+
+class RateLimiter:
+    """Ограничитель скорости по схеме «ведро токенов»: байты и файлы в секунду.
+
+    Допускает долг: после крупного блока поток спит, пока долг не погасится.
+    В адаптивном режиме скорость умножается на коэффициент LoadMonitor,
+    а без заданного лимита замедление достигается паузами пропорционально
+    времени работы между вызовами.
+    """
+
+    def __init__(self, bytes_per_second=0, files_per_second=0, adaptive=False, monitor=None):
+        self.lock = threading.Lock()
+        self.monitor = monitor
+        self.configure(bytes_per_second, files_per_second, adaptive)
+
+    def configure(self, bytes_per_second=0, files_per_second=0, adaptive=False):
+        with self.lock:
+            self.bytes_per_second = bytes_per_second
+            self.files_per_second = files_per_second
+            self.adaptive = adaptive and self.monitor is not None
+            self.byte_tokens = float(bytes_per_second)
+            self.file_tokens = float(files_per_second)
+            self.last_refill = time.monotonic()
+            self.last_call = self.last_refill
+
+    def is_active(self):
+        return bool(self.bytes_per_second or self.files_per_second or self.adaptive)
+
+    def throttle(self, byte_count=0, file_count=0, cancelled=None):
+        """Списывает токены и при необходимости ждет, пока их хватит"""
+        factor = self.monitor.sample() if self.adaptive else 1.0
+        delay = 0.0
+        with self.lock:
+            now = time.monotonic()
+            elapsed = now - self.last_refill
+            self.last_refill = now
+            if self.bytes_per_second:
+                rate = self.bytes_per_second * factor
+                self.byte_tokens = min(rate, self.byte_tokens + elapsed * rate) - byte_count
+                if self.byte_tokens < 0:
+                    delay = max(delay, -self.byte_tokens / rate)
+            if self.files_per_second:
+                rate = self.files_per_second * factor
+                self.file_tokens = min(rate, self.file_tokens + elapsed * rate) - file_count
+                if self.file_tokens < 0:
+                    delay = max(delay, -self.file_tokens / rate)
+            if factor < 1.0 and not self.bytes_per_second:
+                # Лимит не задан: растягиваем работу паузами
+                delay = max(delay, (now - self.last_call) * (1.0 / factor - 1.0))
+            self.last_call = now + delay
+        sleep_cancellable(delay, cancelled)
+
+
+class SourceChangedError(Exception):
+    """Размер или время изменения источника изменились, пока он копировался"""
+
+
+def transient_retry_limit(error):
+    """Сколько раз повторять файл с этой ошибкой: файл занят, заблокирован или сеть не ответила.
+
+    0 - ошибка постоянная, повторять не нужно.
+    """
+    if (getattr(error, 'winerror', None) in TRANSIENT_WINERRORS
+            or getattr(error, 'errno', None) in TRANSIENT_ERRNOS):
+        return FAILED_RETRY_ATTEMPTS
+    if getattr(error, 'errno', None) in ACCESS_ERRNOS:
+        return ACCESS_RETRY_ATTEMPTS
+    return 0
+
+
+def sleep_cancellable(delay, cancelled=None):
+    """Спит указанное время короткими отрезками, прерываясь при отмене"""
+    deadline = time.monotonic() + delay
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or (cancelled is not None and cancelled()):
+            return
+        time.sleep(min(remaining, 0.1))
+
+
+# Общий для всего процесса лимит скорости: действует на все запущенные копирования
+GLOBAL_RATE_LIMITER = RateLimiter(monitor=LoadMonitor())
+
+
+class BackupEngineMixin:
+    """Общая логика копирования для потоков резервного копирования.
+
+    Ожидает у класса-потока атрибуты copy_folder_contents, keep_history,
+    create_backup_folder, pipelined, cancelled и сигналы progress_updated,
+    status_updated, size_estimate_updated.
+    """
+
+    def init_engine(self, estimated_size=0, pipelined=True, manifest_dir=None, incremental=False,
+                    symlink_policy=SYMLINK_FOLLOW, cache_friendly_io=True, direct_io_threshold=0,
+                    rate_limiter=GLOBAL_RATE_LIMITER, device_aware=True, deferred_metadata=True,
+                    copy_xattrs=True, copy_acls=True, copy_directory_times=True, durability=DURABILITY_RUN,
+                    sqlite_backup=True, tee_buffer=TEE_BUFFER_SIZE, engine_cache=ENGINE_CACHE):
+        self.pipelined = pipelined
+        self.symlink_policy = symlink_policy
+        self.cache_friendly_io = cache_friendly_io
+        self.direct_io_threshold = direct_io_threshold
+        self.rate_limiter = rate_limiter
+        self.tab_rate_limiters = []
+        # Стратегии копирования по вкладкам и пулы потоков по числу потоков
+        self.device_aware = device_aware
+        self.tab_strategies = {}
+        self.strategy_report = []
+        # Пулы по числу потоков; при запуске через BackupEngineService они принадлежат потоку службы
+        self.copy_pools = {}
+        self.owns_copy_pools = True
+        self.copy_futures = set()
+        self.engine_cache = engine_cache
+        self.pending_destinations = set()
+        # Задания текущего пакета по (st_dev, st_ino): тот же файл из другого источника пишется вместе с ними
+        self.fanout_primaries = {}
+        self.tee_buffer = tee_buffer
+        self.extra_destination_tabs = set()
+        self.fiemap_unsupported = set()
+        # Созданные в этом запуске папки назначения и папки, которым нужно перенести метаданные
+        self.created_directories = set()
+        self.copied_directories = []
+        # Папки назначения вкладок: выше них created_directories не поднимается
+        self.destination_roots = set()
+        # Метаданные файлов: сразу после данных или отложенным пакетным проходом
+        self.deferred_metadata = deferred_metadata
+        self.copy_xattrs = copy_xattrs
+        self.copy_acls = copy_acls
+        self.copy_directory_times = copy_directory_times
+        self.pending_metadata = []
+        # Надежность записи: файлы, ждущие барьера, и вкладки, чья запись не подтверждена
+        self.durability = durability
+        self.unsynced_files = []
+        self.undurable_tabs = set()
+        self.durability_report = []
+        # Файлы, изменившиеся во время копирования: ждущие повтора и так и не скопированные согласованно
+        self.changed_tasks = []
+        self.inconsistent_files = []
+        # Временные ошибки: куча (срок повтора, номер, задание) и файлы, не скопированные после всех попыток
+        self.retry_queue = []
+        self.retry_counter = 0
+        self.failed_files = []
+        # Базы SQLite: признак базы по пути и версии баз вкладок прошлого и текущего запуска
+        self.sqlite_backup = sqlite_backup
+        self.sqlite_databases = {}
+        self.previous_sqlite_versions = []
+        self.sqlite_versions = []
+        self.copied_count = 0
+        self.copied_size = 0
+        self.stats_lock = threading.Lock()
+        self.estimated_size = estimated_size
+        self.manifest_dir = manifest_dir
+        self.incremental = incremental
+        self.previous_snapshots = []
+        self.change_diffs = None
+        self.copy_plan = {}
+        self.failed_entries = set()
+        self.change_report = []
+        # Первая копия каждого файла с несколькими жесткими ссылками: (st_dev, st_ino) -> путь
+        self.hardlink_targets = {}
+        self.total_size = estimated_size
+        self.total_exact = False
+        self.scanner = None
+        self.skipped_tabs = set()
+        self.stats = {}
+        # Свободное место по устройствам назначения: st_dev -> сведения последней проверки
+        self.device_space = {}
+        self.tab_devices = {}
+        # Сколько места уже отдано под копии вкладки и чьи жесткие ссылки уже учтены на устройстве
+        self.tab_space_used = {}
+        self.space_linked = set()
+        self.devices_recorded = False
+        self.space_checked = False
+        self.space_report = []
+        self.out_of_space = None
+        # Снятое событие приостанавливает копирование на границе блоков
+        self.resumed = threading.Event()
+        self.resumed.set()
+        # Устанавливается службой копирования, когда задание выполнено
+        self.done = threading.Event()
+
+    def use_thread_pools(self, pools):
+        """Берет пулы потоков, которые переживают задание (их хранит поток BackupEngineService)"""
+        self.copy_pools = pools
+        self.owns_copy_pools = False
+
+    def get_thread_pool(self, workers):
+        """Пул из workers потоков, созданный при первом обращении"""
+        pool = self.copy_pools.get(workers)
+        if pool is None:
+            pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+            self.copy_pools[workers] = pool
+        return pool
+
+    def metadata_pool(self):
+        """Пул для метаданных и сброса на диск: общий пул потока службы, иначе свой на каждый вызов"""
+        return None if self.owns_copy_pools else self.get_thread_pool(METADATA_WORKERS)
+
+    def wait(self, timeout=None):
+        """Ждет окончания задания, переданного службе копирования; timeout в мс, как у QThread.wait"""
+        return self.done.wait(None if timeout is None else timeout / 1000)
+
+    def pause(self):
+        """Приостанавливает копирование, открытые файлы и прогресс сохраняются"""
+        self.resumed.clear()
+        if self.scanner:
+            self.scanner.pause()
+
+    def resume(self):
+        """Продолжает приостановленное копирование с того же места"""
+        self.resumed.set()
+        if self.scanner:
+            self.scanner.resume()
+
+    def is_paused(self):
+        return not self.resumed.is_set()
+
+    def wait_if_paused(self):
+        """Ждет возобновления, пока копирование приостановлено и не отменено"""
+        if self.resumed.is_set():
+            return
+        started = time.monotonic()
+        while not self.resumed.wait(0.2):
+            if self.cancelled:
+                break
+        self.add_stat('paused_time', time.monotonic() - started)
+
+    def copy_tabs(self, tabs):
+        """Копирует источники всех вкладок, возвращает (количество файлов, размер)"""
+        tabs = self.expand_destinations(tabs)
+        manifest = ScanManifest(spill_dir=self.manifest_dir)
+        self.scanner = BackupScanner(tabs, manifest, self.symlink_policy)
+        if self.is_paused():
+            self.scanner.pause()
+        self.previous_snapshots = [self.load_previous_snapshot(tab) for tab in tabs]
+        self.previous_sqlite_versions = [
+            load_sqlite_versions(self.snapshot_path(tab) + ".sqlite") if self.manifest_dir else {} for tab in tabs
+        ]
+        self.sqlite_versions = [{} for tab in tabs]
+        self.tab_rate_limiters = [
+            RateLimiter(tab.get('rate_limit', 0), tab.get('files_rate_limit', 0)) for tab in tabs
+        ]
+        try:
+            result = self.copy_manifest_entries(tabs)
+            self.stats['copied_files'], self.stats['copied_bytes'] = result
+            # При нехватке места снимки не сохраняются: нескопированные файлы должны остаться новыми
+            if self.scanner.completed and not self.cancelled and not self.out_of_space:
+                self.finish_change_tracking(tabs)
+            return result
+        finally:
+            self.scanner.cancel()
+            self.stats['manifest_files'] = manifest.count
+            self.stats['manifest_dirs'] = len(manifest.dir_roots)
+            self.stats['manifest_memory'] = manifest.memory_usage()
+            self.stats['manifest_spilled'] = manifest.spilled_count
+            self.stats['peak_rss'] = get_peak_rss()
+            self.stats['skipped_cycles'] = self.scanner.skipped_cycles
+            self.stats['skipped_symlinks'] = self.scanner.skipped_symlinks
+            self.stats['duplicate_roots'] = self.scanner.duplicate_roots
+            self.stats['shared_roots'] = self.scanner.shared_roots
+            manifest.close()
+
+    def expand_destinations(self, tabs):
+        """Вкладка с дополнительными папками назначения копируется как несколько вкладок с общими источниками.
+
+        Копии для дополнительных папок добавляются после всех вкладок, номера
+        исходных вкладок не меняются. Общие источники читаются один раз
+        (BackupScanner.plan_overlaps), у каждой папки свои снимок, проверка места и сброс на диск.
+        """
+        expanded = list(tabs)
+        for tab in tabs:
+            for destination in tab.get('extra_destinations', ()):
+                expanded.append(dict(tab, destination=destination, extra_destinations=(),
+                                     name=f"{tab['name']} → {destination}"))
+        self.extra_destination_tabs = set(range(len(tabs), len(expanded)))
+        return expanded
+
+    def copy_manifest_entries(self, tabs):
+        """Копирует файлы и папки по мере появления их записей в манифесте.
+
+        Файлы копятся в пакеты по вкладке, пакет выполняется по стратегии
+        вкладки: в порядке inode или сканирования, в одном или нескольких потоках.
+        """
+        manifest = self.scanner.manifest
+        self.copied_count = 0
+        self.copied_size = 0
+        tab_destinations = {}
+        root_destinations = {}
+        # Папки создаются вместе с первым файлом, скопированным в них: (корень, путь) -> папка источника
+        deferred_directories = {}
+        batch = []
 
-            # Копируем папки (БЕЗОПАСНО)
-            for folder_path in self.source_folders:
-                if self.cancelled:
-                    return False, "Операция отменена"
-                    
-                if not os.path.exists(folder_path):
+        try:
+            for entry in self.iter_scan_entries():
+                if self.cancelled or self.out_of_space:
+                    break
+
+                is_dir = entry < 0
+                if is_dir:
+                    root_index, rel_path = manifest.get_dir(-entry - 1)
+                    size = 0
+                else:
+                    root_index, rel_path, size, mtime_ns, dev, inode, kind = manifest.get(entry)
+
+                if not self.devices_recorded:
+                    self.record_destination_devices(tabs)
+                    self.devices_recorded = True
+                if not self.space_checked and self.scanner.completed:
+                    # Без конвейера это первая запись и план уже известен, с конвейером -
+                    # первая запись после окончания сканирования: объем записи стал точным
+                    self.preflight_free_space(tabs)
+                    self.space_checked = True
+
+                root = self.scanner.roots[root_index]
+                if root['kind'] == 'file':
+                    source_path = root['path']
+                else:
+                    source_path = os.path.join(root['path'], rel_path)
+                tab_index = root['tab']
+                if tab_index in self.skipped_tabs:
+                    continue
+                sqlite_version = None
+                if not is_dir and self.sqlite_backup and not kind & ENTRY_SYMLINK:
+                    if source_path.endswith(SQLITE_SIDECAR_SUFFIXES) and self.is_sqlite_sidecar(source_path):
+                        # Журнал и WAL базы уже входят в ее резервную копию
+                        self.stats['sqlite_sidecars'] = self.stats.get('sqlite_sidecars', 0) + 1
+                        continue
+                    sqlite_version = self.sqlite_database_version(source_path)
+                if sqlite_version is not None:
+                    hash_value = path_hash(source_path)
+                    self.sqlite_versions[tab_index][hash_value] = (entry, sqlite_version)
+                    if self.incremental and self.previous_sqlite_versions[tab_index].get(hash_value) == sqlite_version:
+                        # Содержимое базы не менялось, даже если менялось время изменения файла
+                        self.stats['sqlite_unchanged'] = self.stats.get('sqlite_unchanged', 0) + 1
+                        continue
+                elif not is_dir and self.is_unchanged(entry, tab_index, source_path, size, mtime_ns):
+                    # Инкрементальное копирование: файл не менялся с прошлого копирования
+                    self.stats['unchanged'] = self.stats.get('unchanged', 0) + 1
                     continue
+                if is_dir:
+                    # Без изменений внутри папки при инкрементальном копировании пустой копии не остается
+                    deferred_directories[(root_index, rel_path)] = source_path
+                    continue
+                if tab_index not in tab_destinations:
+                    actual_destination = self.prepare_tab_destination(tabs[tab_index], tab_index)
+                    if actual_destination is None:
+                        self.skipped_tabs.add(tab_index)
+                        continue
+                    tab_destinations[tab_index] = actual_destination
+                    self.choose_tab_strategy(tabs[tab_index], tab_index)
+                actual_destination = tab_destinations[tab_index]
 
                 try:
-                    if self.copy_folder_contents:
-                        # Безопасное копирование содержимого папки
-                        for root, dirs, files in os.walk(folder_path):
-                            for file in files:
-                                if self.cancelled:
-                                    return False, "Операция отменена"
-                                    
-                                source_file_path = os.path.join(root, file)
-                                rel_path = os.path.relpath(source_file_path, folder_path)
-                                dest_file_path = os.path.join(actual_destination, rel_path)
-                                
-                                # Создаем папки назначения
-                                os.makedirs(os.path.dirname(dest_file_path), exist_ok=True)
-                                
-                                # Безопасное именование файлов
-                                dest_file_path = self.get_safe_destination_path(dest_file_path)
-                                
-                                # КОПИРУЕМ файл (исходный файл не изменяется)
-                                shutil.copy2(source_file_path, dest_file_path)
-                                file_size = os.path.getsize(source_file_path)
-                                copied_size += file_size
-                                copied_count += 1
-                                
-                                # Обновляем прогресс
-                                self.update_progress_stats(copied_size, copied_count)
-                                
+                    if root['kind'] == 'file':
+                        dest_file_path = os.path.join(actual_destination, rel_path)
                     else:
-                        # Безопасное копирование всей папки
-                        folder_name = os.path.basename(folder_path)
-                        dest_folder_path = os.path.join(actual_destination, folder_name)
-                        
-                        # Безопасное именование папки назначения
-                        dest_folder_path = self.get_safe_destination_path(dest_folder_path, is_folder=True)
-                        
-                        # Копируем всю папку БЕЗ предварительного удаления
-                        copied_count, copied_size = self.copy_tree_safe(
-                            folder_path, dest_folder_path, copied_count, copied_size
-                        )
-                        
+                        if self.copy_folder_contents:
+                            # Содержимое папки копируется прямо в папку назначения
+                            dest_root = actual_destination
+                        else:
+                            # Папка копируется целиком под безопасным именем
+                            if root_index not in root_destinations:
+                                root_destinations[root_index] = self.get_safe_destination_path(
+                                    os.path.join(actual_destination, os.path.basename(root['path'])), is_folder=True
+                                )
+                            dest_root = root_destinations[root_index]
+                        self.create_deferred_directories(deferred_directories, root_index,
+                                                         os.path.dirname(rel_path), dest_root)
+                        dest_file_path = os.path.join(dest_root, rel_path)
+
+                    # Безопасное именование файла, исходный файл не изменяется
+                    dest_file_path = self.get_safe_destination_path(dest_file_path)
                 except Exception as e:
-                    self.status_updated.emit(f"Ошибка при копировании папки {folder_path}: {str(e)}")
+                    if not is_dir:
+                        self.failed_entries.add(entry)
+                    if getattr(e, 'errno', None) == errno.ENOSPC:
+                        self.out_of_space = f"Копирование остановлено: закончилось место при копировании {source_path}"
+                        self.status_updated.emit(self.out_of_space)
+                        break
+                    self.status_updated.emit(f"Ошибка при копировании файла {source_path}: {str(e)}")
+                    continue
 
-            # Копируем отдельные файлы (БЕЗОПАСНО)
-            for file_path in self.source_files:
-                if self.cancelled:
-                    return False, "Операция отменена"
-                    
-                if not os.path.exists(file_path):
+                task = {'entry': entry, 'tab': tab_index, 'source': source_path, 'dest': dest_file_path,
+                        'kind': kind, 'dev': dev, 'inode': inode, 'size': size, 'mtime_ns': mtime_ns,
+                        'sqlite': sqlite_version is not None}
+                shared = not kind & (ENTRY_SYMLINK | ENTRY_HARDLINKED) and sqlite_version is None
+                primary = self.fanout_primaries.get((dev, inode)) if shared else None
+                needed = self.space_needed(tab_index, entry, size, dev, inode, kind)
+                recheck_due = self.free_space_recheck_due(tab_index, needed)
+                if (primary is not None and not recheck_due
+                        and (primary['size'], primary['mtime_ns']) == (size, mtime_ns)):
+                    # Тот же файл из вложенного или общего с другой вкладкой источника: читается один раз
+                    if not self.ensure_free_space(tab_index, needed):
+                        if self.out_of_space:
+                            self.status_updated.emit(self.out_of_space)
+                            break
+                        continue
+                    primary.setdefault('fanout', []).append(task)
+                    self.pending_destinations.add(dest_file_path)
+                    continue
+                if batch and (batch[0]['tab'] != tab_index or len(batch) >= COPY_BATCH_SIZE or recheck_due):
+                    # Перед перепроверкой места отложенные файлы должны быть уже записаны
+                    self.flush_copy_batch(batch)
+                    batch = []
+                if not self.ensure_free_space(tab_index, needed):
+                    if self.out_of_space:
+                        self.status_updated.emit(self.out_of_space)
+                        break
                     continue
+                batch.append(task)
+                self.pending_destinations.add(dest_file_path)
+                if shared:
+                    self.fanout_primaries[(dev, inode)] = task
+
+            if batch:
+                self.flush_copy_batch(batch)
+                batch = []
+            if not self.cancelled and not self.out_of_space:
+                self.create_remaining_directories(tabs, deferred_directories, tab_destinations, root_destinations)
+            self.process_retry_queue(wait=True)
+            self.retry_changed_files()
+            # Повтор изменившегося файла тоже может наткнуться на блокировку
+            self.process_retry_queue(wait=True)
+            self.apply_deferred_metadata()
+            self.apply_directory_metadata()
+            self.durability_barrier(tab_destinations)
+        finally:
+            # Задания, не дошедшие до копирования из-за отмены или нехватки места
+            self.failed_entries.update(target['entry'] for task in batch
+                                       for target in [task] + task.get('fanout', []))
+            self.release_copy_resources()
+
+        self.refresh_total_size()
+        return self.copied_count, self.copied_size
+
+    def release_copy_resources(self):
+        """Останавливает пулы потоков; задания, так и не дождавшиеся повтора, считаются нескопированными"""
+        self.failed_entries.update(task['entry'] for due, number, task in self.retry_queue)
+        self.retry_queue.clear()
+        # Чужие пулы не останавливаются, но задания этого запуска в них должны завершиться
+        concurrent.futures.wait(self.copy_futures)
+        self.copy_futures.clear()
+        if self.owns_copy_pools:
+            for pool in self.copy_pools.values():
+                pool.shutdown(wait=True)
+            self.copy_pools.clear()
+
+    def create_deferred_directories(self, deferred_directories, root_index, rel_dir, dest_root):
+        """Создает отложенные папки корня на пути к rel_dir, от внешней к внутренней"""
+        parts = rel_dir.split(os.sep) if rel_dir else []
+        for depth in range(len(parts) + 1):
+            path = os.path.join(*parts[:depth]) if depth else ''
+            source_dir = deferred_directories.pop((root_index, path), None)
+            # Корень при копировании содержимого - сама папка назначения
+            if source_dir is not None and (path or not self.copy_folder_contents):
+                self.create_directory(source_dir, os.path.join(dest_root, path) if path else dest_root)
+
+    def create_remaining_directories(self, tabs, deferred_directories, tab_destinations, root_destinations):
+        """Создает папки, в которые не попало ни одного файла.
+
+        При полном копировании создаются все (пустые папки источника
+        сохраняются), при инкрементальном - только в корнях, куда что-то
+        скопировано, чтобы запуск без изменений не оставлял пустых копий дерева.
+        """
+        for (root_index, rel_path), source_dir in sorted(deferred_directories.items()):
+            root = self.scanner.roots[root_index]
+            tab_index = root['tab']
+            if tab_index in self.skipped_tabs:
+                continue
+            incremental = self.incremental and (tab_index in self.copy_plan
+                                                or self.previous_snapshots[tab_index] is not None)
+            copied = (tab_index in tab_destinations if self.copy_folder_contents
+                      else root_index in root_destinations)
+            if incremental and not copied:
+                continue
+            try:
+                if tab_index not in tab_destinations:
+                    actual_destination = self.prepare_tab_destination(tabs[tab_index], tab_index)
+                    if actual_destination is None:
+                        self.skipped_tabs.add(tab_index)
+                        continue
+                    tab_destinations[tab_index] = actual_destination
+                if self.copy_folder_contents:
+                    dest_root = tab_destinations[tab_index]
+                else:
+                    if root_index not in root_destinations:
+                        root_destinations[root_index] = self.get_safe_destination_path(
+                            os.path.join(tab_destinations[tab_index], os.path.basename(root['path'])), is_folder=True
+                        )
+                    dest_root = root_destinations[root_index]
+                self.create_deferred_directories(deferred_directories, root_index, rel_path, dest_root)
+            except OSError as e:
+                self.status_updated.emit(f"Ошибка при создании папки {source_dir}: {str(e)}")
 
+    def create_directory(self, source_dir, dest_dir):
+        """Создает папку назначения по записи манифеста и запоминает ее для переноса метаданных"""
+        self.ensure_directory(dest_dir)
+        self.copied_directories.append((source_dir, dest_dir))
+
+    def ensure_directory(self, path):
+        """Создает папку назначения, если она еще не создана в этом запуске.
+
+        В created_directories попадают папка, недостающие предки, которые создаст
+        makedirs, и ближайшая существующая папка (в ней появится запись о новой);
+        выше папки назначения вкладки подъем не идет.
+        """
+        if path in self.created_directories:
+            return
+        directories = []
+        current = path
+        while current not in self.created_directories:
+            directories.append(current)
+            if current in self.destination_roots or os.path.isdir(current):
+                break
+            parent = os.path.dirname(current)
+            if parent == current:
+                break
+            current = parent
+        os.makedirs(path, exist_ok=True)
+        self.created_directories.update(directories)
+
+    def apply_directory_metadata(self):
+        """Переносит время изменения, права и атрибуты папок после записи всех файлов.
+
+        Вложенные папки обрабатываются раньше родительских: запись в папку
+        меняет ее время изменения, а права родителя могут запретить доступ.
+        """
+        directories, self.copied_directories = self.copied_directories, []
+        if not self.copy_directory_times:
+            return
+        started = time.perf_counter()
+        errors = 0
+        for source_dir, dest_dir in reversed(directories):
+            try:
+                # Владелец сохраняет полный доступ, иначе следующий запуск не сможет писать в папку
+                self.transfer_metadata(source_dir, dest_dir, extra_mode=stat.S_IRWXU)
+            except OSError:
+                errors += 1
+        if errors:
+            self.status_updated.emit(f"Не удалось перенести время и права {errors} папок")
+        self.stats['metadata_dirs'] = self.stats.get('metadata_dirs', 0) + len(directories) - errors
+        self.stats['metadata_time'] = self.stats.get('metadata_time', 0) + time.perf_counter() - started
+
+    def record_metadata(self, entry, source_path, dest_path, stat_result=None, xattrs=None):
+        """Переносит метаданные скопированного файла сразу или откладывает до пакетного прохода"""
+        if self.deferred_metadata:
+            self.pending_metadata.append((entry, source_path, dest_path, stat_result, xattrs))
+            return
+        started = time.perf_counter()
+        self.transfer_metadata(source_path, dest_path, stat_result, xattrs)
+        self.add_stat('metadata_files', 1)
+        self.add_stat('metadata_time', time.perf_counter() - started)
+
+    def transfer_metadata(self, source_path, dest_path, stat_result=None, xattrs=None, extra_mode=0):
+        """Время, права, расширенные атрибуты и ACL источника на копию (по настройкам)"""
+        if stat_result is None:
+            stat_result = os.stat(source_path)
+        if xattrs is None:
+            xattrs = read_xattrs(source_path, self.copy_xattrs, self.copy_acls)
+        apply_file_metadata(dest_path, stat_result, xattrs, extra_mode)
+
+    def apply_deferred_metadata(self):
+        """Переносит отложенные метаданные файлов, разделив их между несколькими потоками"""
+        pending, self.pending_metadata = self.pending_metadata, []
+        if not pending:
+            return
+        started = time.perf_counter()
+        failed = map_in_threads(lambda item: self.transfer_metadata(*item[1:]), pending, METADATA_WORKERS,
+                                self.metadata_pool())
+        for item, error in failed:
+            # Файл без своих метаданных будет скопирован заново при следующем инкрементальном запуске
+            self.failed_entries.add(item[0])
+        if failed:
+            self.status_updated.emit(f"Не удалось перенести метаданные {len(failed)} файлов: {failed[0][1]}")
+            self.stats['metadata_errors'] = self.stats.get('metadata_errors', 0) + len(failed)
+        self.stats['metadata_files'] = self.stats.get('metadata_files', 0) + len(pending) - len(failed)
+        self.stats['metadata_time'] = self.stats.get('metadata_time', 0) + time.perf_counter() - started
+
+    def sync_copied_file(self, entry, dest_path, fd=None):
+        """fsync файла в режиме каждого файла или постановка в очередь барьера конца запуска"""
+        if self.durability == DURABILITY_FILE:
+            started = time.perf_counter()
+            if fd is not None:
+                os.fsync(fd)
+            else:
+                fsync_path(dest_path)
+            self.add_stat('synced_files', 1)
+            self.add_stat('durability_time', time.perf_counter() - started)
+        elif self.durability == DURABILITY_RUN and syncfs is None:
+            self.unsynced_files.append((entry, dest_path))
+
+    def durability_barrier(self, tab_destinations):
+        """Сбрасывает на диск записанное за запуск до сохранения снимков вкладок.
+
+        Вкладки, для которых запись не подтверждена, не сохраняют снимок,
+        и при следующем инкрементальном запуске их файлы копируются снова.
+        """
+        if self.durability == DURABILITY_NONE:
+            self.durability_report.append("Надежность записи: без синхронизации с диском")
+            return
+        started = time.perf_counter()
+        devices = {}
+        for tab_index, destination in tab_destinations.items():
+            try:
+                device = os.stat(destination).st_dev
+            except OSError:
+                continue
+            devices.setdefault(device, (destination, []))[1].append(tab_index)
+
+        if self.durability == DURABILITY_RUN and syncfs is not None:
+            # Одним вызовом на устройство: данные, метаданные и записи папок
+            for destination, tab_indices in devices.values():
                 try:
-                    dest_file_path = os.path.join(actual_destination, os.path.basename(file_path))
-                    
-                    # Безопасное именование файла
-                    dest_file_path = self.get_safe_destination_path(dest_file_path)
-                    
-                    # КОПИРУЕМ файл (исходный файл не изменяется)
-                    shutil.copy2(file_path, dest_file_path)
-                    file_size = os.path.getsize(file_path)
-                    copied_size += file_size
-                    copied_count += 1
-                    
-                    # Обновляем прогресс
-                    self.update_progress_stats(copied_size, copied_count)
-                    
-                except Exception as e:
-                    self.status_updated.emit(f"Ошибка при копировании файла {file_path}: {str(e)}")
+                    fd = os.open(destination, os.O_RDONLY)
+                    try:
+                        syncfs(fd)
+                    finally:
+                        os.close(fd)
+                except OSError as e:
+                    self.undurable_tabs.update(tab_indices)
+                    self.status_updated.emit(f"Не удалось сбросить на диск данные в '{destination}': {str(e)}")
+            method = f"syncfs, устройств {len(devices)}"
+        else:
+            files, self.unsynced_files = self.unsynced_files, []
+            failed = map_in_threads(lambda item: fsync_path(item[1]), files, METADATA_WORKERS,
+                                    self.metadata_pool())
+            for (entry, dest_path), error in failed:
+                self.failed_entries.add(entry)
+            if failed:
+                self.status_updated.emit(f"Не удалось сбросить на диск {len(failed)} файлов: {failed[0][1]}")
+            directories = []
+            if os.name != 'nt':
+                # Записи о новых файлах хранятся в папках, их тоже нужно сбросить
+                directories = sorted(self.created_directories | set(tab_destinations.values()))
+                for directory, error in map_in_threads(fsync_path, directories, METADATA_WORKERS,
+                                                       self.metadata_pool()):
+                    if error.errno in (errno.EINVAL, errno.ENOTSUP, errno.EACCES):
+                        # Файловая система не поддерживает fsync папок
+                        continue
+                    self.undurable_tabs.update(tab_destinations)
+                    self.status_updated.emit(f"Не удалось сбросить на диск папку '{directory}': {str(error)}")
+            if self.durability == DURABILITY_FILE:
+                method = f"файлов {self.stats.get('synced_files', 0)}, папок {len(directories)}"
+            else:
+                method = f"fsync, файлов {len(files)}, папок {len(directories)}"
+        self.add_stat('durability_time', time.perf_counter() - started)
+
+        mode = "каждый файл" if self.durability == DURABILITY_FILE else "барьер в конце запуска"
+        line = f"Надежность записи: {mode} ({method}) за {self.stats['durability_time']:.1f} с"
+        if self.undurable_tabs:
+            line += f", не подтверждена запись вкладок: {len(self.undurable_tabs)}"
+        self.durability_report.append(line)
+
+    def choose_tab_strategy(self, tab, tab_index):
+        """Выбирает стратегию копирования вкладки по типам устройств источников и назначения"""
+        if not self.device_aware:
+            strategy = DEFAULT_COPY_STRATEGY
+            source_kinds = []
+            destination_kind = None
+        else:
+            source_kinds = sorted({DEVICE_CLASSIFIER.classify(path)['kind']
+                                   for path in list(tab['folders']) + list(tab['files'])})
+            destination_kind = DEVICE_CLASSIFIER.classify(tab['destination'], probe=True)['kind']
+            strategy = choose_copy_strategy(source_kinds, destination_kind)
+        self.tab_strategies[tab_index] = strategy
+
+        order = COPY_ORDER_NAMES[strategy['order']]
+        line = (f"Стратегия вкладки '{tab['name']}': потоков {strategy['workers']}, "
+                f"блок {strategy['chunk_size'] // (1024 * 1024)} MB, порядок чтения {order}")
+        if self.device_aware:
+            line += f"; источники: {', '.join(source_kinds) or '-'}, назначение: {destination_kind}"
+        line += f" ({strategy['reason']})"
+        self.strategy_report.append(line)
+
+    def flush_copy_batch(self, batch):
+        """Выполняет пакет заданий одной вкладки в порядке и с параллельностью ее стратегии.
+
+        Мелкие обычные файлы копируются отдельно пакетным способом, остальные по одному.
+        """
+        self.pending_destinations.clear()
+        self.fanout_primaries.clear()
+        if len(self.pending_metadata) >= METADATA_SWEEP_SIZE:
+            # Данные прошлых пакетов записаны: переносим их метаданные, пока очередь не разрослась
+            self.apply_deferred_metadata()
+        # Повторы, срок которых подошел, выполняются между пакетами, не задерживая остальные файлы
+        self.process_retry_queue(wait=False)
+        tab_index = batch[0]['tab']
+        strategy = self.tab_strategies.get(tab_index, DEFAULT_COPY_STRATEGY)
+        if strategy['order'] == 'physical':
+            batch.sort(key=self.physical_order_key)
+        elif strategy['order'] == 'inode':
+            # На диске с головками порядок inode близок к физическому расположению
+            batch.sort(key=lambda task: (task['dev'], task['inode']))
+        throttle = self.make_throttle(tab_index)
+        chunk_size = strategy['chunk_size']
+
+        # Папки назначения создаются один раз на пакет, а не для каждого файла
+        directory_errors = {}
+        for directory in sorted({os.path.dirname(target['dest'])
+                                 for task in batch for target in [task] + task.get('fanout', [])}):
+            try:
+                self.ensure_directory(directory)
+            except OSError as e:
+                directory_errors[directory] = e
+        small_tasks = []
+        other_tasks = []
+        for task in batch:
+            if directory_errors and task.get('fanout'):
+                fanout = []
+                for fan in task['fanout']:
+                    fan_error = directory_errors.get(os.path.dirname(fan['dest']))
+                    if fan_error is None:
+                        fanout.append(fan)
+                    else:
+                        self.finish_copy_task(fan, fan_error)
+                task['fanout'] = fanout
+            error = directory_errors.get(os.path.dirname(task['dest']))
+            if error is not None:
+                self.finish_copy_task(task, error)
+            elif (task['size'] < SMALL_FILE_SIZE and not task['kind'] & SMALL_FILE_EXCLUDED_KINDS
+                  and not task['sqlite']):
+                small_tasks.append(task)
+            else:
+                other_tasks.append(task)
 
-            return True, f"Успешно скопировано {copied_count} файлов"
+        pool = None
+        if strategy['workers'] > 1:
+            pool = self.get_thread_pool(strategy['workers'])
 
+        if small_tasks:
+            started = time.perf_counter()
+            if pool is None or len(small_tasks) < 2 * strategy['workers']:
+                self.finish_small_files(small_tasks, self.copy_small_files(small_tasks, throttle))
+            else:
+                # Каждый поток пула получает свою часть пакета
+                step = -(-len(small_tasks) // strategy['workers'])
+                futures = {}
+                for start in range(0, len(small_tasks), step):
+                    part = small_tasks[start:start + step]
+                    futures[pool.submit(self.copy_small_files, part, throttle)] = part
+                self.copy_futures.update(futures)
+                for future in concurrent.futures.as_completed(futures):
+                    self.finish_small_files(futures[future], future.result())
+                self.copy_futures.difference_update(futures)
+            self.stats['small_time'] = self.stats.get('small_time', 0) + time.perf_counter() - started
+
+        if not other_tasks:
+            return
+        started = time.perf_counter()
+        copied_before = self.copied_count, self.copied_size
+        if pool is None:
+            for task in other_tasks:
+                self.finish_copy_task(task, self.run_copy_task(task, throttle, chunk_size))
+        else:
+            futures = {}
+            inline_tasks = []
+            for task in other_tasks:
+                # Ссылки зависят от порядка копирования, поэтому выполняются в этом потоке
+                if task['kind'] & (ENTRY_SYMLINK | ENTRY_HARDLINKED):
+                    inline_tasks.append(task)
+                else:
+                    futures[pool.submit(self.run_copy_task, task, throttle, chunk_size)] = task
+            self.copy_futures.update(futures)
+            for task in inline_tasks:
+                self.finish_copy_task(task, self.run_copy_task(task, throttle, chunk_size))
+            for future in concurrent.futures.as_completed(futures):
+                self.finish_copy_task(futures[future], future.result())
+            self.copy_futures.difference_update(futures)
+        self.stats['large_files'] = self.stats.get('large_files', 0) + self.copied_count - copied_before[0]
+        self.stats['large_bytes'] = self.stats.get('large_bytes', 0) + self.copied_size - copied_before[1]
+        self.stats['large_time'] = self.stats.get('large_time', 0) + time.perf_counter() - started
+
+    def copy_small_files(self, tasks, throttle):
+        """Копирует мелкие файлы тремя проходами: чтение всех, запись всех, метаданные всех
+        (или их постановка в очередь отложенного переноса).
+
+        На файл уходит open, fstat, read и close при чтении и open, write и close
+        при записи. Возвращает список ошибок по заданиям, None - файл скопирован.
+        """
+        errors = [None] * len(tasks)
+        contents = [None] * len(tasks)
+        for index, task in enumerate(tasks):
+            if self.cancelled or self.out_of_space:
+                errors[index] = InterruptedError("копирование прервано")
+                continue
+            try:
+                source_stats = []
+                contents[index] = read_small_file(task['source'], self.copy_xattrs, self.copy_acls, source_stats)
+                self.check_source_unchanged(task, source_stats)
+            except (OSError, SourceChangedError) as e:
+                errors[index] = e
+                contents[index] = None
+
+        # Результаты записи основной копии и копий из общих источников (fanout)
+        results = [None] * len(tasks)
+        for index, task in enumerate(tasks):
+            if contents[index] is None:
+                continue
+            if self.cancelled or self.out_of_space:
+                errors[index] = InterruptedError("копирование прервано")
+                contents[index] = None
+                continue
+            data = contents[index][0]
+            results[index] = []
+            for target in [task] + task.get('fanout', []):
+                try:
+                    if target is task:
+                        throttle(len(data), 1)
+                    fd = os.open(target['dest'],
+                                 os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o666)
+                    try:
+                        write_all(fd, data)
+                        self.sync_copied_file(target['entry'], target['dest'], fd)
+                    finally:
+                        os.close(fd)
+                    results[index].append(None)
+                except Exception as e:
+                    results[index].append(e)
+
+        for index, task in enumerate(tasks):
+            if contents[index] is None:
+                continue
+            targets = [task] + task.get('fanout', [])
+            for position, target in enumerate(targets):
+                if results[index][position] is not None:
+                    continue
+                try:
+                    self.record_metadata(target['entry'], target['source'], target['dest'],
+                                         contents[index][1], contents[index][2])
+                except OSError as e:
+                    results[index][position] = e
+            errors[index] = results[index][0]
+            if len(targets) > 1:
+                task['fanout_errors'] = results[index][1:]
+        return errors
+
+    def finish_small_files(self, tasks, errors):
+        """Учитывает результаты пакета мелких файлов"""
+        for task, error in zip(tasks, errors):
+            if error is None:
+                self.stats['small_files'] = self.stats.get('small_files', 0) + 1
+                self.stats['small_bytes'] = self.stats.get('small_bytes', 0) + task['size']
+            self.finish_copy_task(task, error)
+
+    def physical_order_key(self, task):
+        """Ключ сортировки по первому экстенту файла; без FIEMAP - по inode"""
+        dev = task['dev']
+        if dev not in self.fiemap_unsupported and not task['kind'] & ENTRY_SYMLINK:
+            try:
+                offset = first_physical_offset(task['source'])
+            except OSError as e:
+                if e.errno in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.ENOSYS):
+                    # Файловая система не отдает экстенты: дальше на этом устройстве только inode
+                    self.fiemap_unsupported.add(dev)
+                offset = None
+            if offset is not None:
+                self.stats['physical_order_files'] = self.stats.get('physical_order_files', 0) + 1
+                return (dev, 1, offset, task['inode'])
+        self.stats['inode_order_files'] = self.stats.get('inode_order_files', 0) + 1
+        # Файлы без экстентов (пустые, данные в inode) идут первыми по порядку inode
+        return (dev, 0, task['inode'], 0)
+
+    def run_copy_task(self, task, throttle, chunk_size=COPY_CHUNK_SIZE):
+        """Копирует файл задания, возвращает исключение или None (выполняется и в потоках пула)"""
+        if self.cancelled or self.out_of_space:
+            return InterruptedError("копирование прервано")
+        try:
+            throttle(0, 1)
+            if task['sqlite'] and self.copy_sqlite_database(task, throttle):
+                # Резервная копия согласована сама по себе, проверка изменений источника не нужна
+                self.sync_copied_file(task['entry'], task['dest'])
+                self.record_metadata(task['entry'], task['source'], task['dest'])
+            else:
+                fanout = task.get('fanout', [])
+                extra = None
+                if fanout:
+                    extra = ExtraCopies([fan['dest'] for fan in fanout], self.tee_buffer,
+                                        threaded=task['size'] >= TEE_THREAD_SIZE)
+                source_stats = []
+                try:
+                    copied = self.copy_entry(task['source'], task['dest'], task['kind'], task['dev'], task['inode'],
+                                             task['size'], throttle, chunk_size, extra, source_stats)
+                finally:
+                    if extra is not None:
+                        extra.close()
+                        if extra.threaded:
+                            self.add_stat('tee_files', 1)
+                            self.add_stat('tee_lagging', extra.lagging)
+                if copied and task['sqlite']:
+                    # Резервное копирование базы не удалось: журнал копируется вместе с ней
+                    self.copy_sqlite_sidecars(task)
+                if copied:
+                    self.check_source_unchanged(task, source_stats)
+                    if extra is not None:
+                        task['fanout_errors'] = [extra.errors.get(fan['dest']) for fan in fanout]
+                    for target in [task] + fanout:
+                        if extra is None or extra.errors.get(target['dest']) is None:
+                            self.sync_copied_file(target['entry'], target['dest'])
+                            self.record_metadata(target['entry'], target['source'], target['dest'])
+            return None
         except Exception as e:
-            return False, f"Критическая ошибка: {str(e)}"
+            return e
+
+    def sqlite_database_version(self, path):
+        """Версия базы SQLite (см. read_sqlite_version), None - файл не база; признак кешируется"""
+        if not path.lower().endswith(SQLITE_EXTENSIONS) or self.sqlite_databases.get(path) is False:
+            return None
+        try:
+            version = read_sqlite_version(path)
+        except OSError:
+            version = None
+        self.sqlite_databases[path] = version is not None
+        return version
+
+    def is_sqlite_sidecar(self, path):
+        """Файл -wal, -shm или -journal рядом с базой SQLite"""
+        for suffix in SQLITE_SIDECAR_SUFFIXES:
+            if path.endswith(suffix):
+                database = path[:-len(suffix)]
+                if database not in self.sqlite_databases:
+                    self.sqlite_database_version(database)
+                return self.sqlite_databases.get(database, False)
+        return False
+
+    def copy_sqlite_sidecars(self, task):
+        """Копирует -wal и -journal базы, скопированной как обычный файл, рядом с ее копией"""
+        for suffix in SQLITE_FALLBACK_SIDECARS:
+            dest_path = task['dest'] + suffix
+            try:
+                shutil.copy2(task['source'] + suffix, dest_path)
+            except FileNotFoundError:
+                # Журнала нет или SQLite только что перенес его в основной файл
+                continue
+            self.sync_copied_file(task['entry'], dest_path)
+            self.add_stat('sqlite_sidecars_copied', 1)
+
+    def copy_sqlite_database(self, task, throttle):
+        """Копирует базу SQLite через online backup API, False - база не открылась, копировать как файл.
+
+        Копирование идет шагами по SQLITE_BACKUP_PAGES страниц; между шагами
+        база доступна пишущим, а их изменения SQLite учитывает сам.
+        """
+        try:
+            source = sqlite3.connect(pathlib.Path(os.path.abspath(task['source'])).as_uri() + "?mode=ro",
+                                     uri=True, timeout=SQLITE_BUSY_TIMEOUT)
+        except sqlite3.Error:
+            self.add_stat('sqlite_fallbacks', 1)
+            return False
+        try:
+            page_size = source.execute("PRAGMA page_size").fetchone()[0]
+            destination = sqlite3.connect(task['dest'])
+            try:
+                def progress(status, remaining, total):
+                    if self.cancelled:
+                        raise InterruptedError("копирование прервано")
+                    throttle(SQLITE_BACKUP_PAGES * page_size)
+
+                source.backup(destination, pages=SQLITE_BACKUP_PAGES, progress=progress, sleep=SQLITE_BACKUP_SLEEP)
+            finally:
+                destination.close()
+        except sqlite3.Error:
+            # Повреждена, зашифрована или заблокирована: копируем файл как есть
+            self.add_stat('sqlite_fallbacks', 1)
+            if os.path.lexists(task['dest']):
+                os.remove(task['dest'])
+            return False
+        finally:
+            source.close()
+        self.add_stat('sqlite_backups', 1)
+        return True
+
+    def check_source_unchanged(self, task, source_stats):
+        """SourceChangedError, если размер или время изменения источника менялись, пока он читался.
+
+        source_stats - stat открытого источника непосредственно до чтения и после него: файл,
+        изменившийся между сканированием и копированием, копируется согласованно и повтора не требует.
+        """
+        stat_before, stat_after = source_stats
+        if (stat_after.st_size, stat_after.st_mtime_ns) != (stat_before.st_size, stat_before.st_mtime_ns):
+            raise SourceChangedError(task['source'])
+
+    def finish_copy_task(self, task, error):
+        """Учитывает результат задания: прогресс при успехе, ошибку или остановку при неудаче"""
+        fanout = task.pop('fanout', None)
+        if fanout:
+            # Копии общего файла учитываются отдельно; без своих ошибок у них ошибка основной копии
+            fanout_errors = task.pop('fanout_errors', None) or [error] * len(fanout)
+            for fan, fan_error in zip(fanout, fanout_errors):
+                if fan_error is None:
+                    self.stats['shared_files'] = self.stats.get('shared_files', 0) + 1
+                    self.stats['shared_bytes'] = self.stats.get('shared_bytes', 0) + fan['size']
+                self.finish_copy_task(fan, fan_error)
+        if error is None:
+            self.copied_size += task['size']
+            self.copied_count += 1
+            if task.get('attempts'):
+                self.stats['retry_recovered'] = self.stats.get('retry_recovered', 0) + 1
+            self.refresh_total_size()
+            self.update_progress_stats(self.copied_size, self.copied_count)
+            return
+        if isinstance(error, SourceChangedError):
+            if len(self.changed_tasks) < CHANGED_RETRY_LIMIT:
+                # Копия может быть рваной: файл будет скопирован заново в конце запуска
+                self.changed_tasks.append(task)
+            else:
+                self.mark_inconsistent(task)
+            return
+        if (not isinstance(error, InterruptedError)
+                and task.get('attempts', 0) < transient_retry_limit(error)):
+            # Файл занят или временно недоступен: повтор позже, копирование остальных продолжается
+            task['attempts'] = task.get('attempts', 0) + 1
+            delay = FAILED_RETRY_DELAY * 2 ** (task['attempts'] - 1)
+            heapq.heappush(self.retry_queue, (time.monotonic() + delay, self.retry_counter, task))
+            self.retry_counter += 1
+            self.status_updated.emit(f"Файл недоступен, повтор через {delay:.0f} с: {task['source']}: {str(error)}")
+            return
+
+        self.failed_entries.add(task['entry'])
+        if isinstance(error, InterruptedError):
+            return
+        if getattr(error, 'errno', None) == errno.ENOSPC:
+            # Место закончилось раньше, чем показала проверка: убираем неполную копию и останавливаемся
+            if os.path.lexists(task['dest']):
+                try:
+                    os.remove(task['dest'])
+                except OSError:
+                    pass
+            if task['tab'] in self.extra_destination_tabs:
+                # Заполнилась дополнительная папка назначения: остальные папки продолжают копироваться
+                if task['tab'] not in self.skipped_tabs:
+                    self.skipped_tabs.add(task['tab'])
+                    line = f"Копирование в дополнительную папку остановлено: закончилось место ({task['dest']})"
+                    self.space_report.append(line)
+                    self.status_updated.emit(line)
+                return
+            if not self.out_of_space:
+                self.out_of_space = f"Копирование остановлено: закончилось место при копировании {task['source']}"
+                self.status_updated.emit(self.out_of_space)
+            return
+        self.failed_files.append({
+            'source': task['source'],
+            'dest': task['dest'],
+            'tab': task['tab'],
+            'kind': task['kind'],
+            'size': task['size'],
+            'sqlite': task['sqlite'],
+            'attempts': task.get('attempts', 0) + 1,
+            'error': str(error)
+        })
+        self.status_updated.emit(f"Ошибка при копировании файла {task['source']}: {str(error)}")
+
+    def process_retry_queue(self, wait):
+        """Повторяет задания с временными ошибками, срок которых подошел.
+
+        С wait=True ждет, пока очередь не опустеет: повторы, вернувшиеся
+        с новой ошибкой, ставятся обратно с удвоенной паузой.
+        """
+        while self.retry_queue and not self.cancelled and not self.out_of_space:
+            due, number, task = self.retry_queue[0]
+            remaining = due - time.monotonic()
+            if remaining > 0:
+                if not wait:
+                    return
+                self.status_updated.emit(f"Ожидание повтора недоступных файлов: {len(self.retry_queue)}")
+                sleep_cancellable(remaining, lambda: self.cancelled)
+                continue
+            heapq.heappop(self.retry_queue)
+            strategy = self.tab_strategies.get(task['tab'], DEFAULT_COPY_STRATEGY)
+            self.stats['retry_attempts'] = self.stats.get('retry_attempts', 0) + 1
+            try:
+                # Папка могла не создаться из-за той же временной ошибки
+                self.ensure_directory(os.path.dirname(task['dest']))
+            except OSError as e:
+                error = e
+            else:
+                error = self.run_copy_task(task, self.make_throttle(task['tab']), strategy['chunk_size'])
+            self.finish_copy_task(task, error)
+
+    def retry_changed_files(self):
+        """Повторно копирует файлы, менявшиеся во время копирования.
+
+        Перед каждой попыткой размер и время изменения берутся заново;
+        файл, который менялся во всех попытках, считается несогласованным.
+        """
+        tasks, self.changed_tasks = self.changed_tasks, []
+        if tasks:
+            self.status_updated.emit(f"Повторное копирование файлов, изменившихся во время копирования: {len(tasks)}")
+        for task in tasks:
+            strategy = self.tab_strategies.get(task['tab'], DEFAULT_COPY_STRATEGY)
+            throttle = self.make_throttle(task['tab'])
+            error = SourceChangedError(task['source'])
+            for attempt in range(1, CHANGED_RETRY_ATTEMPTS + 1):
+                if self.cancelled or self.out_of_space:
+                    error = InterruptedError("копирование прервано")
+                    break
+                # Даем программе, которая пишет файл, закончить запись
+                sleep_cancellable(CHANGED_RETRY_DELAY * attempt, lambda: self.cancelled)
+                try:
+                    stat_before = os.stat(task['source'])
+                except OSError as e:
+                    error = e
+                    break
+                task['size'], task['mtime_ns'] = stat_before.st_size, stat_before.st_mtime_ns
+                error = self.run_copy_task(task, throttle, strategy['chunk_size'])
+                if not isinstance(error, SourceChangedError):
+                    break
+            self.stats['changed_retries'] = self.stats.get('changed_retries', 0) + 1
+            if isinstance(error, SourceChangedError):
+                self.mark_inconsistent(task)
+            else:
+                self.finish_copy_task(task, error)
+
+    def mark_inconsistent(self, task):
+        """Файл менялся при каждом копировании: копия остается, но не считается успешной"""
+        self.failed_entries.add(task['entry'])
+        self.inconsistent_files.append(task['source'])
+        self.status_updated.emit(f"Файл изменялся во время копирования, копия может быть несогласованной: "
+                                 f"{task['source']}")
+
+    def make_throttle(self, tab_index):
+        """Функция, вызываемая на границе блоков: пауза и ограничение скорости вкладки и общее"""
+        limiters = [limiter for limiter in (self.tab_rate_limiters[tab_index], self.rate_limiter)
+                    if limiter is not None and limiter.is_active()]
+
+        def throttle(byte_count, file_count=0):
+            self.wait_if_paused()
+            for limiter in limiters:
+                limiter.throttle(byte_count, file_count, cancelled=lambda: self.cancelled)
+        return throttle
+
+    def add_stat(self, name, value):
+        """Увеличивает счетчик отчета; безопасно вызывать из потоков пула"""
+        with self.stats_lock:
+            self.stats[name] = self.stats.get(name, 0) + value
+
+    def copy_entry(self, source_path, dest_file_path, kind, dev, inode, size, throttle=None,
+                   chunk_size=COPY_CHUNK_SIZE, extra=None, source_stats=None):
+        """Копирует одну запись манифеста с учетом ее флагов.
+
+        Возвращает True, если скопированы данные и копии нужны метаданные источника.
+        extra (ExtraCopies) - дополнительные копии обычного файла; source_stats
+        (список) получает stat источника до и после чтения данных.
+        """
+        if kind & ENTRY_SYMLINK:
+            os.symlink(os.readlink(source_path), dest_file_path)
+            return False
+        if kind & ENTRY_HARDLINKED and self.link_hardlinked(dest_file_path, dev, inode, size):
+            return False
+        self.copy_file_data(source_path, dest_file_path, kind, size, throttle, chunk_size, extra, source_stats)
+        if kind & ENTRY_HARDLINKED:
+            self.hardlink_targets.setdefault((dev, inode), dest_file_path)
+        return True
+
+    def link_hardlinked(self, dest_file_path, dev, inode, size):
+        """Создает жесткую ссылку на уже скопированные данные inode, False - нужно копировать"""
+        first_copy = self.hardlink_targets.get((dev, inode))
+        if first_copy is None:
+            return False
+        try:
+            os.link(first_copy, dest_file_path)
+        except OSError:
+            # Другая файловая система назначения или ссылки не поддерживаются
+            return False
+        self.add_stat('hardlinks', 1)
+        self.add_stat('hardlink_bytes_saved', size)
+        return True
+
+    def copy_file_data(self, source_path, dest_file_path, kind, size, throttle=None,
+                       chunk_size=COPY_CHUNK_SIZE, extra=None, source_stats=None):
+        """Копирует данные файла, метаданные переносит record_metadata"""
+        if kind & ENTRY_SPARSE and hasattr(os, 'SEEK_DATA'):
+            skipped = copy_sparse_file(source_path, dest_file_path, throttle, chunk_size, copy_metadata=False,
+                                       extra=extra, source_stats=source_stats)
+            self.add_stat('sparse_files', 1)
+            self.add_stat('sparse_bytes_skipped', skipped)
+            return
+        if self.cache_friendly_io and hasattr(os, 'posix_fadvise'):
+            copy_file_cache_friendly(source_path, dest_file_path, self.direct_io_threshold, throttle, chunk_size,
+                                     copy_metadata=False, extra=extra, source_stats=source_stats)
+            return
+        if source_stats is not None:
+            source_stats.append(os.stat(source_path))
+        shutil.copyfile(source_path, dest_file_path)
+        if source_stats is not None:
+            source_stats.append(os.stat(source_path))
+        if extra is not None:
+            # Дополнительные копии берутся из только что записанной, а не из источника
+            extra.copy_from(dest_file_path)
+        if throttle is not None:
+            throttle(size)
+
+    def snapshot_path(self, tab):
+        """Файл снимка манифеста вкладки: ключ зависит от источников и папки назначения"""
+        key_source = "\0".join([tab['destination'], str(self.copy_folder_contents)]
+                               + list(tab['folders']) + list(tab['files']))
+        key = hashlib.blake2b(key_source.encode('utf-8', 'surrogatepass'), digest_size=8).hexdigest()
+        return os.path.join(self.manifest_dir, f"{key}.snapshot")
+
+    def load_previous_snapshot(self, tab):
+        if not self.manifest_dir:
+            return None
+        # Снимок, сохраненный прошлым запуском этого процесса, не читается с диска заново
+        path = self.snapshot_path(tab)
+        snapshot = self.engine_cache.get_snapshot(path)
+        if snapshot is None:
+            snapshot = ManifestSnapshot.load(path)
+            if snapshot is not None:
+                self.engine_cache.put_snapshot(path, snapshot)
+        return snapshot
+
+    def is_unchanged(self, entry, tab_index, source_path, size, mtime_ns):
+        """Можно ли пропустить файл при инкрементальном копировании"""
+        if not self.incremental:
+            return False
+        plan = self.copy_plan.get(tab_index)
+        if plan is not None:
+            return entry not in plan
+        previous = self.previous_snapshots[tab_index]
+        return previous is not None and previous.is_unchanged(path_hash(source_path), size, mtime_ns)
+
+    def compute_change_diffs(self, excluded=()):
+        """Сравнивает текущее сканирование с прошлыми снимками вкладок"""
+        snapshots = ManifestSnapshot.from_manifest(self.scanner, excluded)
+        diffs = []
+        for snapshot, previous in zip(snapshots, self.previous_snapshots):
+            diffs.append(snapshot.diff(previous) if previous is not None else None)
+        return snapshots, diffs
+
+    def build_copy_plan(self):
+        """План инкрементального копирования по векторному сравнению (после полного сканирования)"""
+        snapshots, self.change_diffs = self.compute_change_diffs()
+        for tab_index, diff in enumerate(self.change_diffs):
+            if diff is not None:
+                self.copy_plan[tab_index] = diff.entries_to_copy()
+
+    def finish_change_tracking(self, tabs):
+        """Формирует отчет об изменениях и сохраняет снимки для следующего запуска"""
+        if not self.manifest_dir:
+            return
+        # Не скопированные файлы не попадают в снимок, чтобы в следующий раз считаться новыми
+        snapshots, diffs = self.compute_change_diffs(self.failed_entries)
+        if self.change_diffs is not None:
+            diffs = self.change_diffs
+        for tab_index, (tab, snapshot, diff) in enumerate(zip(tabs, snapshots, diffs)):
+            if diff is None:
+                self.change_report.append(
+                    f"Вкладка '{tab['name']}': первое копирование, запомнено {len(snapshot)} файлов"
+                )
+            else:
+                self.change_report.append(
+                    f"Изменения во вкладке '{tab['name']}' с прошлого копирования: {diff.summary()}"
+                )
+            if tab_index in self.undurable_tabs:
+                self.change_report.append(
+                    f"Снимок вкладки '{tab['name']}' не сохранен: запись на диск не подтверждена"
+                )
+            elif tab_index not in self.skipped_tabs:
+                versions = {hash_value: version
+                            for hash_value, (entry, version) in self.sqlite_versions[tab_index].items()
+                            if entry not in self.failed_entries}
+                try:
+                    snapshot.save(self.snapshot_path(tab), durable=self.durability != DURABILITY_NONE)
+                    save_sqlite_versions(self.snapshot_path(tab) + ".sqlite", versions,
+                                         durable=self.durability != DURABILITY_NONE)
+                except OSError as e:
+                    self.status_updated.emit(f"Не удалось сохранить манифест вкладки '{tab['name']}': {str(e)}")
+                    continue
+                # Номера записей нужны только этому запуску, в памяти остаются колонки, как после load
+                snapshot.entries = array('Q')
+                snapshot.duplicates = {}
+                self.engine_cache.put_snapshot(self.snapshot_path(tab), snapshot)
+
+    def iter_scan_entries(self):
+        """Выдает записи сканера: параллельно с копированием или после полного подсчета"""
+        if not self.pipelined:
+            # Полное сканирование в манифест, затем папки и файлы по порядку
+            for entry in self.scanner.scan():
+                pass
+            self.scanner.completed = True
+            self.refresh_total_size()
+            if self.incremental and self.manifest_dir:
+                self.build_copy_plan()
+            if self.total_size > 0:
+                self.status_updated.emit(f"Начинаем копирование ({self.total_size/1024/1024:.1f} MB)")
+            manifest = self.scanner.manifest
+            for dir_index in range(len(manifest.dir_roots)):
+                yield -(dir_index + 1)
+            yield from range(manifest.count)
+            return
+
+        self.scanner.start()
+        while True:
+            try:
+                entry = self.scanner.entries.get(timeout=0.2)
+            except queue.Empty:
+                if self.cancelled:
+                    return
+                continue
+            if entry is None:
+                return
+            yield entry
+
+    def refresh_total_size(self):
+        """Уточняет общий размер по мере сканирования, после завершения - точное значение"""
+        if self.total_exact:
+            return
+        if self.scanner.completed:
+            self.total_size = self.scanner.scanned_size
+            self.total_exact = True
+            self.size_estimate_updated.emit(self.total_size, True)
+        elif self.scanner.scanned_size > self.total_size:
+            self.total_size = self.scanner.scanned_size
+
+    def report_lines(self):
+        """Строки отчета о выполненном копировании для журнала операций"""
+        stats = self.stats
+        lines = []
+        if 'manifest_files' in stats:
+            line = (f"Манифест: {stats['manifest_files']} файлов, {stats['manifest_dirs']} папок, "
+                    f"в памяти {stats['manifest_memory']/1024/1024:.1f} MB")
+            if stats['manifest_spilled']:
+                line += f", выгружено на диск {stats['manifest_spilled']} записей"
+            lines.append(line)
+        if stats.get('unchanged'):
+            lines.append(f"Пропущено без изменений: {stats['unchanged']} файлов")
+        if stats.get('hardlinks'):
+            lines.append(f"Жестких ссылок воссоздано: {stats['hardlinks']}, "
+                         f"сэкономлено {stats['hardlink_bytes_saved']/1024/1024:.1f} MB")
+        if stats.get('sparse_files'):
+            lines.append(f"Разреженных файлов: {stats['sparse_files']}, "
+                         f"дыр пропущено {stats['sparse_bytes_skipped']/1024/1024:.1f} MB")
+        if stats.get('skipped_cycles'):
+            lines.append(f"Пропущено повторных папок (циклы ссылок): {stats['skipped_cycles']}")
+        if stats.get('skipped_symlinks'):
+            lines.append(f"Пропущено символических ссылок: {stats['skipped_symlinks']}")
+        if stats.get('duplicate_roots') or stats.get('shared_roots'):
+            lines.append(f"Пересекающиеся источники: повторов отброшено {stats.get('duplicate_roots', 0)}, "
+                         f"вложенных и общих с другими вкладками {stats.get('shared_roots', 0)} "
+                         f"(обходятся вместе с внешними)")
+        if stats.get('shared_files'):
+            lines.append(f"Общие файлы источников: {stats['shared_files']} копий записано без повторного чтения, "
+                         f"сэкономлено {stats['shared_bytes']/1024/1024:.1f} MB чтения")
+        if stats.get('tee_files'):
+            line = (f"Запись в несколько папок параллельно: {stats['tee_files']} файлов, "
+                    f"буфер {self.tee_buffer // (1024 * 1024)} MB на папку")
+            if stats.get('tee_lagging'):
+                line += f", не успевших за чтением копий (повторены отдельно): {stats['tee_lagging']}"
+            lines.append(line)
+        lines.extend(self.strategy_report)
+        if stats.get('physical_order_files'):
+            lines.append(f"Прочитано по физическому расположению: {stats['physical_order_files']} файлов, "
+                         f"по порядку inode: {stats.get('inode_order_files', 0)}")
+        if stats.get('small_files'):
+            small_time = max(stats['small_time'], 1e-6)
+            lines.append(f"Мелкие файлы (до {SMALL_FILE_SIZE // 1024} KB): {stats['small_files']}, "
+                         f"{stats['small_bytes']/1024/1024:.1f} MB за {stats['small_time']:.1f} с, "
+                         f"{stats['small_files']/small_time:.0f} файлов/с")
+        if stats.get('large_files'):
+            large_time = max(stats['large_time'], 1e-6)
+            lines.append(f"Остальные файлы: {stats['large_files']}, "
+                         f"{stats['large_bytes']/1024/1024:.1f} MB за {stats['large_time']:.1f} с, "
+                         f"{stats['large_bytes']/1024/1024/large_time:.1f} MB/с")
+        if stats.get('metadata_files') or stats.get('metadata_dirs'):
+            mode = (f"после копирования данных, потоков {METADATA_WORKERS}" if self.deferred_metadata
+                    else "сразу после каждого файла")
+            line = (f"Метаданные: {stats.get('metadata_files', 0)} файлов, {stats.get('metadata_dirs', 0)} папок "
+                    f"за {stats['metadata_time']:.1f} с ({mode})")
+            if stats.get('metadata_errors'):
+                line += f", ошибок {stats['metadata_errors']}"
+            lines.append(line)
+        if stats.get('sqlite_backups') or stats.get('sqlite_unchanged') or stats.get('sqlite_fallbacks'):
+            line = (f"Базы SQLite: скопировано через backup API {stats.get('sqlite_backups', 0)}, "
+                    f"без изменений {stats.get('sqlite_unchanged', 0)}, "
+                    f"пропущено файлов -wal/-shm/-journal {stats.get('sqlite_sidecars', 0)}")
+            if stats.get('sqlite_fallbacks'):
+                line += (f", скопировано как обычные файлы {stats['sqlite_fallbacks']} "
+                         f"(вместе с файлами -wal/-journal: {stats.get('sqlite_sidecars_copied', 0)})")
+            lines.append(line)
+        if stats.get('changed_retries'):
+            lines.append(f"Повторно скопировано файлов, изменившихся во время копирования: "
+                         f"{stats['changed_retries'] - len(self.inconsistent_files)} из {stats['changed_retries']}")
+        if self.inconsistent_files:
+            shown = ", ".join(self.inconsistent_files[:INCONSISTENT_REPORT_LIMIT])
+            more = len(self.inconsistent_files) - INCONSISTENT_REPORT_LIMIT
+            lines.append(f"Несогласованные копии (файл менялся при каждой попытке): {len(self.inconsistent_files)}: "
+                         f"{shown}" + (f" и еще {more}" if more > 0 else ""))
+        if stats.get('retry_attempts'):
+            lines.append(f"Повторы после временных ошибок: попыток {stats['retry_attempts']}, "
+                         f"скопировано после повтора {stats.get('retry_recovered', 0)} файлов")
+        if self.failed_files:
+            shown = "; ".join(f"{failure['source']} ({failure['error']})"
+                              for failure in self.failed_files[:FAILED_REPORT_LIMIT])
+            more = len(self.failed_files) - FAILED_REPORT_LIMIT
+            lines.append(f"Не скопировано файлов: {len(self.failed_files)}: "
+                         f"{shown}" + (f" и еще {more}" if more > 0 else ""))
+        lines.extend(self.durability_report)
+        lines.extend(self.space_report)
+        lines.extend(self.change_report)
+        if stats.get('paused_time'):
+            lines.append(f"Копирование было приостановлено на {stats['paused_time']:.0f} с")
+        if stats.get('peak_rss'):
+            lines.append(f"Пиковая память процесса: {stats['peak_rss']/1024/1024:.1f} MB")
+        return lines
+
+    def prepare_tab_destination(self, tab, tab_index):
+        """Создает папку назначения вкладки, None - вкладку пропустить"""
+        destination_folder = tab['destination']
+        if len(self.scanner.tab_sizes) > 1:
+            self.status_updated.emit(f"Копирование вкладки '{tab['name']}'...")
+
+        actual_destination = destination_folder
+        if self.create_backup_folder:
+            current_date = datetime.now().strftime("%d-%m-%Y")
+            backup_folder_name = f"Резервное копирование {current_date}"
+            actual_destination = os.path.join(destination_folder, backup_folder_name)
+            if not os.path.exists(actual_destination):
+                os.makedirs(actual_destination)
+        self.destination_roots.add(actual_destination)
+        return actual_destination
 
     def get_safe_destination_path(self, original_path, is_folder=False):
         """Создает безопасное имя для файла/папки назначения без перезаписи"""
-        if not os.path.exists(original_path):
+        if not self.path_taken(original_path):
             return original_path
             
         # Если файл/папка уже существует и включено ведение истории
@@ -187,96 +3097,291 @@ class BackupWorker(QThread):
             return f"{name}_{timestamp}{ext}"
         # Если ведение истории отключено, добавляем числовой суффикс
         else:
-            counter = 1
             name, ext = os.path.splitext(original_path)
+            # Номера перебираются с последнего выданного, если копия под ним еще на месте;
+            # номера удаленных копий ниже него заново не выдаются. Если копии под ним нет
+            # (папку меняли вне программы), перебор идет с начала, как без кэша
+            counter = self.engine_cache.last_name_number(original_path)
+            if counter is None or not self.path_taken(f"{name}_({counter}){ext}"):
+                counter = 0
             new_path = original_path
-            while os.path.exists(new_path):
-                new_path = f"{name}_({counter}){ext}"
+            # Каждый кандидат, в том числе следующий за номером из кэша, проверяется на диске
+            while self.path_taken(new_path):
                 counter += 1
+                new_path = f"{name}_({counter}){ext}"
+            self.engine_cache.remember_name_number(original_path, counter)
             return new_path
 
-    def copy_tree_safe(self, src, dst, current_count, copied_size):
-        """БЕЗОПАСНОЕ рекурсивное копирование дерева папок"""
-        names = os.listdir(src)
-        os.makedirs(dst, exist_ok=True)
-        
-        for name in names:
-            if self.cancelled:
-                return current_count, copied_size
-                
-            srcname = os.path.join(src, name)
-            dstname = os.path.join(dst, name)
-            
-            if os.path.isdir(srcname):
-                current_count, copied_size = self.copy_tree_safe(srcname, dstname, current_count, copied_size)
-            else:
-                # Безопасное именование для каждого файла
-                dstname = self.get_safe_destination_path(dstname)
-                shutil.copy2(srcname, dstname)
-                file_size = os.path.getsize(srcname)
-                copied_size += file_size
-                current_count += 1
-                
-                # Обновляем прогресс
-                self.update_progress_stats(copied_size, current_count)
-                    
-        return current_count, copied_size
+    def path_taken(self, path):
+        """Путь занят файлом на диске или файлом из еще не выполненного пакета"""
+        # lexists: битая ссылка тоже занимает имя
+        return path in self.pending_destinations or os.path.lexists(path)
 
     def update_progress_stats(self, copied_size, copied_count):
         """Обновление прогресса и статуса"""
         if self.total_size > 0:
             progress = int((copied_size / self.total_size) * 100)
+            if not self.total_exact:
+                # Пока сканирование не завершено, 100% не показываем
+                progress = min(progress, 99)
             self.progress_updated.emit(progress)
             copied_mb = copied_size / (1024 * 1024)
             total_mb = self.total_size / (1024 * 1024)
-            status_text = f"Копирование... ({copied_mb:.1f} MB / {total_mb:.1f} MB) | Файлов: {copied_count}"
+            approx = "" if self.total_exact else "~"
+            status_text = f"Копирование... ({copied_mb:.1f} MB / {approx}{total_mb:.1f} MB) | Файлов: {copied_count}"
             self.status_updated.emit(status_text)
 
-    def check_disk_space(self, required_size):
+    def space_needed(self, tab_index, entry, size, dev, inode, kind):
+        """Место под копию записи: занятые блоки разреженного файла, 0 - для повторной жесткой ссылки"""
+        if kind & ENTRY_HARDLINKED:
+            key = (self.tab_devices.get(tab_index), dev, inode)
+            if key in self.space_linked:
+                return 0
+            self.space_linked.add(key)
+        return self.scanner.manifest.allocated_size(entry, size)
+
+    def planned_bytes(self, entries):
+        """Место под копии записей плана инкрементального копирования"""
+        manifest = self.scanner.manifest
+        linked = set()
+        total = 0
+        for entry in entries:
+            root_index, rel_path, size, mtime_ns, dev, inode, kind = manifest.get(entry)
+            if kind & ENTRY_HARDLINKED:
+                if (dev, inode) in linked:
+                    continue
+                linked.add((dev, inode))
+            total += manifest.allocated_size(entry, size)
+        return total
+
+    def expected_tab_bytes(self, tab, tab_index):
+        """Сколько места еще займут копии вкладки: по плану инкрементального копирования
+        или по полному сканированию. None - объем заранее неизвестен: инкрементальное
+        копирование с конвейером узнает об изменениях, только дойдя до файла"""
+        if tab_index in self.copy_plan:
+            expected = self.planned_bytes(self.copy_plan[tab_index])
+        elif self.incremental and self.previous_snapshots[tab_index] is not None:
+            return None
+        else:
+            expected = self.scanner.tab_allocated[tab_index]
+        return max(0, expected - self.tab_space_used.get(tab_index, 0))
+
+    def record_destination_devices(self, tabs):
+        """Запоминает устройства папок назначения и их свободное место для проверок перед записью"""
+        for tab_index, tab in enumerate(tabs):
+            if tab_index in self.skipped_tabs:
+                continue
+            try:
+                device = os.stat(nearest_existing_path(tab['destination'])).st_dev
+            except OSError as e:
+                self.space_report.append(f"Не удалось определить устройство папки '{tab['destination']}': {str(e)}")
+                continue
+            self.tab_devices[tab_index] = device
+            if device in self.device_space:
+                continue
+            path = tab['destination']
+            try:
+                free_space = get_free_space(path)
+            except OSError as e:
+                self.space_report.append(f"Не удалось проверить свободное место для '{path}': {str(e)}")
+                continue
+            self.device_space[device] = {'path': path, 'free': free_space, 'written': 0,
+                                         'checked': time.monotonic()}
+
+    def preflight_free_space(self, tabs):
+        """Проверка места после сканирования с группировкой вкладок по устройству назначения.
+
+        Вкладки с общей файловой системой назначения суммируются; вкладки, которым
+        на своем устройстве уже не хватает места, пропускаются, и по каждому
+        такому устройству в отчет попадает недостающий объем. С конвейером
+        проверка выполняется, когда сканирование закончилось и часть файлов уже
+        скопирована: учитывается только оставшийся объем.
+        """
+        devices = {}
+        unknown = []
+        for tab_index, device in self.tab_devices.items():
+            if tab_index in self.skipped_tabs or device not in self.device_space:
+                continue
+            if self.expected_tab_bytes(tabs[tab_index], tab_index) is None:
+                unknown.append(tab_index)
+                continue
+            devices.setdefault(device, []).append(tab_index)
+        if unknown:
+            names = ", ".join(f"'{tabs[tab_index]['name']}'" for tab_index in unknown)
+            self.space_report.append(f"Объем изменений заранее неизвестен (копирование не дожидалось подсчета), "
+                                     f"место проверялось перед записью каждого файла: {names}")
+
+        for device, tab_indexes in devices.items():
+            space = self.device_space[device]
+            path = space['path']
+            try:
+                free_space = get_free_space(path)
+            except OSError as e:
+                self.space_report.append(f"Не удалось проверить свободное место для '{path}': {str(e)}")
+                continue
+            space.update(free=free_space, written=0, checked=time.monotonic())
+
+            available = free_space - FREE_SPACE_RESERVE
+            required = 0
+            planned = 0
+            short_tabs = []
+            for tab_index in tab_indexes:
+                expected = self.expected_tab_bytes(tabs[tab_index], tab_index)
+                required += expected
+                if planned + expected <= available:
+                    planned += expected
+                else:
+                    short_tabs.append(tab_index)
+            if short_tabs:
+                names = ", ".join(f"'{tabs[tab_index]['name']}'" for tab_index in short_tabs)
+                line = (f"Недостаточно места на устройстве с '{path}': нужно {required/1024/1024:.1f} MB, "
+                        f"свободно {free_space/1024/1024:.1f} MB, не хватает "
+                        f"{(required - available)/1024/1024:.1f} MB; пропущены вкладки: {names}")
+                self.space_report.append(line)
+                self.status_updated.emit(line)
+                self.skipped_tabs.update(short_tabs)
+
+    def ensure_free_space(self, tab_index, size):
+        """Проверяет перед записью файла, что место на устройстве не закончится.
+
+        False - остановить копирование или, для дополнительной папки назначения,
+        только копирование в нее (вкладка попадает в skipped_tabs).
+        """
+        space = self.device_space.get(self.tab_devices.get(tab_index))
+        if space is None:
+            return True
+        remaining = space['free'] - space['written']
+        if self.free_space_recheck_due(tab_index, size):
+            # Место могли занять и другие программы: перепроверяем по файловой системе
+            try:
+                space['free'] = get_free_space(space['path'])
+            except OSError:
+                return True
+            space['written'] = 0
+            space['checked'] = time.monotonic()
+            remaining = space['free']
+        if remaining - size < FREE_SPACE_RESERVE:
+            line = (f"Копирование остановлено: на устройстве с '{space['path']}' осталось "
+                    f"{remaining/1024/1024:.1f} MB, следующему файлу нужно {size/1024/1024:.1f} MB")
+            if tab_index in self.extra_destination_tabs:
+                self.skipped_tabs.add(tab_index)
+                self.space_report.append(f"{line} (дополнительная папка, остальные копируются)")
+                self.status_updated.emit(line)
+                return False
+            self.out_of_space = line
+            self.space_report.append(self.out_of_space)
+            return False
+        space['written'] += size
+        self.tab_space_used[tab_index] = self.tab_space_used.get(tab_index, 0) + size
+        return True
+
+    def free_space_recheck_due(self, tab_index, size):
+        """Нужно ли перед записью файла перечитать свободное место с файловой системы"""
+        space = self.device_space.get(self.tab_devices.get(tab_index))
+        if space is None:
+            return False
+        remaining = space['free'] - space['written']
+        return (remaining - size < FREE_SPACE_RESERVE or space['written'] >= FREE_SPACE_CHECK_BYTES
+                or time.monotonic() - space['checked'] >= FREE_SPACE_CHECK_INTERVAL)
+
+
+class BackupWorker(BackupEngineMixin, QObject):
+    progress_updated = pyqtSignal(int)
+    status_updated = pyqtSignal(str)
+    size_estimate_updated = pyqtSignal(object, bool)
+    finished_signal = pyqtSignal(bool, str)
+
+    def __init__(self, source_folders, source_files, destination_folder, 
+                 copy_folder_contents, keep_history, create_backup_folder,
+                 rate_limit=0, files_rate_limit=0, extra_destinations=(), **engine_options):
+        super().__init__()
+        self.source_folders = source_folders
+        self.source_files = source_files
+        self.destination_folder = destination_folder
+        self.extra_destinations = extra_destinations
+        self.copy_folder_contents = copy_folder_contents
+        self.keep_history = keep_history
+        self.create_backup_folder = create_backup_folder
+        self.rate_limit = rate_limit
+        self.files_rate_limit = files_rate_limit
+        self.cancelled = False
+        self.init_engine(**engine_options)
+
+    def cancel(self):
+        self.cancelled = True
+        if self.scanner:
+            self.scanner.cancel()
+
+    def run(self):
         try:
-            if hasattr(os, 'statvfs'):
-                stat = os.statvfs(self.destination_folder)
-                free_space = stat.f_bavail * stat.f_frsize
-            else:
-                import ctypes
-                free_bytes = ctypes.c_ulonglong(0)
-                ctypes.windll.kernel32.GetDiskFreeSpaceExW(
-                    ctypes.c_wchar_p(self.destination_folder), 
-                    None, None, ctypes.pointer(free_bytes)
-                )
-                free_space = free_bytes.value
+            success, message = self.perform_backup_safe()
+            self.finished_signal.emit(success, message)
             
-            return free_space >= required_size
-        except:
-            return True
+        except Exception as e:
+            self.finished_signal.emit(False, f"Ошибка: {str(e)}")
+
+    def perform_backup_safe(self):
+        """БЕЗОПАСНОЕ выполнение резервного копирования БЕЗ удаления каких-либо файлов"""
+        if self.cancelled:
+            return False, "Операция отменена"
+
+        try:
+            tab = {
+                'name': os.path.basename(self.destination_folder),
+                'folders': self.source_folders,
+                'files': self.source_files,
+                'destination': self.destination_folder,
+                'extra_destinations': self.extra_destinations,
+                'size': self.estimated_size,
+                'rate_limit': self.rate_limit,
+                'files_rate_limit': self.files_rate_limit
+            }
+            copied_count, copied_size = self.copy_tabs([tab])
+
+            if self.cancelled:
+                return False, "Операция отменена"
+            if self.out_of_space:
+                return False, self.out_of_space
+            if self.skipped_tabs:
+                return False, "Недостаточно свободного места"
+            if self.failed_files:
+                return False, f"Скопировано {copied_count} файлов, не скопировано: {len(self.failed_files)}"
+            if self.inconsistent_files:
+                return False, (f"Скопировано {copied_count} файлов, изменялись во время копирования: "
+                               f"{len(self.inconsistent_files)}")
+            if self.scanner.scanned_count == 0:
+                return False, "Нет файлов для копирования"
+
+            return True, f"Успешно скопировано {copied_count} файлов"
+
+        except Exception as e:
+            return False, f"Критическая ошибка: {str(e)}"
 
-class MultiTabBackupWorker(QThread):
+
+class MultiTabBackupWorker(BackupEngineMixin, QObject):
     progress_updated = pyqtSignal(int)
     status_updated = pyqtSignal(str)
+    size_estimate_updated = pyqtSignal(object, bool)
     finished_signal = pyqtSignal(bool, str)
 
-    def __init__(self, tabs_data, copy_folder_contents, keep_history, create_backup_folder):
+    def __init__(self, tabs_data, copy_folder_contents, keep_history, create_backup_folder,
+                 **engine_options):
         super().__init__()
         self.tabs_data = tabs_data  # Список словарей с данными каждой вкладки
         self.copy_folder_contents = copy_folder_contents
         self.keep_history = keep_history
         self.create_backup_folder = create_backup_folder
         self.cancelled = False
-        self.total_size = 0
+        self.init_engine(**engine_options)
 
     def cancel(self):
         self.cancelled = True
+        if self.scanner:
+            self.scanner.cancel()
 
     def run(self):
         try:
-            if self.total_size == 0:
-                self.total_size = self.calculate_total_backup_size()
-            
-            if self.total_size == 0:
-                self.finished_signal.emit(False, "Нет файлов для копирования")
-                return
-                
-            self.status_updated.emit(f"Начинаем копирование из {len(self.tabs_data)} вкладок ({self.total_size/1024/1024:.1f} MB)")
+            self.status_updated.emit(f"Начинаем копирование из {len(self.tabs_data)} вкладок")
             
             success, message = self.perform_multi_tab_backup()
             self.finished_signal.emit(success, message)
@@ -284,221 +3389,672 @@ class MultiTabBackupWorker(QThread):
         except Exception as e:
             self.finished_signal.emit(False, f"Ошибка: {str(e)}")
 
-    def calculate_total_backup_size(self):
-        """Вычисляет общий размер всех файлов из всех вкладок"""
-        total_size = 0
-        for tab in self.tabs_data:
-            for folder_path in tab['folders']:
-                if os.path.isdir(folder_path) and not self.cancelled:
-                    try:
-                        for root, dirs, files in os.walk(folder_path):
-                            for file in files:
-                                if self.cancelled:
-                                    return total_size
-                                file_path = os.path.join(root, file)
-                                if os.path.exists(file_path):
-                                    total_size += os.path.getsize(file_path)
-                    except OSError:
-                        continue
-            
-            for file_path in tab['files']:
-                if not self.cancelled and os.path.isfile(file_path) and os.path.exists(file_path):
-                    total_size += os.path.getsize(file_path)
-        
-        return total_size
+    def perform_multi_tab_backup(self):
+        """Выполняет резервное копирование для всех вкладок с их папками назначения"""
+        if self.cancelled:
+            return False, "Операция отменена"
+
+        try:
+            copied_count, copied_size = self.copy_tabs(self.tabs_data)
+
+            if self.cancelled:
+                return False, "Операция отменена"
+            if self.out_of_space:
+                return False, self.out_of_space
+            if self.scanner.scanned_count == 0:
+                return False, "Нет файлов для копирования"
+            if self.skipped_tabs:
+                return False, (f"Скопировано {copied_count} файлов, пропущено вкладок из-за нехватки места: "
+                               f"{len(self.skipped_tabs)}")
+            if self.failed_files:
+                return False, f"Скопировано {copied_count} файлов, не скопировано: {len(self.failed_files)}"
+            if self.inconsistent_files:
+                return False, (f"Скопировано {copied_count} файлов, изменялись во время копирования: "
+                               f"{len(self.inconsistent_files)}")
+
+            return True, f"Успешно скопировано {copied_count} файлов из {len(self.tabs_data)} вкладок"
+
+        except Exception as e:
+            return False, f"Критическая ошибка: {str(e)}"
+
+
+class RetryFailedWorker(BackupEngineMixin, QObject):
+    """Повторно копирует только файлы, не скопированные прошлым заданием, без сканирования источников.
+
+    Файлы копируются по тем же путям назначения; снимки вкладок не меняются,
+    поэтому при инкрементальном копировании эти файлы будут сверены снова.
+    """
+    progress_updated = pyqtSignal(int)
+    status_updated = pyqtSignal(str)
+    size_estimate_updated = pyqtSignal(object, bool)
+    finished_signal = pyqtSignal(bool, str)
+
+    def __init__(self, failures, **engine_options):
+        super().__init__()
+        self.failures = failures  # Записи failed_files прошлого задания
+        self.copy_folder_contents = False
+        self.keep_history = False
+        self.create_backup_folder = False
+        self.cancelled = False
+        self.init_engine(**engine_options)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        try:
+            success, message = self.perform_retry()
+            self.finished_signal.emit(success, message)
+
+        except Exception as e:
+            self.finished_signal.emit(False, f"Ошибка: {str(e)}")
+
+    def perform_retry(self):
+        """Копирует файлы из списка неудавшихся, возвращает (успех, сообщение)"""
+        self.status_updated.emit(f"Повтор копирования неудавшихся файлов: {len(self.failures)}")
+        tasks = []
+        for entry, failure in enumerate(self.failures):
+            task = dict(failure, entry=entry, dev=0, inode=0, mtime_ns=0)
+            task.pop('attempts', None)
+            task.pop('error', None)
+            try:
+                # Размер и время изменения берутся заново: файл мог измениться после прошлого запуска
+                if task['kind'] & ENTRY_SYMLINK:
+                    stat_result = os.lstat(task['source'])
+                    if os.path.lexists(task['dest']):
+                        os.remove(task['dest'])
+                else:
+                    stat_result = os.stat(task['source'])
+            except OSError as e:
+                self.finish_copy_task(task, e)
+                continue
+            task.update(dev=stat_result.st_dev, inode=stat_result.st_ino, size=stat_result.st_size,
+                        mtime_ns=stat_result.st_mtime_ns)
+            tasks.append(task)
+        self.total_size = sum(task['size'] for task in tasks)
+        self.total_exact = True
+        self.size_estimate_updated.emit(self.total_size, True)
+
+        tab_count = max((task['tab'] for task in self.failures), default=-1) + 1
+        self.tab_rate_limiters = [None] * tab_count
+        tab_destinations = {task['tab']: os.path.dirname(task['dest']) for task in tasks}
+        tasks.sort(key=lambda task: task['tab'])
+        try:
+            for start in range(0, len(tasks), COPY_BATCH_SIZE):
+                if self.cancelled:
+                    self.failed_entries.update(task['entry'] for task in tasks[start:])
+                    break
+                batch = tasks[start:start + COPY_BATCH_SIZE]
+                for tab_index in sorted({task['tab'] for task in batch}):
+                    self.flush_copy_batch([task for task in batch if task['tab'] == tab_index])
+            self.process_retry_queue(wait=True)
+            self.retry_changed_files()
+            self.process_retry_queue(wait=True)
+            self.apply_deferred_metadata()
+            self.durability_barrier(tab_destinations)
+        finally:
+            self.release_copy_resources()
+        self.stats['copied_files'], self.stats['copied_bytes'] = self.copied_count, self.copied_size
 
-    def perform_multi_tab_backup(self):
-        """Выполняет резервное копирование для всех вкладок с их папками назначения"""
         if self.cancelled:
             return False, "Операция отменена"
+        if self.out_of_space:
+            return False, self.out_of_space
+        if self.failed_files:
+            return False, f"Скопировано {self.copied_count} файлов, не скопировано: {len(self.failed_files)}"
+        if self.inconsistent_files:
+            return False, (f"Скопировано {self.copied_count} файлов, изменялись во время копирования: "
+                           f"{len(self.inconsistent_files)}")
+        return True, f"Успешно скопировано {self.copied_count} ранее неудавшихся файлов"
 
-        try:
-            copied_count = 0
-            copied_size = 0
-            total_files = 0
 
-            # Проходим по каждой вкладке
-            for i, tab in enumerate(self.tabs_data):
-                if self.cancelled:
-                    return False, "Операция отменена"
-                
-                tab_name = tab['name']
-                destination_folder = tab['destination']
-                source_folders = tab['folders']
-                source_files = tab['files']
+class BackupEngineService:
+    """Долгоживущие потоки, которые выполняют задания копирования одно за другим.
 
-                self.status_updated.emit(f"Копирование вкладки '{tab_name}'...")
+    Задание (BackupWorker и подобные) передается свободному потоку службы;
+    новый поток создается, только если все заняты, поэтому потоков столько,
+    сколько заданий когда-либо выполнялось одновременно. Пулы копирования
+    и метаданных принадлежат потоку службы и переходят от задания к заданию.
+    """
 
-                # Проверяем место на диске для этой папки назначения
-                if not self.check_disk_space(destination_folder, tab['size']):
-                    self.status_updated.emit(f"Недостаточно места для вкладки '{tab_name}'")
-                    continue
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.threads = []
+        self.idle = 0
+        self.lock = threading.Lock()
+
+    def submit(self, worker):
+        """Запускает worker.run() в свободном потоке службы"""
+        with self.lock:
+            # Каждое задание занимает свободный поток или получает новый
+            if self.idle:
+                self.idle -= 1
+            else:
+                thread = threading.Thread(target=self.run_thread, daemon=True,
+                                          name=f"backup-engine-{len(self.threads) + 1}")
+                self.threads.append(thread)
+                thread.start()
+        self.jobs.put(worker)
+
+    def run_thread(self):
+        pools = {}
+        while True:
+            worker = self.jobs.get()
+            worker.use_thread_pools(pools)
+            try:
+                worker.run()
+            finally:
+                worker.done.set()
+                # Задание не должно жить в потоке до прихода следующего
+                del worker
+            with self.lock:
+                self.idle += 1
+
+
+# Периоды расписания; значения хранятся в настройках как есть
+SCHEDULE_PERIODS = ["Ежедневно", "Еженедельно", "Ежемесячно", "Ежечасно", "Cron"]
+# Вкладка без собственного расписания копируется по общему
+TAB_SCHEDULE_GLOBAL = "Общее расписание"
+
+
+class CronExpression:
+    """Выражение cron из пяти полей: минута, час, день месяца, месяц, день недели.
+
+    Поддерживаются *, списки через запятую, диапазоны a-b и шаг /n.
+    День недели 0-7, где 0 и 7 - воскресенье. Если ограничены и день месяца,
+    и день недели, подходит любой из них, как в классическом cron. Поле дня,
+    начинающееся с * (в том числе */n), считается неограниченным, как в Vixie cron.
+    """
+
+    FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expression):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError("ожидается 5 полей: минута час день месяц день_недели")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            self.parse_field(part, low, high) for part, (low, high) in zip(parts, self.FIELDS)
+        )
+        # В cron 0 - воскресенье, у datetime.weekday() 0 - понедельник
+        self.weekdays = {(day - 1) % 7 for day in weekdays}
+        self.any_day = parts[2].startswith('*')
+        self.any_weekday = parts[4].startswith('*')
+
+    @staticmethod
+    def parse_field(field, low, high):
+        values = set()
+        for item in field.split(','):
+            step = 1
+            if '/' in item:
+                item, step_text = item.split('/', 1)
+                step = int(step_text)
+                if step < 1:
+                    raise ValueError(f"неверный шаг {step_text}")
+            if item == '*':
+                start, end = low, high
+            elif '-' in item:
+                start, end = (int(value) for value in item.split('-', 1))
+            else:
+                start = int(item)
+                end = high if step > 1 else start
+            if not low <= start <= end <= high:
+                raise ValueError(f"значение {item} вне диапазона {low}-{high}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def day_matches(self, moment):
+        day_ok = moment.day in self.days
+        weekday_ok = moment.weekday() in self.weekdays
+        if self.any_day:
+            return weekday_ok
+        if self.any_weekday:
+            return day_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, moment):
+        """Ближайшее время срабатывания строго после moment"""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 5)
+        while candidate < limit:
+            # Несовпавшее поле пропускается целиком: месяц, день, час
+            if candidate.month not in self.months:
+                candidate = (candidate.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self.day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError("выражение никогда не срабатывает")
 
-                actual_destination = destination_folder
-                if self.create_backup_folder:
-                    current_date = datetime.now().strftime("%d-%m-%Y")
-                    backup_folder_name = f"Резервное копирование {current_date}"
-                    actual_destination = os.path.join(destination_folder, backup_folder_name)
-                    if not os.path.exists(actual_destination):
-                        os.makedirs(actual_destination)
 
-                # Копируем папки для этой вкладки
-                for folder_path in source_folders:
-                    if self.cancelled:
-                        return False, "Операция отменена"
-                        
-                    if not os.path.exists(folder_path):
-                        continue
+def next_schedule_time(schedule, now):
+    """Время следующего копирования по расписанию строго после now.
 
-                    try:
-                        if self.copy_folder_contents:
-                            # Копирование содержимого папки
-                            for root, dirs, files in os.walk(folder_path):
-                                for file in files:
-                                    if self.cancelled:
-                                        return False, "Операция отменена"
-                                        
-                                    source_file_path = os.path.join(root, file)
-                                    rel_path = os.path.relpath(source_file_path, folder_path)
-                                    dest_file_path = os.path.join(actual_destination, rel_path)
-                                    
-                                    # Создаем папки назначения
-                                    os.makedirs(os.path.dirname(dest_file_path), exist_ok=True)
-                                    
-                                    # Безопасное именование файлов
-                                    dest_file_path = self.get_safe_destination_path(dest_file_path)
-                                    
-                                    # Копируем файл
-                                    shutil.copy2(source_file_path, dest_file_path)
-                                    file_size = os.path.getsize(source_file_path)
-                                    copied_size += file_size
-                                    copied_count += 1
-                                    
-                                    # Обновляем прогресс
-                                    self.update_progress_stats(copied_size, copied_count)
-                                    
-                        else:
-                            # Копирование всей папки
-                            folder_name = os.path.basename(folder_path)
-                            dest_folder_path = os.path.join(actual_destination, folder_name)
-                            
-                            # Безопасное именование папки назначения
-                            dest_folder_path = self.get_safe_destination_path(dest_folder_path, is_folder=True)
-                            
-                            # Копируем всю папку
-                            copied_count, copied_size = self.copy_tree_safe(
-                                folder_path, dest_folder_path, copied_count, copied_size
-                            )
-                            
-                    except Exception as e:
-                        self.status_updated.emit(f"Ошибка при копировании папки {folder_path}: {str(e)}")
-
-                # Копируем отдельные файлы для этой вкладки
-                for file_path in source_files:
-                    if self.cancelled:
-                        return False, "Операция отменена"
-                        
-                    if not os.path.exists(file_path):
-                        continue
+    schedule - словарь: period (один из SCHEDULE_PERIODS), hour и minute,
+    weekday (0 - понедельник), monthday и cron для периода Cron.
+    """
+    period = schedule['period']
+    if period == "Cron":
+        return CronExpression(schedule['cron']).next_after(now)
 
-                    try:
-                        dest_file_path = os.path.join(actual_destination, os.path.basename(file_path))
-                        
-                        # Безопасное именование файла
-                        dest_file_path = self.get_safe_destination_path(dest_file_path)
-                        
-                        # Копируем файл
-                        shutil.copy2(file_path, dest_file_path)
-                        file_size = os.path.getsize(file_path)
-                        copied_size += file_size
-                        copied_count += 1
-                        
-                        # Обновляем прогресс
-                        self.update_progress_stats(copied_size, copied_count)
-                        
-                    except Exception as e:
-                        self.status_updated.emit(f"Ошибка при копировании файла {file_path}: {str(e)}")
+    if period == "Ежечасно":
+        next_time = now.replace(minute=schedule['minute'], second=0, microsecond=0)
+        if next_time <= now:
+            next_time += timedelta(hours=1)
+        return next_time
 
-            return True, f"Успешно скопировано {copied_count} файлов из {len(self.tabs_data)} вкладок"
+    at_time = now.replace(hour=schedule['hour'], minute=schedule['minute'], second=0, microsecond=0)
+    if period == "Еженедельно":
+        next_time = at_time + timedelta(days=(schedule['weekday'] - now.weekday()) % 7)
+        if next_time <= now:
+            next_time += timedelta(days=7)
+        return next_time
 
-        except Exception as e:
-            return False, f"Критическая ошибка: {str(e)}"
+    if period == "Ежемесячно":
+        # День, которого нет в месяце, заменяется последним днем месяца
+        year, month = now.year, now.month
+        while True:
+            day = min(schedule['monthday'], calendar.monthrange(year, month)[1])
+            next_time = datetime(year, month, day, schedule['hour'], schedule['minute'])
+            if next_time > now:
+                return next_time
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
 
-    def get_safe_destination_path(self, original_path, is_folder=False):
-        """Создает безопасное имя для файла/папки назначения без перезаписи"""
-        if not os.path.exists(original_path):
-            return original_path
-            
-        # Если файл/папка уже существует и включено ведение истории
-        if self.keep_history:
-            name, ext = os.path.splitext(original_path)
-            timestamp = datetime.now().strftime("%d.%m.%Y_%H-%M-%S")
-            return f"{name}_{timestamp}{ext}"
-        # Если ведение истории отключено, добавляем числовой суффикс
-        else:
-            counter = 1
-            name, ext = os.path.splitext(original_path)
-            new_path = original_path
-            while os.path.exists(new_path):
-                new_path = f"{name}_({counter}){ext}"
-                counter += 1
-            return new_path
+    next_time = at_time
+    if next_time <= now:
+        next_time += timedelta(days=1)
+    return next_time
 
-    def copy_tree_safe(self, src, dst, current_count, copied_size):
-        """Безопасное рекурсивное копирование дерева папок"""
-        names = os.listdir(src)
-        os.makedirs(dst, exist_ok=True)
-        
-        for name in names:
-            if self.cancelled:
-                return current_count, copied_size
-                
-            srcname = os.path.join(src, name)
-            dstname = os.path.join(dst, name)
-            
-            if os.path.isdir(srcname):
-                current_count, copied_size = self.copy_tree_safe(srcname, dstname, current_count, copied_size)
-            else:
-                # Безопасное именование для каждого файла
-                dstname = self.get_safe_destination_path(dstname)
-                shutil.copy2(srcname, dstname)
-                file_size = os.path.getsize(srcname)
-                copied_size += file_size
-                current_count += 1
-                
-                # Обновляем прогресс
-                self.update_progress_stats(copied_size, current_count)
-                    
-        return current_count, copied_size
 
-    def update_progress_stats(self, copied_size, copied_count):
-        """Обновление прогресса и статуса"""
-        if self.total_size > 0:
-            progress = int((copied_size / self.total_size) * 100)
-            self.progress_updated.emit(progress)
-            copied_mb = copied_size / (1024 * 1024)
-            total_mb = self.total_size / (1024 * 1024)
-            status_text = f"Копирование... ({copied_mb:.1f} MB / {total_mb:.1f} MB) | Файлов: {copied_count}"
-            self.status_updated.emit(status_text)
+class TimelineScheduler:
+    """Общий планировщик расписаний: куча ближайших времен срабатывания.
+
+    Проверка по таймеру смотрит только на вершину кучи, поэтому ее стоимость
+    не растет с числом расписаний. Замененные и удаленные записи остаются
+    в куче и отбрасываются при извлечении.
+    """
+
+    def __init__(self):
+        self.heap = []
+        # ключ -> (время срабатывания, расписание, номер записи в куче)
+        self.entries = {}
+        self.counter = 0
+
+    def set(self, key, schedule, now=None):
+        """Добавляет или заменяет расписание, возвращает время следующего срабатывания"""
+        fire_time = next_schedule_time(schedule, now or datetime.now())
+        self.counter += 1
+        self.entries[key] = (fire_time, schedule, self.counter)
+        heapq.heappush(self.heap, (fire_time, self.counter, key))
+        if len(self.heap) > 2 * len(self.entries) + 16:
+            # Слишком много устаревших записей: пересобираем кучу
+            self.heap = [(entry[0], entry[2], entry_key) for entry_key, entry in self.entries.items()]
+            heapq.heapify(self.heap)
+        return fire_time
+
+    def remove(self, key):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.heap.clear()
+        self.entries.clear()
+
+    def peek(self):
+        """(время, ключ) ближайшего срабатывания, None - расписаний нет"""
+        while self.heap:
+            fire_time, number, key = self.heap[0]
+            entry = self.entries.get(key)
+            if entry is not None and entry[2] == number:
+                return fire_time, key
+            heapq.heappop(self.heap)
+        return None
+
+    def pop_due(self, now=None):
+        """Ключи наступивших расписаний; каждое переносится на следующее время после now"""
+        now = now or datetime.now()
+        due = []
+        while True:
+            top = self.peek()
+            if top is None or top[0] > now:
+                return due
+            key = top[1]
+            due.append(key)
+            try:
+                self.set(key, self.entries[key][1], now)
+            except ValueError:
+                self.remove(key)
+
+
+JOB_PRIORITY_MANUAL = 0
+JOB_PRIORITY_SCHEDULED = 1
+JOB_HISTORY_SIZE = 50
+
+
+class BackupJobQueue:
+    """Очередь заданий резервного копирования.
+
+    Задания выбираются по приоритету, при равном приоритете - в порядке
+    постановки. Одновременно выполняется не больше max_running заданий,
+    и в одну папку назначения пишет не больше одного задания; вложенные друг
+    в друга папки назначения считаются одной.
+    """
+
+    STATE_LABELS = {
+        'queued': "В очереди",
+        'running': "Выполняется",
+        'finished': "Завершено",
+        'failed': "Ошибка",
+        'cancelled': "Отменено"
+    }
+
+    def __init__(self, max_running=1):
+        self.max_running = max_running
+        self.pending = []
+        self.running = []
+        self.history = []
+        self.next_id = 1
+
+    @staticmethod
+    def destination_key(path):
+        return os.path.normcase(os.path.realpath(path))
+
+    @staticmethod
+    def destinations_conflict(keys, other_keys):
+        """Совпадает ли одна из папок с другой или лежит внутри нее"""
+        def inside(path, parent):
+            return path == parent or path.startswith(parent.rstrip(os.sep) + os.sep)
+
+        return any(inside(key, other) or inside(other, key) for key in keys for other in other_keys)
+
+    def submit(self, job):
+        """Ставит задание в очередь, False - такое же задание уже ожидает запуска"""
+        key = job.get('key')
+        if key is not None and any(queued.get('key') == key for queued in self.pending):
+            return False
+        job.update({
+            'id': self.next_id,
+            'state': 'queued',
+            'created': datetime.now(),
+            'started': None,
+            'finished': None,
+            'message': '',
+            'progress': 0,
+            'worker': None,
+            'destination_keys': {self.destination_key(path) for path in job['destinations']}
+        })
+        self.next_id += 1
+        self.pending.append(job)
+        return True
+
+    def next_ready(self):
+        """Снимает с очереди задание, которое можно запустить сейчас, None - такого нет"""
+        if len(self.running) >= self.max_running:
+            return None
+        busy = set()
+        for job in self.running:
+            busy |= job['destination_keys']
+        for job in sorted(self.pending, key=lambda job: (job['priority'], job['id'])):
+            if self.destinations_conflict(job['destination_keys'], busy):
+                continue
+            self.pending.remove(job)
+            job['state'] = 'running'
+            job['started'] = datetime.now()
+            self.running.append(job)
+            return job
+        return None
 
-    def check_disk_space(self, destination_folder, required_size):
-        """Проверяет свободное место на диске"""
+    def finish(self, job, state, message):
+        """Переносит задание в историю с итоговым состоянием"""
+        if job in self.running:
+            self.running.remove(job)
+        elif job in self.pending:
+            self.pending.remove(job)
+        job['state'] = state
+        job['message'] = message
+        job['finished'] = datetime.now()
+        self.history.append(job)
+        del self.history[:-JOB_HISTORY_SIZE]
+
+    def cancel_queued(self):
+        """Отменяет все ожидающие задания, возвращает их количество"""
+        cancelled = list(self.pending)
+        for job in cancelled:
+            self.finish(job, 'cancelled', "Отменено до запуска")
+        return len(cancelled)
+
+    def find(self, job_id):
+        for job in self.running + self.pending + self.history:
+            if job['id'] == job_id:
+                return job
+        return None
+
+    def jobs(self):
+        """Все задания для отображения: выполняемые, ожидающие, затем завершенные от новых к старым"""
+        pending = sorted(self.pending, key=lambda job: (job['priority'], job['id']))
+        return self.running + pending + self.history[::-1]
+
+    def describe(self, job):
+        """Строка задания для списка заданий"""
+        text = f"{self.STATE_LABELS[job['state']]}: {job['name']}"
+        if job['state'] == 'running':
+            text += f" ({job['progress']}%)"
+        elif job['finished'] and job['started']:
+            duration = (job['finished'] - job['started']).total_seconds()
+            text += f" - {job['message']}"
+            if job.get('copied_bytes'):
+                text += f", {job['copied_bytes']/1024/1024:.1f} MB"
+            text += f", {duration:.0f} с"
+        elif job['message']:
+            text += f" - {job['message']}"
+        return text
+
+
+# Изменения настроек, сделанные за это время (мс), записываются на диск одним разом
+SETTINGS_SAVE_DELAY = 500
+# После неудачной записи настройки записываются снова через паузу (мс), растущую вдвое до предела
+SETTINGS_RETRY_DELAY = 2000
+SETTINGS_RETRY_MAX_DELAY = 60000
+
+
+def settings_disk_form(value):
+    """Значение в том виде, в каком QSettings вернет его после записи в INI и чтения"""
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, (list, tuple)):
+        # Пустой список хранится как @Invalid(), список из одной строки - как строка
+        if not value:
+            return None
+        if len(value) == 1:
+            return settings_disk_form(value[0])
+        return [settings_disk_form(item) for item in value]
+    return value
+
+
+class SettingsStore(QObject):
+    """Настройки приложения в памяти с отложенной записью в INI-файл.
+
+    Повторяет используемую приложением часть интерфейса QSettings. Файл
+    читается один раз при создании. Изменения отмечают ключи измененными
+    и откладывают запись на SETTINGS_SAVE_DELAY, поэтому серия изменений
+    уходит на диск одной записью, а запись без действительных изменений не
+    выполняется. Файл пишет фоновый поток: копия настроек сохраняется через
+    QSettings во временный файл, который затем заменяет основной. Неудавшаяся
+    запись повторяется с растущей паузой, даже если настройки больше не менялись.
+    """
+
+    # Запись закончилась: True - успешно (испускается потоком записи)
+    write_finished = pyqtSignal(bool)
+
+    MISSING = object()
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.values = {}
+        source = QSettings(path, QSettings.IniFormat)
+        source.setIniCodec("UTF-8")
+        for key in source.allKeys():
+            self.values[key] = source.value(key)
+        # Значения, последними переданные на запись, и ключи, измененные после этого
+        self.saved = dict(self.values)
+        self.dirty = set()
+        self.groups = []
+        self.pending = None
+        self.version = 0
+        self.written_version = 0
+        # Результат последней записи: поток записи только сообщает его, saved меняет поток интерфейса
+        self.write_failed = False
+        self.writer = None
+        self.condition = threading.Condition()
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.start_write)
+        self.retry_delay = SETTINGS_RETRY_DELAY
+        self.write_finished.connect(self.on_write_finished)
+
+    def full_key(self, key):
+        return "/".join(self.groups + [key])
+
+    def beginGroup(self, prefix):
+        self.groups.append(prefix)
+
+    def endGroup(self):
+        self.groups.pop()
+
+    def value(self, key, default=None, type=None):
+        value = self.values.get(self.full_key(key), self.MISSING)
+        if value is self.MISSING:
+            value = default
+        if type is None:
+            return value
+        if type is bool and isinstance(value, str):
+            return value.strip().lower() not in ('', 'false', '0')
         try:
-            if hasattr(os, 'statvfs'):
-                stat = os.statvfs(destination_folder)
-                free_space = stat.f_bavail * stat.f_frsize
-            else:
-                import ctypes
-                free_bytes = ctypes.c_ulonglong(0)
-                ctypes.windll.kernel32.GetDiskFreeSpaceExW(
-                    ctypes.c_wchar_p(destination_folder), 
-                    None, None, ctypes.pointer(free_bytes)
-                )
-                free_space = free_bytes.value
-            
-            return free_space >= required_size
-        except:
-            return True  # Если не удалось проверить, продолжаем
+            return type(value)
+        except (TypeError, ValueError):
+            return type(default) if default is not None else type()
+
+    def setValue(self, key, value):
+        if isinstance(value, (list, tuple)):
+            # Списки вкладок меняются на месте, хранится своя копия
+            value = list(value)
+        key = self.full_key(key)
+        self.values[key] = value
+        self.mark_dirty(key)
+
+    def remove(self, key):
+        """Удаляет ключ или группу со всеми ключами"""
+        key = self.full_key(key)
+        for name in [name for name in self.values if name == key or name.startswith(key + "/")]:
+            del self.values[name]
+            self.mark_dirty(name)
+
+    def allKeys(self):
+        prefix = self.full_key("") if self.groups else ""
+        return [key[len(prefix):] for key in self.values if key.startswith(prefix)]
+
+    def clear(self):
+        for key in list(self.values):
+            self.mark_dirty(key)
+        self.values.clear()
+
+    def mark_dirty(self, key):
+        self.dirty.add(key)
+        # Каждое изменение откладывает запись, пока изменения не прекратятся
+        self.timer.start(SETTINGS_SAVE_DELAY)
+
+    def sync(self):
+        """Записывает изменения после паузы в изменениях, не дожидаясь записи"""
+        if self.dirty:
+            self.timer.start(SETTINGS_SAVE_DELAY)
+
+    def start_write(self):
+        """Передает фоновому потоку копию настроек, если с прошлой записи что-то изменилось"""
+        with self.condition:
+            failed, self.write_failed = self.write_failed, False
+        if failed:
+            # Последняя запись не удалась: файл на диске устарел, записываются все настройки
+            self.saved = {}
+        changed = {key for key in self.dirty
+                   if settings_disk_form(self.values.get(key, self.MISSING))
+                   != settings_disk_form(self.saved.get(key, self.MISSING))}
+        self.dirty.clear()
+        if not changed and not failed:
+            return
+        snapshot = dict(self.values)
+        self.saved = snapshot
+        with self.condition:
+            self.pending = snapshot
+            self.version += 1
+            if self.writer is None:
+                self.writer = threading.Thread(target=self.run_writer, daemon=True, name="settings-writer")
+                self.writer.start()
+            self.condition.notify_all()
+
+    def flush(self, timeout=None):
+        """Записывает изменения сразу и ждет окончания записи (при закрытии приложения).
+
+        Возвращает False, если запись не закончилась за timeout или не удалась.
+        """
+        self.timer.stop()
+        self.start_write()
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.written_version == self.version, timeout):
+                return False
+            return not self.write_failed
+
+    def run_writer(self):
+        while True:
+            with self.condition:
+                while self.pending is None:
+                    self.condition.wait()
+                # Пока писалась прошлая копия, могло накопиться несколько: пишется последняя
+                snapshot, version, self.pending = self.pending, self.version, None
+            try:
+                self.write_file(snapshot)
+                failed = False
+            except Exception:
+                # Следующая запись повторит все настройки (см. start_write)
+                failed = True
+            with self.condition:
+                self.written_version = version
+                self.write_failed = failed
+                self.condition.notify_all()
+            self.write_finished.emit(not failed)
+
+    def on_write_finished(self, success):
+        """Планирует повтор неудавшейся записи (в потоке интерфейса)"""
+        if success:
+            self.retry_delay = SETTINGS_RETRY_DELAY
+            return
+        if not self.timer.isActive():
+            self.timer.start(self.retry_delay)
+        self.retry_delay = min(self.retry_delay * 2, SETTINGS_RETRY_MAX_DELAY)
+
+    def write_file(self, snapshot):
+        """Пишет настройки во временный файл и заменяет им файл настроек"""
+        temp_path = self.path + ".tmp"
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        settings = QSettings(temp_path, QSettings.IniFormat)
+        settings.setIniCodec("UTF-8")
+        for key, value in snapshot.items():
+            settings.setValue(key, value)
+        settings.sync()
+        status = settings.status()
+        del settings
+        if status != QSettings.NoError:
+            raise OSError(errno.EIO, "не удалось записать настройки", temp_path)
+        with open(temp_path, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
 
 class BackupApp(QMainWindow):
     def __init__(self):
@@ -532,6 +4088,7 @@ class BackupApp(QMainWindow):
         if not os.path.exists(config_dir):
             os.makedirs(config_dir, exist_ok=True)
         
+        self.config_dir = config_dir
         settings_path = os.path.join(config_dir, "settings.ini")
         
         # КОПИРУЕМ ДЕФОЛТНЫЕ НАСТРОЙКИ ПРИ ПЕРВОМ ЗАПУСКЕ
@@ -549,12 +4106,19 @@ class BackupApp(QMainWindow):
             self.log_message(f"Используется существующий файл настроек: {settings_path}")
         
         # Инициализация настроек приложения
-        self.settings = QSettings(settings_path, QSettings.IniFormat)
-        self.settings.setIniCodec("UTF-8")
+        # Настройки читаются один раз, изменения пишутся на диск в фоне
+        self.settings = SettingsStore(settings_path)
+        self.settings.write_finished.connect(self.on_settings_written)
 
         # Инициализация переменных для хранения данных
+        # Общий планировщик: общее расписание и собственные расписания вкладок
+        self.scheduler = TimelineScheduler()
         self.backup_timer = QTimer()
         self.backup_timer.timeout.connect(self.check_backup_time)
+        # Проверка часов занятости для автоматической паузы копирования
+        self.busy_hours_timer = QTimer()
+        self.busy_hours_timer.timeout.connect(self.check_busy_hours)
+        self.busy_hours_timer.start(30000)
         # Переменные для отслеживания состояния копирования
         self.last_backup_date = None
         self.current_backup_size = 0  
@@ -562,7 +4126,11 @@ class BackupApp(QMainWindow):
         
         # Загрузка сохраненных настроек
         self.load_settings()
-        self.backup_worker = None
+        # Очередь заданий копирования и задание, прогресс которого показан в статус баре
+        self.job_queue = BackupJobQueue(self.max_jobs_spin.value())
+        # Потоки копирования создаются один раз и переиспользуются заданиями
+        self.backup_service = BackupEngineService()
+        self.displayed_job = None
         
     def init_ui(self):
         """Инициализация пользовательского интерфейса"""
@@ -626,10 +4194,16 @@ class BackupApp(QMainWindow):
         self.cancel_btn.clicked.connect(self.cancel_backup)
         self.cancel_btn.setStyleSheet("background-color: #FF9800; color: white;")
         self.cancel_btn.setVisible(False)  
+
+        self.pause_btn = QPushButton("Пауза")
+        self.pause_btn.clicked.connect(self.toggle_pause_backup)
+        self.pause_btn.setStyleSheet("background-color: #9E9E9E; color: white;")
+        self.pause_btn.setVisible(False)
         
         button_layout.addWidget(self.start_btn)
         button_layout.addWidget(self.stop_btn)
         button_layout.addWidget(self.manual_btn)
+        button_layout.addWidget(self.pause_btn)
         button_layout.addWidget(self.cancel_btn)
         layout.addLayout(button_layout)
         
@@ -637,6 +4211,24 @@ class BackupApp(QMainWindow):
         self.next_backup_label = QLabel("Следующее копирование: остановлено")
         self.next_backup_label.setStyleSheet("background-color: #e3f2fd; padding: 5px; border: 1px solid #bbdefb;")
         layout.addWidget(self.next_backup_label)
+
+        # Список заданий: в очереди, выполняемые и завершенные
+        jobs_group = QGroupBox("Задания")
+        jobs_layout = QHBoxLayout(jobs_group)
+        self.jobs_list = QListWidget()
+        self.jobs_list.setMaximumHeight(100)
+        jobs_layout.addWidget(self.jobs_list)
+        self.cancel_job_btn = QPushButton("Отменить задание")
+        self.cancel_job_btn.clicked.connect(self.cancel_selected_job)
+        jobs_buttons_layout = QVBoxLayout()
+        jobs_buttons_layout.addWidget(self.cancel_job_btn)
+        self.retry_failed_btn = QPushButton("Повторить неудавшиеся")
+        self.retry_failed_btn.setToolTip("Скопировать заново только файлы, не скопированные выбранным заданием")
+        self.retry_failed_btn.clicked.connect(self.retry_selected_job_failures)
+        jobs_buttons_layout.addWidget(self.retry_failed_btn)
+        jobs_buttons_layout.addStretch()
+        jobs_layout.addLayout(jobs_buttons_layout)
+        layout.addWidget(jobs_group)
         
         # История операций (Лог)
         log_group = QGroupBox()
@@ -710,6 +4302,7 @@ class BackupApp(QMainWindow):
         self.tabs_widget = QTabWidget()
         self.tabs_widget.setTabsClosable(True)
         self.tabs_widget.tabCloseRequested.connect(self.close_tab)
+        self.tabs_widget.currentChanged.connect(self.on_current_tab_changed)
         
         # Устанавливаем фиксированную ширину вкладок
         tab_width = 140 
@@ -767,10 +4360,21 @@ class BackupApp(QMainWindow):
                 'source_folders': [],
                 'source_files': [],
                 'destination_folder': '',
+                'extra_destinations': [],
                 'folders_list': QListWidget(),
                 'files_list': QListWidget(),
                 'dest_edit': QLineEdit(),
-                'title_edit': tab_title_edit
+                'extra_dest_list': QListWidget(),
+                'title_edit': tab_title_edit,
+                'rate_limit_spin': QSpinBox(),
+                'files_rate_limit_spin': QSpinBox(),
+                'schedule_combo': QComboBox(),
+                'schedule_time_edit': QTimeEdit(QTime(0, 0)),
+                'schedule_weekday_combo': QComboBox(),
+                'schedule_monthday_spin': QSpinBox(),
+                'schedule_cron_edit': QLineEdit(),
+                'schedule_key': self.new_schedule_key(),
+                'last_total_size': 0
             }
             
             # Подключаем сигнал завершения редактирования
@@ -826,14 +4430,66 @@ class BackupApp(QMainWindow):
 
             # Блок 3: Папка сохранения
             dest_group = QGroupBox("Папка сохранения")
-            dest_layout = QHBoxLayout(dest_group)
+            dest_group_layout = QVBoxLayout(dest_group)
+            dest_layout = QHBoxLayout()
             tab_data['dest_edit'].setReadOnly(True)
             dest_layout.addWidget(tab_data['dest_edit'])
             dest_btn = QPushButton("Выбрать папку")
             dest_btn.clicked.connect(lambda: self.select_destination_folder_for_tab(tab_data))
             dest_layout.addWidget(dest_btn)
-            
+            dest_group_layout.addLayout(dest_layout)
+
+            # Дополнительные папки: каждый файл читается один раз и пишется во все папки
+            dest_group_layout.addWidget(QLabel("Дополнительные папки (копия пишется во все папки за одно чтение):"))
+            tab_data['extra_dest_list'].setMaximumHeight(60)
+            dest_group_layout.addWidget(tab_data['extra_dest_list'])
+            extra_dest_buttons_layout = QHBoxLayout()
+            add_extra_dest_btn = QPushButton("Добавить папку")
+            add_extra_dest_btn.clicked.connect(lambda: self.add_extra_destination_to_tab(tab_data))
+            remove_extra_dest_btn = QPushButton("Удалить папку")
+            remove_extra_dest_btn.clicked.connect(lambda: self.remove_selected_extra_destination_from_tab(tab_data))
+            extra_dest_buttons_layout.addWidget(add_extra_dest_btn)
+            extra_dest_buttons_layout.addWidget(remove_extra_dest_btn)
+            dest_group_layout.addLayout(extra_dest_buttons_layout)
+
             tab_layout.addWidget(dest_group)
+
+            # Блок 4: Ограничение скорости копирования этой вкладки
+            limit_group = QGroupBox("Ограничение скорости (0 - без ограничений)")
+            limit_layout = QHBoxLayout(limit_group)
+            limit_layout.addWidget(QLabel("MB/с:"))
+            tab_data['rate_limit_spin'].setRange(0, 100000)
+            limit_layout.addWidget(tab_data['rate_limit_spin'])
+            limit_layout.addWidget(QLabel("Файлов/с:"))
+            tab_data['files_rate_limit_spin'].setRange(0, 1000000)
+            limit_layout.addWidget(tab_data['files_rate_limit_spin'])
+            limit_layout.addStretch()
+
+            tab_layout.addWidget(limit_group)
+
+            # Блок 5: Собственное расписание вкладки
+            schedule_group = QGroupBox("Расписание вкладки")
+            schedule_layout = QHBoxLayout(schedule_group)
+            tab_data['schedule_combo'].addItems([TAB_SCHEDULE_GLOBAL] + SCHEDULE_PERIODS)
+            schedule_layout.addWidget(tab_data['schedule_combo'])
+            schedule_layout.addWidget(tab_data['schedule_time_edit'])
+            tab_data['schedule_weekday_combo'].addItems(["Понедельник", "Вторник", "Среда", "Четверг",
+                                                         "Пятница", "Суббота", "Воскресенье"])
+            schedule_layout.addWidget(tab_data['schedule_weekday_combo'])
+            tab_data['schedule_monthday_spin'].setRange(1, 31)
+            schedule_layout.addWidget(tab_data['schedule_monthday_spin'])
+            tab_data['schedule_cron_edit'].setPlaceholderText("мин час день месяц день_недели, например */30 * * * *")
+            schedule_layout.addWidget(tab_data['schedule_cron_edit'])
+            schedule_layout.addStretch()
+            self.update_tab_schedule_ui(tab_data)
+
+            tab_data['schedule_combo'].currentTextChanged.connect(lambda: self.on_tab_schedule_changed(tab_data))
+            tab_data['schedule_time_edit'].timeChanged.connect(lambda: self.on_tab_schedule_changed(tab_data))
+            tab_data['schedule_weekday_combo'].currentIndexChanged.connect(lambda: self.on_tab_schedule_changed(tab_data))
+            tab_data['schedule_monthday_spin'].valueChanged.connect(lambda: self.on_tab_schedule_changed(tab_data))
+            tab_data['schedule_cron_edit'].editingFinished.connect(lambda: self.on_tab_schedule_changed(tab_data))
+
+            tab_layout.addWidget(schedule_group)
             tab_layout.addStretch()
 
             # Сохраняем данные вкладки в свойстве виджета
@@ -853,10 +4509,21 @@ class BackupApp(QMainWindow):
                 'source_folders': [],
                 'source_files': [],
                 'destination_folder': '',
+                'extra_destinations': [],
                 'folders_list': QListWidget(),
                 'files_list': QListWidget(),
                 'dest_edit': QLineEdit(),
-                'title_edit': QLineEdit(default_name)
+                'extra_dest_list': QListWidget(),
+                'title_edit': QLineEdit(default_name),
+                'rate_limit_spin': QSpinBox(),
+                'files_rate_limit_spin': QSpinBox(),
+                'schedule_combo': QComboBox(),
+                'schedule_time_edit': QTimeEdit(QTime(0, 0)),
+                'schedule_weekday_combo': QComboBox(),
+                'schedule_monthday_spin': QSpinBox(),
+                'schedule_cron_edit': QLineEdit(),
+                'schedule_key': self.new_schedule_key(),
+                'last_total_size': 0
             }
             tab_widget.tab_data = tab_data
             
@@ -914,6 +4581,8 @@ class BackupApp(QMainWindow):
             if hasattr(current_widget, 'tab_data'):
                 tab_name = self.tabs_widget.tabText(index)
                 self.save_tab_settings(current_widget.tab_data, index)
+                # Расписание закрытой вкладки больше не срабатывает
+                self.scheduler.remove(current_widget.tab_data['schedule_key'])
             
             self.tabs_widget.removeTab(index)
             
@@ -993,6 +4662,29 @@ class BackupApp(QMainWindow):
             self.save_current_tab_settings()
             self.log_message(f"Выбрана папка назначения: {folder_path}")
 
+    def add_extra_destination_to_tab(self, tab_data):
+        """Добавляет дополнительную папку назначения вкладки"""
+        folder_path = QFileDialog.getExistingDirectory(self, "Выберите дополнительную папку для резервных копий")
+        if not folder_path:
+            return
+        if folder_path == tab_data['destination_folder'] or folder_path in tab_data['extra_destinations']:
+            self.log_message(f"Папка уже выбрана для сохранения: {folder_path}")
+            return
+        tab_data['extra_destinations'].append(folder_path)
+        tab_data['extra_dest_list'].addItem(folder_path)
+        self.save_current_tab_settings()
+        self.log_message(f"Добавлена дополнительная папка назначения: {folder_path}")
+
+    def remove_selected_extra_destination_from_tab(self, tab_data):
+        """Удаляет выбранную дополнительную папку назначения вкладки"""
+        current_item = tab_data['extra_dest_list'].currentItem()
+        if current_item:
+            folder_path = current_item.text()
+            tab_data['extra_destinations'].remove(folder_path)
+            tab_data['extra_dest_list'].takeItem(tab_data['extra_dest_list'].row(current_item))
+            self.save_current_tab_settings()
+            self.log_message(f"Удалена дополнительная папка назначения: {folder_path}")
+
     def save_current_tab_settings(self):
         """Сохранение настроек текущей активной вкладки"""
         tab_data = self.get_current_tab_data()
@@ -1010,7 +4702,16 @@ class BackupApp(QMainWindow):
             self.settings.setValue("source_folders", tab_data['source_folders'])
             self.settings.setValue("source_files", tab_data['source_files'])
             self.settings.setValue("destination_folder", tab_data['destination_folder'])
+            self.settings.setValue("extra_destinations", tab_data['extra_destinations'])
             self.settings.setValue("tab_title", tab_data['title_edit'].text())
+            self.settings.setValue("last_total_size", tab_data['last_total_size'])
+            self.settings.setValue("rate_limit_mb", tab_data['rate_limit_spin'].value())
+            self.settings.setValue("files_rate_limit", tab_data['files_rate_limit_spin'].value())
+            self.settings.setValue("schedule_period", tab_data['schedule_combo'].currentText())
+            self.settings.setValue("schedule_time", tab_data['schedule_time_edit'].time().toString("hh:mm"))
+            self.settings.setValue("schedule_weekday", tab_data['schedule_weekday_combo'].currentIndex())
+            self.settings.setValue("schedule_monthday", tab_data['schedule_monthday_spin'].value())
+            self.settings.setValue("schedule_cron", tab_data['schedule_cron_edit'].text())
             self.settings.endGroup()
 
     def load_tab_settings(self, tab_data, tab_index):
@@ -1028,42 +4729,83 @@ class BackupApp(QMainWindow):
             if current_index >= 0:
                 self.tabs_widget.setTabText(current_index, display_title)
 
-        # Загружаем список папок
+        # Загружаем списки папок и файлов; проверка путей и заполнение списков
+        # откладываются до первого показа или копирования вкладки (ensure_tab_sources_loaded)
         source_folders = self.settings.value("source_folders", [])
         if isinstance(source_folders, str) and source_folders:
             source_folders = [source_folders]
         elif source_folders is None:
             source_folders = []
-        
-        tab_data['source_folders'] = []
-        tab_data['folders_list'].clear()
-        for folder_path in source_folders:
-            if folder_path and os.path.exists(folder_path) and os.path.isdir(folder_path):
-                tab_data['source_folders'].append(folder_path)
-                tab_data['folders_list'].addItem(folder_path)
-        
-        # Загружаем список файлов
+
         source_files = self.settings.value("source_files", [])
         if isinstance(source_files, str) and source_files:
             source_files = [source_files]
         elif source_files is None:
             source_files = []
-        
-        tab_data['source_files'] = []
+
+        tab_data['source_folders'] = [folder_path for folder_path in source_folders if folder_path]
+        tab_data['source_files'] = [file_path for file_path in source_files if file_path]
+        tab_data['folders_list'].clear()
         tab_data['files_list'].clear()
-        for file_path in source_files:
-            if file_path and os.path.exists(file_path) and os.path.isfile(file_path):
-                tab_data['source_files'].append(file_path)
-                tab_data['files_list'].addItem(file_path)
-        
+        tab_data['sources_loaded'] = False
+
         # Загружаем папку назначения
         destination_folder = self.settings.value("destination_folder", "")
         if destination_folder and os.path.exists(destination_folder) and os.path.isdir(destination_folder):
             tab_data['destination_folder'] = destination_folder
             tab_data['dest_edit'].setText(destination_folder)
+
+        # Дополнительные папки назначения; недоступная сейчас папка (отключенный диск) сохраняется
+        extra_destinations = self.settings.value("extra_destinations", [])
+        if isinstance(extra_destinations, str) and extra_destinations:
+            extra_destinations = [extra_destinations]
+        elif extra_destinations is None:
+            extra_destinations = []
+        tab_data['extra_destinations'] = []
+        tab_data['extra_dest_list'].clear()
+        for folder_path in extra_destinations:
+            if folder_path and folder_path not in tab_data['extra_destinations']:
+                tab_data['extra_destinations'].append(folder_path)
+                tab_data['extra_dest_list'].addItem(folder_path)
+
+        # Размер прошлого копирования - оценка для конвейерного режима
+        tab_data['last_total_size'] = self.settings.value("last_total_size", 0, type=int)
+
+        # Ограничение скорости вкладки
+        tab_data['rate_limit_spin'].setValue(max(0, self.settings.value("rate_limit_mb", 0, type=int)))
+        tab_data['files_rate_limit_spin'].setValue(max(0, self.settings.value("files_rate_limit", 0, type=int)))
+
+        # Собственное расписание вкладки
+        index = tab_data['schedule_combo'].findText(self.settings.value("schedule_period", TAB_SCHEDULE_GLOBAL))
+        tab_data['schedule_combo'].setCurrentIndex(max(0, index))
+        schedule_time = QTime.fromString(self.settings.value("schedule_time", "00:00"), "hh:mm")
+        tab_data['schedule_time_edit'].setTime(schedule_time if schedule_time.isValid() else QTime(0, 0))
+        schedule_weekday = self.settings.value("schedule_weekday", 0, type=int)
+        tab_data['schedule_weekday_combo'].setCurrentIndex(schedule_weekday if 0 <= schedule_weekday < 7 else 0)
+        tab_data['schedule_monthday_spin'].setValue(self.settings.value("schedule_monthday", 1, type=int))
+        tab_data['schedule_cron_edit'].setText(self.settings.value("schedule_cron", ""))
+        self.update_tab_schedule_ui(tab_data)
         
         self.settings.endGroup()
     
+    def ensure_tab_sources_loaded(self, tab_data):
+        """Проверяет пути источников вкладки и заполняет ее списки, если это еще не сделано"""
+        if tab_data is None or tab_data.get('sources_loaded', True):
+            return
+        tab_data['sources_loaded'] = True
+        tab_data['source_folders'] = [folder_path for folder_path in tab_data['source_folders']
+                                      if os.path.isdir(folder_path)]
+        tab_data['source_files'] = [file_path for file_path in tab_data['source_files']
+                                    if os.path.isfile(file_path)]
+        tab_data['folders_list'].addItems(tab_data['source_folders'])
+        tab_data['files_list'].addItems(tab_data['source_files'])
+
+    def on_current_tab_changed(self, index):
+        """Списки источников вкладки заполняются при ее первом показе"""
+        widget = self.tabs_widget.widget(index)
+        if hasattr(widget, 'tab_data'):
+            self.ensure_tab_sources_loaded(widget.tab_data)
+
     def remove_all_tab_settings(self):
         """Удаляет все группы настроек вкладок"""
         # Получаем все ключи настроек
@@ -1101,7 +4843,7 @@ class BackupApp(QMainWindow):
         # Тип периода
         planning_layout.addWidget(QLabel("Тип периода:"), 0, 0)
         self.period_type_combo = QComboBox()
-        self.period_type_combo.addItems(["Ежедневно", "Еженедельно", "Ежемесячно"])
+        self.period_type_combo.addItems(SCHEDULE_PERIODS)
         self.period_type_combo.currentTextChanged.connect(self.update_ui_for_period)
         planning_layout.addWidget(self.period_type_combo, 0, 1)
 
@@ -1127,6 +4869,30 @@ class BackupApp(QMainWindow):
         planning_layout.addWidget(self.monthday_label, 3, 0)
         planning_layout.addWidget(self.monthday_spin, 3, 1)
 
+        # Выражение cron (для периода Cron)
+        self.cron_label = QLabel("Выражение cron:")
+        self.cron_edit = QLineEdit()
+        self.cron_edit.setPlaceholderText("мин час день месяц день_недели, например 0 */4 * * 1-5")
+        planning_layout.addWidget(self.cron_label, 4, 0)
+        planning_layout.addWidget(self.cron_edit, 4, 1)
+
+        # Часы занятости: копирование в это время приостанавливается
+        self.busy_hours_cb = QCheckBox("Приостанавливать копирование в часы занятости")
+        self.busy_hours_cb.setChecked(False)
+        planning_layout.addWidget(self.busy_hours_cb, 5, 0, 1, 2)
+
+        planning_layout.addWidget(QLabel("Часы занятости:"), 6, 0)
+        busy_hours_layout = QHBoxLayout()
+        busy_hours_layout.addWidget(QLabel("с"))
+        self.busy_start_edit = QTimeEdit()
+        self.busy_start_edit.setTime(QTime(9, 0))
+        busy_hours_layout.addWidget(self.busy_start_edit)
+        busy_hours_layout.addWidget(QLabel("до"))
+        self.busy_end_edit = QTimeEdit()
+        self.busy_end_edit.setTime(QTime(18, 0))
+        busy_hours_layout.addWidget(self.busy_end_edit)
+        planning_layout.addLayout(busy_hours_layout, 6, 1)
+
         settings_layout.addWidget(planning_group) 
 
         # Блок 2: Дополнительные настройки
@@ -1161,6 +4927,107 @@ class BackupApp(QMainWindow):
         self.auto_start_cb.stateChanged.connect(self.toggle_auto_start)
         additional_layout.addWidget(self.auto_start_cb, 4, 0, 1, 2)
 
+        # Конвейерный режим: копирование начинается во время подсчета размера
+        self.pipelined_copy = QCheckBox("Начинать копирование, не дожидаясь подсчёта общего размера")
+        self.pipelined_copy.setChecked(True)
+        self.pipelined_copy.setToolTip("Общая проверка свободного места выполняется после подсчета размера; "
+                                       "при инкрементальном копировании место проверяется только перед "
+                                       "записью каждого файла")
+        additional_layout.addWidget(self.pipelined_copy, 5, 0, 1, 2)
+
+        # Инкрементальное копирование по сравнению с прошлым манифестом
+        self.incremental_copy = QCheckBox("Копировать только новые и изменённые с прошлого копирования файлы")
+        self.incremental_copy.setChecked(False)
+        additional_layout.addWidget(self.incremental_copy, 6, 0, 1, 2)
+
+        # Обработка символических ссылок в источниках
+        additional_layout.addWidget(QLabel("Символические ссылки:"), 7, 0)
+        self.symlink_policy_combo = QComboBox()
+        self.symlink_policy_combo.addItem("Копировать содержимое (каждую папку один раз)", SYMLINK_FOLLOW)
+        self.symlink_policy_combo.addItem("Сохранять как ссылки", SYMLINK_PRESERVE)
+        self.symlink_policy_combo.addItem("Пропускать", SYMLINK_SKIP)
+        additional_layout.addWidget(self.symlink_policy_combo, 7, 1)
+
+        # Бережный к кэшу ввод-вывод: не вытеснять из памяти данные других программ
+        self.cache_friendly_io = QCheckBox("Не вытеснять файловый кэш системы при копировании")
+        self.cache_friendly_io.setChecked(True)
+        additional_layout.addWidget(self.cache_friendly_io, 8, 0, 1, 2)
+
+        # Прямой ввод-вывод (O_DIRECT) для больших файлов, 0 - отключен
+        additional_layout.addWidget(QLabel("Копировать мимо кэша файлы больше (MB, 0 - нет):"), 9, 0)
+        self.direct_io_threshold_spin = QSpinBox()
+        self.direct_io_threshold_spin.setRange(0, 1024 * 1024)
+        self.direct_io_threshold_spin.setValue(0)
+        additional_layout.addWidget(self.direct_io_threshold_spin, 9, 1)
+
+        # Общее ограничение скорости для всех копирований, 0 - без ограничений
+        additional_layout.addWidget(QLabel("Общее ограничение скорости (MB/с, 0 - нет):"), 10, 0)
+        self.global_rate_limit_spin = QSpinBox()
+        self.global_rate_limit_spin.setRange(0, 100000)
+        self.global_rate_limit_spin.setValue(0)
+        additional_layout.addWidget(self.global_rate_limit_spin, 10, 1)
+
+        additional_layout.addWidget(QLabel("Общее ограничение (файлов/с, 0 - нет):"), 11, 0)
+        self.global_files_rate_limit_spin = QSpinBox()
+        self.global_files_rate_limit_spin.setRange(0, 1000000)
+        self.global_files_rate_limit_spin.setValue(0)
+        additional_layout.addWidget(self.global_files_rate_limit_spin, 11, 1)
+
+        # Замедление копирования, когда система или диски заняты другой работой
+        self.adaptive_rate_limit = QCheckBox("Замедлять копирование при высокой нагрузке на систему и диски")
+        self.adaptive_rate_limit.setChecked(False)
+        additional_layout.addWidget(self.adaptive_rate_limit, 12, 0, 1, 2)
+
+        # Сколько заданий копирования может выполняться одновременно
+        additional_layout.addWidget(QLabel("Одновременно выполняемых заданий:"), 13, 0)
+        self.max_jobs_spin = QSpinBox()
+        self.max_jobs_spin.setRange(1, 16)
+        self.max_jobs_spin.setValue(1)
+        additional_layout.addWidget(self.max_jobs_spin, 13, 1)
+
+        # Число потоков, размер блока и порядок чтения по типу дисков (SSD, HDD, сеть)
+        self.device_aware_copy = QCheckBox("Подбирать способ копирования по типу дисков источника и назначения")
+        self.device_aware_copy.setChecked(True)
+        additional_layout.addWidget(self.device_aware_copy, 14, 0, 1, 2)
+
+        # Метаданные копий: когда переносить и что переносить кроме времени и прав
+        self.deferred_metadata = QCheckBox("Переносить время и права файлов отдельным проходом после копирования данных")
+        self.deferred_metadata.setChecked(True)
+        additional_layout.addWidget(self.deferred_metadata, 15, 0, 1, 2)
+
+        self.copy_xattrs = QCheckBox("Копировать расширенные атрибуты файлов")
+        self.copy_xattrs.setChecked(True)
+        additional_layout.addWidget(self.copy_xattrs, 16, 0, 1, 2)
+
+        self.copy_acls = QCheckBox("Копировать списки доступа (POSIX ACL)")
+        self.copy_acls.setChecked(True)
+        additional_layout.addWidget(self.copy_acls, 17, 0, 1, 2)
+
+        self.copy_directory_times = QCheckBox("Переносить время изменения и права папок")
+        self.copy_directory_times.setChecked(True)
+        additional_layout.addWidget(self.copy_directory_times, 18, 0, 1, 2)
+
+        # Когда скопированные данные сбрасываются на диск (защита от сбоя питания)
+        additional_layout.addWidget(QLabel("Надежность записи:"), 19, 0)
+        self.durability_combo = QComboBox()
+        self.durability_combo.addItem("Без синхронизации с диском (быстрее всего)", DURABILITY_NONE)
+        self.durability_combo.addItem("Сброс на диск в конце копирования", DURABILITY_RUN)
+        self.durability_combo.addItem("Сброс на диск каждого файла (медленно)", DURABILITY_FILE)
+        self.durability_combo.setCurrentIndex(self.durability_combo.findData(DURABILITY_RUN))
+        additional_layout.addWidget(self.durability_combo, 19, 1)
+
+        # Базы SQLite копируются согласованно, не мешая работающим с ними программам
+        self.sqlite_backup = QCheckBox("Копировать базы SQLite (.db, .sqlite) через резервное копирование SQLite")
+        self.sqlite_backup.setChecked(True)
+        additional_layout.addWidget(self.sqlite_backup, 20, 0, 1, 2)
+
+        # Сколько данных может отставать запись в дополнительную папку назначения от чтения
+        additional_layout.addWidget(QLabel("Буфер записи в дополнительную папку (MB):"), 21, 0)
+        self.tee_buffer_spin = QSpinBox()
+        self.tee_buffer_spin.setRange(1, 4096)
+        self.tee_buffer_spin.setValue(TEE_BUFFER_SIZE // (1024 * 1024))
+        additional_layout.addWidget(self.tee_buffer_spin, 21, 1)
+
         settings_layout.addWidget(additional_group)
 
         # Блок 3: Сброс настроек
@@ -1239,6 +5106,27 @@ class BackupApp(QMainWindow):
         self.settings.setValue("keep_history", False)
         self.settings.setValue("monthday", 1)
         self.settings.setValue("period_type", "Ежедневно")
+        self.settings.setValue("pipelined_copy", True)
+        self.settings.setValue("incremental_copy", False)
+        self.settings.setValue("symlink_policy", SYMLINK_FOLLOW)
+        self.settings.setValue("cache_friendly_io", True)
+        self.settings.setValue("direct_io_threshold_mb", 0)
+        self.settings.setValue("global_rate_limit_mb", 0)
+        self.settings.setValue("global_files_rate_limit", 0)
+        self.settings.setValue("adaptive_rate_limit", False)
+        self.settings.setValue("busy_hours_enabled", False)
+        self.settings.setValue("busy_hours_start", "09:00")
+        self.settings.setValue("busy_hours_end", "18:00")
+        self.settings.setValue("max_concurrent_jobs", 1)
+        self.settings.setValue("device_aware_copy", True)
+        self.settings.setValue("deferred_metadata", True)
+        self.settings.setValue("copy_xattrs", True)
+        self.settings.setValue("copy_acls", True)
+        self.settings.setValue("copy_directory_times", True)
+        self.settings.setValue("durability", DURABILITY_RUN)
+        self.settings.setValue("sqlite_backup", True)
+        self.settings.setValue("tee_buffer_mb", TEE_BUFFER_SIZE // (1024 * 1024))
+        self.settings.setValue("cron_expression", "")
         self.settings.setValue("tab_count", 1)
         self.settings.setValue("tab_names", "Без названия")
         self.settings.setValue("timer_active", False)
@@ -1248,7 +5136,12 @@ class BackupApp(QMainWindow):
         self.settings.setValue("Tab_0/source_folders", [])
         self.settings.setValue("Tab_0/source_files", [])
         self.settings.setValue("Tab_0/destination_folder", "")
+        self.settings.setValue("Tab_0/extra_destinations", [])
         self.settings.setValue("Tab_0/tab_title", "Без названия")
+        self.settings.setValue("Tab_0/last_total_size", 0)
+        self.settings.setValue("Tab_0/rate_limit_mb", 0)
+        self.settings.setValue("Tab_0/files_rate_limit", 0)
+        self.settings.setValue("Tab_0/schedule_period", TAB_SCHEDULE_GLOBAL)
         
         # Удаляем все остальные вкладки
         all_keys = self.settings.allKeys()
@@ -1270,6 +5163,27 @@ class BackupApp(QMainWindow):
         self.keep_history.setChecked(False)
         self.create_backup_folder.setChecked(False)
         self.auto_start_cb.setChecked(False)
+        self.pipelined_copy.setChecked(True)
+        self.incremental_copy.setChecked(False)
+        self.symlink_policy_combo.setCurrentIndex(0)
+        self.cache_friendly_io.setChecked(True)
+        self.direct_io_threshold_spin.setValue(0)
+        self.global_rate_limit_spin.setValue(0)
+        self.global_files_rate_limit_spin.setValue(0)
+        self.adaptive_rate_limit.setChecked(False)
+        self.busy_hours_cb.setChecked(False)
+        self.busy_start_edit.setTime(QTime(9, 0))
+        self.busy_end_edit.setTime(QTime(18, 0))
+        self.max_jobs_spin.setValue(1)
+        self.device_aware_copy.setChecked(True)
+        self.deferred_metadata.setChecked(True)
+        self.copy_xattrs.setChecked(True)
+        self.copy_acls.setChecked(True)
+        self.copy_directory_times.setChecked(True)
+        self.durability_combo.setCurrentIndex(self.durability_combo.findData(DURABILITY_RUN))
+        self.sqlite_backup.setChecked(True)
+        self.tee_buffer_spin.setValue(TEE_BUFFER_SIZE // (1024 * 1024))
+        self.cron_edit.clear()
         
         # Обновляем UI для периода
         self.update_ui_for_period("Ежедневно")
@@ -1297,64 +5211,83 @@ class BackupApp(QMainWindow):
         """Показать раздел настроек"""
         self.stacked_widget.setCurrentIndex(1)
 
-    def start_backup_thread(self):
-        """Запускает резервное копирование для текущей или всех вкладок"""
+    def start_backup_thread(self, priority=JOB_PRIORITY_MANUAL):
+        """Ставит в очередь резервное копирование текущей или всех вкладок"""
         if self.copy_all_tabs.isChecked():
             # Копирование из всех вкладок
-            self.start_backup_all_tabs()
+            self.start_backup_all_tabs(priority)
         else:
             # Копирование только из текущей вкладки (старая логика)
-            self.start_backup_current_tab()
+            self.start_backup_current_tab(priority)
 
-    def start_backup_current_tab(self):
-        """Запускает резервное копирование для текущей вкладки"""
+    def start_backup_current_tab(self, priority=JOB_PRIORITY_MANUAL, skip_own_schedule=False):
+        """Ставит в очередь резервное копирование текущей вкладки"""
         tab_data = self.get_current_tab_data()
         if not tab_data:
-            QMessageBox.warning(self, "Ошибка", "Нет активной вкладки!")
+            if priority == JOB_PRIORITY_SCHEDULED:
+                self.log_message("Копирование по расписанию пропущено: нет активной вкладки")
+            else:
+                QMessageBox.warning(self, "Ошибка", "Нет активной вкладки!")
+            return
+        if skip_own_schedule and self.get_tab_schedule(tab_data) is not None:
+            # Вкладка с собственным расписанием копируется только по нему
+            self.log_message("Копирование по общему расписанию пропущено: "
+                             "у текущей вкладки собственное расписание")
             return
+        self.start_backup_for_tab(tab_data, priority)
 
+    def start_backup_for_tab(self, tab_data, priority=JOB_PRIORITY_MANUAL):
+        """Ставит в очередь резервное копирование одной вкладки"""
         if not self.validate_backup_conditions_for_tab(tab_data):
             return
 
-        # Блокируем UI во время копирования
-        self.set_ui_enabled(False)
-        
-        # Предварительно вычисляем размер для отображения
-        total_size = self.calculate_total_backup_size_for_tab(tab_data)
-        
-        # Создаем worker с данными из текущей вкладки
-        self.backup_worker = BackupWorker(
-            tab_data['source_folders'],
-            tab_data['source_files'],
-            tab_data['destination_folder'],
-            self.copy_folder_contents.isChecked(),
-            self.keep_history.isChecked(),
-            self.create_backup_folder.isChecked()
-        )
-        
-        # Передаем общий размер в worker
-        self.backup_worker.total_size = total_size
-        self.backup_worker.progress_updated.connect(self.update_progress)
-        self.backup_worker.status_updated.connect(self.status_label.setText)
-        self.backup_worker.finished_signal.connect(self.on_backup_finished)
-        
-        # Показываем прогресс с реальным размером
-        self.show_progress_bar(total_size)
-        
-        # Устанавливаем начальный статус
-        if total_size > 0:
-            total_mb = total_size / (1024 * 1024)
-            self.status_label.setText(f"Копирование текущей вкладки... (0.0 MB / {total_mb:.1f} MB) | Файлов: 0")
-        else:
-            self.status_label.setText("Подготовка к копированию текущей вкладки...")
-        
-        # Запускаем
-        self.backup_worker.start()
+        # Размер прошлого копирования служит оценкой, точный размер считает поток
+        total_size = tab_data['last_total_size']
+
+        # Параметры фиксируются при постановке в очередь
+        source_folders = list(tab_data['source_folders'])
+        source_files = list(tab_data['source_files'])
+        destination_folder = tab_data['destination_folder']
+        extra_destinations = list(tab_data['extra_destinations'])
+        copy_folder_contents = self.copy_folder_contents.isChecked()
+        keep_history = self.keep_history.isChecked()
+        create_backup_folder = self.create_backup_folder.isChecked()
+        rate_limit = tab_data['rate_limit_spin'].value() * 1024 * 1024
+        files_rate_limit = tab_data['files_rate_limit_spin'].value()
+        engine_options = self.get_engine_options()
+
+        # Создаем worker с данными из текущей вкладки при запуске задания
+        def create_worker():
+            return BackupWorker(
+                source_folders,
+                source_files,
+                destination_folder,
+                copy_folder_contents,
+                keep_history,
+                create_backup_folder,
+                rate_limit=rate_limit,
+                files_rate_limit=files_rate_limit,
+                estimated_size=total_size,
+                extra_destinations=extra_destinations,
+                **engine_options
+            )
 
-    def start_backup_all_tabs(self):
-        """Запускает резервное копирование для всех вкладок с их папками назначения"""
+        self.submit_backup_job({
+            'name': f"Вкладка «{tab_data['title_edit'].text()}»",
+            'key': ('tab', tuple(source_folders), tuple(source_files), destination_folder,
+                    tuple(extra_destinations)),
+            'priority': priority,
+            'destinations': [destination_folder] + extra_destinations,
+            'create_worker': create_worker,
+            'tab_refs': [tab_data],
+            'estimated_size': total_size
+        })
+
+    def start_backup_all_tabs(self, priority=JOB_PRIORITY_MANUAL, skip_own_schedule=False):
+        """Ставит в очередь резервное копирование всех вкладок с их папками назначения"""
         # Собираем данные из всех вкладок
         tabs_data = []
+        tab_refs = []
         valid_tabs_count = 0
         total_size = 0
         
@@ -1362,60 +5295,221 @@ class BackupApp(QMainWindow):
             widget = self.tabs_widget.widget(i)
             if hasattr(widget, 'tab_data'):
                 tab_data = widget.tab_data
+                if skip_own_schedule and self.get_tab_schedule(tab_data) is not None:
+                    continue
+                self.ensure_tab_sources_loaded(tab_data)
                 
                 # Проверяем, что вкладка имеет необходимые данные
                 if (tab_data['source_folders'] or tab_data['source_files']) and tab_data['destination_folder']:
-                    # Вычисляем размер для этой вкладки
-                    tab_size = self.calculate_total_backup_size_for_tab(tab_data)
-                    if tab_size > 0:
+                    # Размер прошлого копирования служит оценкой для этой вкладки
+                    if self.has_files_to_backup(tab_data):
+                        tab_size = tab_data['last_total_size']
                         tabs_data.append({
-                            'folders': tab_data['source_folders'],
-                            'files': tab_data['source_files'],
+                            'folders': list(tab_data['source_folders']),
+                            'files': list(tab_data['source_files']),
                             'destination': tab_data['destination_folder'],
+                            'extra_destinations': list(tab_data['extra_destinations']),
                             'size': tab_size,
-                            'name': self.tabs_widget.tabText(i)
+                            'name': self.tabs_widget.tabText(i),
+                            'rate_limit': tab_data['rate_limit_spin'].value() * 1024 * 1024,
+                            'files_rate_limit': tab_data['files_rate_limit_spin'].value()
                         })
+                        tab_refs.append(tab_data)
                         total_size += tab_size
                         valid_tabs_count += 1
         
         if valid_tabs_count == 0:
-            QMessageBox.warning(self, "Ошибка", "Нет вкладок с данными для копирования!")
+            if priority == JOB_PRIORITY_SCHEDULED:
+                # Таймер срабатывает без участия пользователя: окно не открываем
+                self.log_message("Копирование по расписанию пропущено: нет вкладок для копирования "
+                                 "по общему расписанию")
+            else:
+                QMessageBox.warning(self, "Ошибка", "Нет вкладок с данными для копирования!")
             return
-        
-        # Проверяем условия
-        if total_size == 0:
-            QMessageBox.warning(self, "Ошибка", "Нет файлов для копирования!")
+
+        copy_folder_contents = self.copy_folder_contents.isChecked()
+        keep_history = self.keep_history.isChecked()
+        create_backup_folder = self.create_backup_folder.isChecked()
+        engine_options = self.get_engine_options()
+
+        # Создаем специальный worker для множественного копирования при запуске задания
+        def create_worker():
+            return MultiTabBackupWorker(
+                tabs_data,
+                copy_folder_contents,
+                keep_history,
+                create_backup_folder,
+                estimated_size=total_size,
+                **engine_options
+            )
+
+        self.submit_backup_job({
+            'name': f"Все вкладки ({valid_tabs_count})",
+            'key': ('all',) + tuple((tuple(tab['folders']), tuple(tab['files']), tab['destination'],
+                                     tuple(tab['extra_destinations']))
+                                    for tab in tabs_data),
+            'priority': priority,
+            'destinations': [destination for tab in tabs_data
+                             for destination in [tab['destination']] + tab['extra_destinations']],
+            'create_worker': create_worker,
+            'tab_refs': tab_refs,
+            'estimated_size': total_size
+        })
+
+    def submit_backup_job(self, job):
+        """Ставит задание в очередь и запускает его, если позволяют лимит и папки назначения"""
+        if not self.job_queue.submit(job):
+            self.log_message(f"Задание уже ожидает в очереди: {job['name']}")
             return
-        
+        self.start_queued_jobs()
+        if job['state'] == 'queued':
+            self.log_message(f"Задание поставлено в очередь: {job['name']}")
+        self.update_jobs_panel()
+
+    def start_queued_jobs(self):
+        """Запускает ожидающие задания, пока это позволяют лимит и занятость папок назначения"""
+        self.job_queue.max_running = self.max_jobs_spin.value()
+        while True:
+            job = self.job_queue.next_ready()
+            if job is None:
+                break
+            self.start_job(job)
+
+    def start_job(self, job):
+        """Создает и запускает поток копирования для задания"""
+        try:
+            worker = job['create_worker']()
+        except Exception as e:
+            self.job_queue.finish(job, 'failed', f"Ошибка запуска: {str(e)}")
+            self.log_message(f"✗ {job['name']}: ошибка запуска: {str(e)}")
+            return
+        job['worker'] = worker
+
+        worker.progress_updated.connect(lambda value, job=job: self.on_job_progress(job, value))
+        worker.status_updated.connect(lambda text, job=job: self.on_job_status(job, text))
+        worker.size_estimate_updated.connect(
+            lambda total_size, exact, job=job: self.on_job_size_estimate(job, total_size, exact)
+        )
+        worker.finished_signal.connect(
+            lambda success, message, job=job: self.on_job_finished(job, success, message)
+        )
+
         # Блокируем UI во время копирования
         self.set_ui_enabled(False)
-        
-        # Создаем специальный worker для множественного копирования
-        self.backup_worker = MultiTabBackupWorker(
-            tabs_data,
-            self.copy_folder_contents.isChecked(),
-            self.keep_history.isChecked(),
-            self.create_backup_folder.isChecked()
-        )
-        
-        # Передаем общий размер в worker
-        self.backup_worker.total_size = total_size
-        self.backup_worker.progress_updated.connect(self.update_progress)
-        self.backup_worker.status_updated.connect(self.status_label.setText)
-        self.backup_worker.finished_signal.connect(self.on_backup_finished)
-        
-        # Показываем прогресс с реальным размером
+        if self.displayed_job is None:
+            self.show_job(job)
+        self.log_message(f"Запущено задание: {job['name']}")
+
+        # Запускаем в потоке службы копирования
+        self.backup_service.submit(worker)
+        # Запуск, пришедшийся на часы занятости, сразу приостанавливается
+        self.check_busy_hours()
+
+    def show_job(self, job):
+        """Показывает прогресс задания в статус баре"""
+        self.displayed_job = job
+        total_size = job['estimated_size']
         self.show_progress_bar(total_size)
-        
+        self.progress_bar.setValue(job['progress'])
+
         # Устанавливаем начальный статус
-        total_mb = total_size / (1024 * 1024)
-        self.status_label.setText(f"Копирование из {valid_tabs_count} вкладок... (0.0 MB / {total_mb:.1f} MB) | Файлов: 0")
-        
-        # Запускаем
-        self.backup_worker.start()
-        
+        if total_size > 0:
+            total_mb = total_size / (1024 * 1024)
+            self.status_label.setText(f"{job['name']}: копирование... (~{total_mb:.1f} MB)")
+        else:
+            self.status_label.setText(f"{job['name']}: подготовка к копированию...")
+
+    def on_job_progress(self, job, progress_percent):
+        """Прогресс задания: в статус баре для показанного задания и в списке заданий"""
+        if progress_percent != job['progress']:
+            job['progress'] = progress_percent
+            self.update_jobs_panel()
+        if job is self.displayed_job:
+            self.update_progress(progress_percent)
+
+    def on_job_status(self, job, text):
+        if job is self.displayed_job:
+            self.status_label.setText(text)
+
+    def on_job_size_estimate(self, job, total_size, exact):
+        if job is self.displayed_job:
+            self.on_size_estimate_updated(total_size, exact)
+
+    def update_jobs_panel(self):
+        """Перерисовывает список заданий, сохраняя выделение"""
+        selected_item = self.jobs_list.currentItem()
+        selected_id = selected_item.data(Qt.UserRole) if selected_item else None
+        self.jobs_list.clear()
+        for job in self.job_queue.jobs():
+            item = QListWidgetItem(self.job_queue.describe(job))
+            item.setData(Qt.UserRole, job['id'])
+            self.jobs_list.addItem(item)
+            if job['id'] == selected_id:
+                self.jobs_list.setCurrentItem(item)
+
+    def cancel_selected_job(self):
+        """Отменяет выбранное в списке задание: ожидающее снимается с очереди, выполняемое прерывается"""
+        item = self.jobs_list.currentItem()
+        job = self.job_queue.find(item.data(Qt.UserRole)) if item else None
+        if job is None:
+            return
+        if job['state'] == 'queued':
+            self.job_queue.finish(job, 'cancelled', "Отменено до запуска")
+            self.log_message(f"Задание снято с очереди: {job['name']}")
+            self.update_jobs_panel()
+        elif job['state'] == 'running':
+            job['worker'].cancel()
+
+    def retry_selected_job_failures(self):
+        """Ставит в очередь повтор файлов, не скопированных выбранным завершенным заданием"""
+        item = self.jobs_list.currentItem()
+        job = self.job_queue.find(item.data(Qt.UserRole)) if item else None
+        if job is None or not job.get('failures'):
+            QMessageBox.information(self, "Повтор", "У выбранного задания нет неудавшихся файлов")
+            return
+        failures = job['failures']
+        engine_options = self.get_engine_options()
+
+        def create_worker():
+            return RetryFailedWorker(failures, **engine_options)
+
+        self.submit_backup_job({
+            'name': f"Повтор неудавшихся ({len(failures)}): {job['name']}",
+            'key': ('retry', job['id']),
+            'priority': JOB_PRIORITY_MANUAL,
+            'destinations': job['destinations'],
+            'create_worker': create_worker,
+            'tab_refs': [],
+            'estimated_size': sum(failure['size'] for failure in failures)
+        })
+
+    def get_engine_options(self):
+        """Параметры движка копирования из текущих настроек"""
+        GLOBAL_RATE_LIMITER.configure(
+            self.global_rate_limit_spin.value() * 1024 * 1024,
+            self.global_files_rate_limit_spin.value(),
+            self.adaptive_rate_limit.isChecked()
+        )
+        return {
+            'pipelined': self.pipelined_copy.isChecked(),
+            'manifest_dir': os.path.join(self.config_dir, "manifests"),
+            'incremental': self.incremental_copy.isChecked(),
+            'symlink_policy': self.symlink_policy_combo.currentData(),
+            'cache_friendly_io': self.cache_friendly_io.isChecked(),
+            'direct_io_threshold': self.direct_io_threshold_spin.value() * 1024 * 1024,
+            'device_aware': self.device_aware_copy.isChecked(),
+            'deferred_metadata': self.deferred_metadata.isChecked(),
+            'copy_xattrs': self.copy_xattrs.isChecked(),
+            'copy_acls': self.copy_acls.isChecked(),
+            'copy_directory_times': self.copy_directory_times.isChecked(),
+            'durability': self.durability_combo.currentData(),
+            'sqlite_backup': self.sqlite_backup.isChecked(),
+            'tee_buffer': self.tee_buffer_spin.value() * 1024 * 1024
+        }
+
     def validate_backup_conditions_for_tab(self, tab_data):
         """Проверяет условия для выполнения резервного копирования для конкретной вкладки"""
+        self.ensure_tab_sources_loaded(tab_data)
         if not (tab_data['source_folders'] or tab_data['source_files']):
             self.log_message("Проверка условий: не выбраны исходные файлы/папки")
             return False
@@ -1424,8 +5518,7 @@ class BackupApp(QMainWindow):
             self.log_message("Проверка условий: не выбрана папка назначения")
             return False
         
-        total_size = self.calculate_total_backup_size_for_tab(tab_data)
-        if total_size == 0:
+        if not self.has_files_to_backup(tab_data):
             self.log_message("Проверка условий: нет файлов для копирования")
             return False
         
@@ -1436,107 +5529,169 @@ class BackupApp(QMainWindow):
             except OSError as e:
                 self.log_message(f"Не удалось создать папку назначения: {str(e)}")
                 return False
-        
-        return True
 
-    def calculate_total_backup_size_for_tab(self, tab_data):
-        """Вычисляет общий размер файлов для копирования для конкретной вкладки"""
-        total_size = 0
-        
-        # Для папок
-        for folder_path in tab_data['source_folders']:
-            if os.path.isdir(folder_path):
+        # Недоступная дополнительная папка не мешает копированию в основную
+        for folder_path in tab_data['extra_destinations']:
+            if not os.path.exists(folder_path):
                 try:
-                    if self.copy_folder_contents.isChecked():
-                        for root, dirs, files in os.walk(folder_path):
-                            for file in files:
-                                file_path = os.path.join(root, file)
-                                if os.path.exists(file_path):
-                                    total_size += os.path.getsize(file_path)
-                    else:
-                        for root, dirs, files in os.walk(folder_path):
-                            for file in files:
-                                file_path = os.path.join(root, file)
-                                if os.path.exists(file_path):
-                                    total_size += os.path.getsize(file_path)
-                except (OSError, PermissionError):
-                    continue
-        
-        # Для отдельных файлов
+                    os.makedirs(folder_path)
+                    self.log_message(f"Создана дополнительная папка назначения: {folder_path}")
+                except OSError as e:
+                    self.log_message(f"Не удалось создать дополнительную папку назначения: {str(e)}")
+
+        return True
+
+    def has_files_to_backup(self, tab_data):
+        """Быстрая проверка наличия хотя бы одного файла без подсчета общего размера"""
         for file_path in tab_data['source_files']:
-            if os.path.isfile(file_path) and os.path.exists(file_path):
-                try:
-                    total_size += os.path.getsize(file_path)
-                except (OSError, PermissionError):
-                    continue
-        
-        return total_size
+            if os.path.isfile(file_path):
+                return True
 
-    def calculate_total_backup_size(self, folders, files):
-        """Вычисляет общий размер файлов для копирования для всех вкладок"""
-        total_size = 0
-        
-        # Для папок
-        for folder_path in folders:
+        for folder_path in tab_data['source_folders']:
             if os.path.isdir(folder_path):
                 try:
-                    if self.copy_folder_contents.isChecked():
-                        for root, dirs, files_walk in os.walk(folder_path):
-                            for file in files_walk:
-                                file_path = os.path.join(root, file)
-                                if os.path.exists(file_path):
-                                    total_size += os.path.getsize(file_path)
-                    else:
-                        for root, dirs, files_walk in os.walk(folder_path):
-                            for file in files_walk:
-                                file_path = os.path.join(root, file)
-                                if os.path.exists(file_path):
-                                    total_size += os.path.getsize(file_path)
-                except (OSError, PermissionError):
-                    continue
-        
-        # Для отдельных файлов
-        for file_path in files:
-            if os.path.isfile(file_path) and os.path.exists(file_path):
-                try:
-                    total_size += os.path.getsize(file_path)
+                    for root, dirs, files in os.walk(folder_path):
+                        if files:
+                            return True
                 except (OSError, PermissionError):
                     continue
-        
-        return total_size
 
-    def on_backup_finished(self, success, message):
-        """Обрабатывает завершение копирования"""
-        self.set_ui_enabled(True)
-        self.hide_progress_bar()
-        
+        return False
+
+    def on_job_finished(self, job, success, message):
+        """Обрабатывает завершение задания копирования"""
+        worker = job['worker']
+        if worker.cancelled:
+            state = 'cancelled'
+        else:
+            state = 'finished' if success else 'failed'
+        job['copied_bytes'] = worker.stats.get('copied_bytes', 0)
+        # Неудавшиеся файлы можно скопировать заново без повторного сканирования
+        job['failures'] = list(worker.failed_files)
+        self.job_queue.finish(job, state, message)
+
         if success:
-            self.log_message(f"✓ {message}")
-            self.status_label.setText("Копирование завершено успешно")
+            self.log_message(f"✓ {job['name']}: {message}")
         else:
-            self.log_message(f"✗ {message}")
-            self.status_label.setText("Ошибка копирования")
-            
+            self.log_message(f"✗ {job['name']}: {message}")
+
+        for line in worker.report_lines():
+            self.log_message(f"  {line}")
+
+        # Запоминаем точные размеры вкладок как оценку для следующего запуска
+        scanner = worker.scanner
+        if scanner and scanner.completed and not worker.cancelled:
+            for tab_data, tab_size in zip(job['tab_refs'], scanner.tab_sizes):
+                tab_data['last_total_size'] = tab_size
+                self.save_tab_settings(tab_data, None)
+
         # Очищаем worker
-        self.backup_worker = None
-        # Сбрасываем размер
-        self.current_backup_size = 0
+        job['worker'] = None
+
+        if job is self.displayed_job:
+            self.displayed_job = None
+            self.hide_progress_bar()
+            if success:
+                self.status_label.setText("Копирование завершено успешно")
+            elif state == 'cancelled':
+                self.status_label.setText("Копирование отменено")
+            else:
+                self.status_label.setText("Ошибка копирования")
+
+        # Освободившиеся папки назначения и место в лимите отдаем ожидающим заданиям
+        self.start_queued_jobs()
+        if self.displayed_job is None and self.job_queue.running:
+            self.show_job(self.job_queue.running[0])
+        if not self.job_queue.running:
+            self.set_ui_enabled(True)
+        self.update_jobs_panel()
         
     def set_ui_enabled(self, enabled):
-        """Блокирует/разблокирует UI во время копирования"""
+        """Блокирует/разблокирует UI во время копирования.
+
+        Кнопка ручного копирования остается доступной: новые задания ставятся в очередь.
+        """
         self.start_btn.setEnabled(enabled)
         self.stop_btn.setEnabled(enabled and self.backup_timer.isActive())
-        self.manual_btn.setEnabled(enabled)
         self.cancel_btn.setVisible(not enabled)
+        self.pause_btn.setVisible(not enabled)
+        if enabled:
+            self.pause_btn.setText("Пауза")
         
     def cancel_backup(self):
-        """Отменяет текущее копирование"""
-        if self.backup_worker and self.backup_worker.isRunning():
-            self.backup_worker.cancel()
-            self.backup_worker.wait(3000)
+        """Отменяет все выполняемые и ожидающие задания.
+
+        Выполняемые задания только получают флаг отмены: они останавливаются на границе
+        блока, а очистку делает on_job_finished, не блокируя поток интерфейса.
+        """
+        cancelled_queued = self.job_queue.cancel_queued()
+        running = list(self.job_queue.running)
+        for job in running:
+            job['worker'].cancel()
+        if running or cancelled_queued:
             self.status_label.setText("Копирование отменено")
-            self.hide_progress_bar()
-            self.set_ui_enabled(True)
+        self.update_jobs_panel()
+
+    def toggle_pause_backup(self):
+        """Приостанавливает или продолжает выполняемые задания"""
+        running = self.job_queue.running
+        if not running:
+            return
+        if all(job['worker'].is_paused() for job in running):
+            # Продолженное вручную в часы занятости задание больше не приостанавливается
+            # автоматически до конца этого интервала
+            busy = self.is_busy_time()
+            for job in running:
+                job['busy_override'] = busy
+            self.resume_backup()
+        else:
+            self.pause_backup()
+
+    def pause_backup(self, reason="Копирование приостановлено", jobs=None):
+        """Приостанавливает копирование на границе блока без потери прогресса"""
+        for job in (self.job_queue.running if jobs is None else jobs):
+            job['worker'].pause()
+        self.pause_btn.setText("Продолжить")
+        self.status_label.setText(reason)
+        self.log_message(reason)
+
+    def resume_backup(self, reason="Копирование продолжено", jobs=None):
+        """Продолжает приостановленное копирование с того же места"""
+        for job in (self.job_queue.running if jobs is None else jobs):
+            job['auto_paused'] = False
+            job['worker'].resume()
+        self.pause_btn.setText("Пауза")
+        self.status_label.setText(reason)
+        self.log_message(reason)
+
+    def is_busy_time(self, now=None):
+        """Попадает ли время в настроенные часы занятости (интервал может переходить через полночь)"""
+        if not self.busy_hours_cb.isChecked():
+            return False
+        current = (now or datetime.now()).time()
+        start = self.busy_start_edit.time().toPyTime()
+        end = self.busy_end_edit.time().toPyTime()
+        if start <= end:
+            return start <= current < end
+        return current >= start or current < end
+
+    def check_busy_hours(self):
+        """Автоматически приостанавливает задания в часы занятости и продолжает их после"""
+        if not self.job_queue.running:
+            return
+        if self.is_busy_time():
+            jobs = [job for job in self.job_queue.running
+                    if not job['worker'].is_paused() and not job.get('busy_override')]
+            if jobs:
+                for job in jobs:
+                    job['auto_paused'] = True
+                self.pause_backup("Копирование приостановлено: часы занятости", jobs)
+        else:
+            for job in self.job_queue.running:
+                job['busy_override'] = False
+            jobs = [job for job in self.job_queue.running if job.get('auto_paused')]
+            if jobs:
+                self.resume_backup("Часы занятости закончились, копирование продолжено", jobs)
 
     def setup_custom_statusbar(self):
         """Настраивает кастомный статус бар с прогрессом"""
@@ -1583,6 +5738,7 @@ class BackupApp(QMainWindow):
         self.progress_bar.setVisible(True)
         self.progress_bar.setValue(0)
         self.progress_bar.setMaximum(100)  # Всегда максимум 100%
+        self.progress_bar.setFormat("~%p%")
         
         # Сохраняем общий размер для отображения
         if total_size > 0:
@@ -1595,6 +5751,11 @@ class BackupApp(QMainWindow):
         if platform.system() == "Darwin":
             QApplication.processEvents()
 
+    def on_size_estimate_updated(self, total_size, exact):
+        """Переключает прогресс бар с оценочного размера на точный после сканирования"""
+        self.current_backup_size = total_size
+        self.progress_bar.setFormat("%p%" if exact else "~%p%")
+
     def update_progress(self, progress_percent):
         """Обновляет только прогресс бар, текст статуса теперь управляется из потока"""
         if self.progress_bar.isVisible():
@@ -1912,13 +6073,17 @@ class BackupApp(QMainWindow):
                 # Загружаем настройки для этой вкладки по индексу
                 if tab_data:
                     self.load_tab_settings(tab_data, i)
+
+            # Источники остальных вкладок проверяются при их показе
+            self.ensure_tab_sources_loaded(self.get_current_tab_data())
             
             # Загружаем настройки планирования
+            # Выражение cron восстанавливается до периода, чтобы период Cron сразу показал его
+            self.cron_edit.setText(self.settings.value("cron_expression", ""))
             period_type = self.settings.value("period_type", "Ежедневно")
-            if period_type and period_type in ["Ежедневно", "Еженедельно", "Ежемесячно"]:
-                index = self.period_type_combo.findText(period_type)
-                if index >= 0:
-                    self.period_type_combo.setCurrentIndex(index)
+            index = self.period_type_combo.findText(period_type) if isinstance(period_type, str) else -1
+            if index >= 0:
+                self.period_type_combo.setCurrentIndex(index)
             
             time_str = self.settings.value("backup_time", "00:00")
             time = QTime.fromString(time_str, "hh:mm")
@@ -1926,6 +6091,13 @@ class BackupApp(QMainWindow):
                 self.time_edit.setTime(time)
             else:
                 self.time_edit.setTime(QTime.currentTime())
+
+            # Загружаем часы занятости
+            self.busy_hours_cb.setChecked(self.settings.value("busy_hours_enabled", False, type=bool))
+            busy_start = QTime.fromString(self.settings.value("busy_hours_start", "09:00"), "hh:mm")
+            self.busy_start_edit.setTime(busy_start if busy_start.isValid() else QTime(9, 0))
+            busy_end = QTime.fromString(self.settings.value("busy_hours_end", "18:00"), "hh:mm")
+            self.busy_end_edit.setTime(busy_end if busy_end.isValid() else QTime(18, 0))
             
             # Загружаем значения дней
             weekday = self.settings.value("weekday", 0, type=int)
@@ -1949,6 +6121,56 @@ class BackupApp(QMainWindow):
 
             copy_folder_contents = self.settings.value("copy_folder_contents", False, type=bool)
             self.copy_folder_contents.setChecked(bool(copy_folder_contents))
+
+            pipelined_copy = self.settings.value("pipelined_copy", True, type=bool)
+            self.pipelined_copy.setChecked(bool(pipelined_copy))
+
+            incremental_copy = self.settings.value("incremental_copy", False, type=bool)
+            self.incremental_copy.setChecked(bool(incremental_copy))
+
+            symlink_policy = self.settings.value("symlink_policy", SYMLINK_FOLLOW)
+            index = self.symlink_policy_combo.findData(symlink_policy)
+            self.symlink_policy_combo.setCurrentIndex(index if index >= 0 else 0)
+
+            cache_friendly_io = self.settings.value("cache_friendly_io", True, type=bool)
+            self.cache_friendly_io.setChecked(bool(cache_friendly_io))
+
+            direct_io_threshold_mb = self.settings.value("direct_io_threshold_mb", 0, type=int)
+            self.direct_io_threshold_spin.setValue(max(0, direct_io_threshold_mb))
+
+            global_rate_limit_mb = self.settings.value("global_rate_limit_mb", 0, type=int)
+            self.global_rate_limit_spin.setValue(max(0, global_rate_limit_mb))
+
+            global_files_rate_limit = self.settings.value("global_files_rate_limit", 0, type=int)
+            self.global_files_rate_limit_spin.setValue(max(0, global_files_rate_limit))
+
+            adaptive_rate_limit = self.settings.value("adaptive_rate_limit", False, type=bool)
+            self.adaptive_rate_limit.setChecked(bool(adaptive_rate_limit))
+
+            max_concurrent_jobs = self.settings.value("max_concurrent_jobs", 1, type=int)
+            self.max_jobs_spin.setValue(min(16, max(1, max_concurrent_jobs)))
+
+            device_aware_copy = self.settings.value("device_aware_copy", True, type=bool)
+            self.device_aware_copy.setChecked(bool(device_aware_copy))
+
+            deferred_metadata = self.settings.value("deferred_metadata", True, type=bool)
+            self.deferred_metadata.setChecked(bool(deferred_metadata))
+            copy_xattrs = self.settings.value("copy_xattrs", True, type=bool)
+            self.copy_xattrs.setChecked(bool(copy_xattrs))
+            copy_acls = self.settings.value("copy_acls", True, type=bool)
+            self.copy_acls.setChecked(bool(copy_acls))
+            copy_directory_times = self.settings.value("copy_directory_times", True, type=bool)
+            self.copy_directory_times.setChecked(bool(copy_directory_times))
+
+            durability = self.settings.value("durability", DURABILITY_RUN)
+            index = self.durability_combo.findData(durability)
+            self.durability_combo.setCurrentIndex(index if index >= 0 else self.durability_combo.findData(DURABILITY_RUN))
+
+            sqlite_backup = self.settings.value("sqlite_backup", True, type=bool)
+            self.sqlite_backup.setChecked(bool(sqlite_backup))
+
+            tee_buffer_mb = self.settings.value("tee_buffer_mb", TEE_BUFFER_SIZE // (1024 * 1024), type=int)
+            self.tee_buffer_spin.setValue(max(1, tee_buffer_mb))
             
             # Загрузка и синхронизация автозапуска
             auto_start_setting = self.settings.value("auto_start", False, type=bool)
@@ -2031,6 +6253,10 @@ class BackupApp(QMainWindow):
         # Сохраняем настройки планирования
         self.settings.setValue("period_type", self.period_type_combo.currentText())
         self.settings.setValue("backup_time", self.time_edit.time().toString("hh:mm"))
+        self.settings.setValue("cron_expression", self.cron_edit.text())
+        self.settings.setValue("busy_hours_enabled", self.busy_hours_cb.isChecked())
+        self.settings.setValue("busy_hours_start", self.busy_start_edit.time().toString("hh:mm"))
+        self.settings.setValue("busy_hours_end", self.busy_end_edit.time().toString("hh:mm"))
         self.settings.setValue("weekday", self.weekday_combo.currentIndex())
         self.settings.setValue("monthday", self.monthday_spin.value())
         self.settings.setValue("keep_history", self.keep_history.isChecked())
@@ -2042,6 +6268,23 @@ class BackupApp(QMainWindow):
 
         # Сохраняем настройку режима копирования папок
         self.settings.setValue("copy_folder_contents", self.copy_folder_contents.isChecked())
+        self.settings.setValue("pipelined_copy", self.pipelined_copy.isChecked())
+        self.settings.setValue("incremental_copy", self.incremental_copy.isChecked())
+        self.settings.setValue("symlink_policy", self.symlink_policy_combo.currentData())
+        self.settings.setValue("cache_friendly_io", self.cache_friendly_io.isChecked())
+        self.settings.setValue("direct_io_threshold_mb", self.direct_io_threshold_spin.value())
+        self.settings.setValue("global_rate_limit_mb", self.global_rate_limit_spin.value())
+        self.settings.setValue("global_files_rate_limit", self.global_files_rate_limit_spin.value())
+        self.settings.setValue("adaptive_rate_limit", self.adaptive_rate_limit.isChecked())
+        self.settings.setValue("max_concurrent_jobs", self.max_jobs_spin.value())
+        self.settings.setValue("device_aware_copy", self.device_aware_copy.isChecked())
+        self.settings.setValue("deferred_metadata", self.deferred_metadata.isChecked())
+        self.settings.setValue("copy_xattrs", self.copy_xattrs.isChecked())
+        self.settings.setValue("copy_acls", self.copy_acls.isChecked())
+        self.settings.setValue("copy_directory_times", self.copy_directory_times.isChecked())
+        self.settings.setValue("durability", self.durability_combo.currentData())
+        self.settings.setValue("sqlite_backup", self.sqlite_backup.isChecked())
+        self.settings.setValue("tee_buffer_mb", self.tee_buffer_spin.value())
 
         # Сохраняем настройку копирования из всех вкладок
         self.settings.setValue("copy_all_tabs", self.copy_all_tabs.isChecked())
@@ -2058,13 +6301,12 @@ class BackupApp(QMainWindow):
             return
         
         # Восстанавливаем состояние интерфейса
-        self.backup_timer.start(60000)
+        self.backup_timer.start(30000)
         self.start_btn.setEnabled(False)
         self.stop_btn.setEnabled(True)
         
         # Рассчитываем следующее время копирования
-        self.next_backup_time = self.calculate_next_backup_time()
-        self.update_next_backup_label()
+        self.rebuild_schedule()
         
         self.start_backup()
 
@@ -2080,6 +6322,27 @@ class BackupApp(QMainWindow):
         self.create_backup_folder.setChecked(True)
         self.auto_start_cb.setChecked(False)
         self.copy_all_tabs.setChecked(False)
+        self.pipelined_copy.setChecked(True)
+        self.incremental_copy.setChecked(False)
+        self.symlink_policy_combo.setCurrentIndex(0)
+        self.cache_friendly_io.setChecked(True)
+        self.direct_io_threshold_spin.setValue(0)
+        self.global_rate_limit_spin.setValue(0)
+        self.global_files_rate_limit_spin.setValue(0)
+        self.adaptive_rate_limit.setChecked(False)
+        self.busy_hours_cb.setChecked(False)
+        self.busy_start_edit.setTime(QTime(9, 0))
+        self.busy_end_edit.setTime(QTime(18, 0))
+        self.max_jobs_spin.setValue(1)
+        self.device_aware_copy.setChecked(True)
+        self.deferred_metadata.setChecked(True)
+        self.copy_xattrs.setChecked(True)
+        self.copy_acls.setChecked(True)
+        self.copy_directory_times.setChecked(True)
+        self.durability_combo.setCurrentIndex(self.durability_combo.findData(DURABILITY_RUN))
+        self.sqlite_backup.setChecked(True)
+        self.tee_buffer_spin.setValue(TEE_BUFFER_SIZE // (1024 * 1024))
+        self.cron_edit.clear()
         
         self.log_message("Установлены настройки по умолчанию")
     
@@ -2089,10 +6352,15 @@ class BackupApp(QMainWindow):
         self.weekday_combo.setVisible(False)
         self.monthday_label.setVisible(False)
         self.monthday_spin.setVisible(False)
+        self.cron_label.setVisible(False)
+        self.cron_edit.setVisible(False)
         
     def update_ui_for_period(self, period_type):
         """Обновляет интерфейс в зависимости от выбранного типа периода"""
         self.hide_all_additional_elements()
+        # Для ежечасного копирования важны только минуты
+        self.time_edit.setDisplayFormat("mm" if period_type == "Ежечасно" else "HH:mm")
+        self.time_edit.setEnabled(period_type != "Cron")
         
         if period_type == "Еженедельно":
             self.weekday_label.setVisible(True)
@@ -2100,62 +6368,85 @@ class BackupApp(QMainWindow):
         elif period_type == "Ежемесячно":
             self.monthday_label.setVisible(True)
             self.monthday_spin.setVisible(True)
+        elif period_type == "Cron":
+            self.cron_label.setVisible(True)
+            self.cron_edit.setVisible(True)
+
+    def update_tab_schedule_ui(self, tab_data):
+        """Показывает поля расписания вкладки, нужные для выбранного периода"""
+        period_type = tab_data['schedule_combo'].currentText()
+        tab_data['schedule_time_edit'].setVisible(period_type in ("Ежедневно", "Еженедельно", "Ежемесячно", "Ежечасно"))
+        tab_data['schedule_time_edit'].setDisplayFormat("mm" if period_type == "Ежечасно" else "HH:mm")
+        tab_data['schedule_weekday_combo'].setVisible(period_type == "Еженедельно")
+        tab_data['schedule_monthday_spin'].setVisible(period_type == "Ежемесячно")
+        tab_data['schedule_cron_edit'].setVisible(period_type == "Cron")
             
-    def calculate_next_backup_time(self):
-        """Рассчитывает время следующего копирования"""
-        now = datetime.now()
+    def new_schedule_key(self):
+        """Уникальный ключ расписания вкладки в общем планировщике"""
+        self.schedule_key_counter = getattr(self, 'schedule_key_counter', 0) + 1
+        return f"tab_{self.schedule_key_counter}"
+
+    def get_global_schedule(self):
+        """Общее расписание из настроек планирования"""
         backup_time = self.time_edit.time()
-        backup_time_dt = datetime(now.year, now.month, now.day, 
-                                 backup_time.hour(), backup_time.minute(), backup_time.second())
-        
-        period_type = self.period_type_combo.currentText()
-        
-        if period_type == "Ежедневно":
-            if backup_time_dt > now:
-                next_time = backup_time_dt
-            else:
-                next_time = backup_time_dt + timedelta(days=1)
-                
-        elif period_type == "Еженедельно":
-            weekday = self.weekday_combo.currentIndex()
-            current_weekday = now.weekday()
-            
-            days_ahead = (weekday - current_weekday) % 7
-            if days_ahead == 0 and backup_time_dt > now:
-                next_time = backup_time_dt
-            else:
-                if days_ahead == 0:
-                    days_ahead = 7
-                next_time = backup_time_dt + timedelta(days=days_ahead)
-                
-        elif period_type == "Ежемесячно":
-            day_of_month = self.monthday_spin.value()
-            
-            try:
-                test_date = datetime(now.year, now.month, day_of_month)
-                next_time = datetime(now.year, now.month, day_of_month, 
-                                   backup_time.hour(), backup_time.minute(), backup_time.second())
-            except ValueError:
-                next_month = now.replace(day=28) + timedelta(days=4)
-                next_month = next_month.replace(day=1)
-                last_day = (next_month - timedelta(days=1)).day
-                day_of_month = min(day_of_month, last_day)
-                next_time = datetime(now.year, now.month, day_of_month, 
-                                   backup_time.hour(), backup_time.minute(), backup_time.second())
-            
-            if next_time < now:
-                next_month = now.replace(day=28) + timedelta(days=4)
-                next_month = next_month.replace(day=1)
-                try:
-                    next_time = datetime(next_month.year, next_month.month, day_of_month,
-                                       backup_time.hour(), backup_time.minute(), backup_time.second())
-                except ValueError:
-                    last_day = (next_month.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
-                    day_of_month = min(day_of_month, last_day.day)
-                    next_time = datetime(next_month.year, next_month.month, day_of_month,
-                                       backup_time.hour(), backup_time.minute(), backup_time.second())
-        
-        return next_time
+        return {
+            'period': self.period_type_combo.currentText(),
+            'hour': backup_time.hour(),
+            'minute': backup_time.minute(),
+            'weekday': self.weekday_combo.currentIndex(),
+            'monthday': self.monthday_spin.value(),
+            'cron': self.cron_edit.text()
+        }
+
+    def get_tab_schedule(self, tab_data):
+        """Собственное расписание вкладки, None - вкладка копируется по общему"""
+        period = tab_data['schedule_combo'].currentText()
+        if period not in SCHEDULE_PERIODS:
+            return None
+        schedule_time = tab_data['schedule_time_edit'].time()
+        return {
+            'period': period,
+            'hour': schedule_time.hour(),
+            'minute': schedule_time.minute(),
+            'weekday': tab_data['schedule_weekday_combo'].currentIndex(),
+            'monthday': tab_data['schedule_monthday_spin'].value(),
+            'cron': tab_data['schedule_cron_edit'].text()
+        }
+
+    def iter_tabs_data(self):
+        for i in range(self.tabs_widget.count()):
+            widget = self.tabs_widget.widget(i)
+            if hasattr(widget, 'tab_data'):
+                yield widget.tab_data
+
+    def schedule_tab(self, tab_data):
+        """Ставит собственное расписание вкладки в общий планировщик или убирает его оттуда"""
+        self.scheduler.remove(tab_data['schedule_key'])
+        schedule = self.get_tab_schedule(tab_data)
+        if schedule is None:
+            return
+        try:
+            self.scheduler.set(tab_data['schedule_key'], schedule)
+        except ValueError as e:
+            self.log_message(f"✗ Расписание вкладки «{tab_data['title_edit'].text()}» не задано: {e}")
+
+    def rebuild_schedule(self):
+        """Заново заполняет планировщик общим расписанием и расписаниями вкладок"""
+        self.scheduler.clear()
+        try:
+            self.scheduler.set('global', self.get_global_schedule())
+        except ValueError as e:
+            self.log_message(f"✗ Общее расписание не задано: {e}")
+        for tab_data in self.iter_tabs_data():
+            self.schedule_tab(tab_data)
+        self.update_next_backup_label()
+
+    def on_tab_schedule_changed(self, tab_data):
+        """Применяет изменение расписания вкладки к работающему планировщику"""
+        self.update_tab_schedule_ui(tab_data)
+        if self.backup_timer.isActive():
+            self.schedule_tab(tab_data)
+            self.update_next_backup_label()
     
     def start_backup(self):
         """Запуск автоматического резервного копирования"""
@@ -2163,16 +6454,16 @@ class BackupApp(QMainWindow):
             return
             
         self.save_settings()
-        self.backup_timer.start(60000)  
+        self.backup_timer.start(30000)  
         self.start_btn.setEnabled(False)
         self.stop_btn.setEnabled(True)
         
-        next_time = self.calculate_next_backup_time()
-        self.next_backup_time = next_time
-        self.update_next_backup_label()
+        self.rebuild_schedule()
         
         period_type = self.period_type_combo.currentText()
-        self.log_message(f"Автоматическое копирование запущено. Период: {period_type}")
+        own_schedules = len(self.scheduler.entries) - ('global' in self.scheduler.entries)
+        self.log_message(f"Автоматическое копирование запущено. Период: {period_type}, "
+                         f"вкладок с собственным расписанием: {own_schedules}")
 
         self.settings.setValue("timer_active", True)
         self.save_settings()
@@ -2180,6 +6471,7 @@ class BackupApp(QMainWindow):
     def stop_backup(self):
         """Остановка автоматического резервного копирования"""
         self.backup_timer.stop()
+        self.scheduler.clear()
         self.start_btn.setEnabled(True)
         self.stop_btn.setEnabled(False)
         self.next_backup_label.setText("Следующее копирование: остановлено")
@@ -2188,19 +6480,32 @@ class BackupApp(QMainWindow):
         self.log_message("Автоматическое копирование остановлено")
         
     def check_backup_time(self):
-        """Проверяет, настало ли время для копирования"""
-        now = datetime.now()
-        
-        if hasattr(self, 'next_backup_time') and now >= self.next_backup_time:
-            self.perform_backup()
-            self.next_backup_time = self.calculate_next_backup_time()
+        """Запускает копирование для наступивших расписаний"""
+        due = self.scheduler.pop_due()
+        for key in due:
+            if key == 'global':
+                self.perform_backup()
+                continue
+            for tab_data in self.iter_tabs_data():
+                if tab_data['schedule_key'] == key:
+                    self.start_backup_for_tab(tab_data, JOB_PRIORITY_SCHEDULED)
+                    break
+        if due:
             self.update_next_backup_label()
             
     def update_next_backup_label(self):
         """Обновляет информацию о следующем копировании"""
-        if hasattr(self, 'next_backup_time'):
-            next_time_str = self.next_backup_time.strftime("%d.%m.%Y %H:%M:%S")
-            self.next_backup_label.setText(f"Следующее копирование: {next_time_str}")
+        next_entry = self.scheduler.peek()
+        if next_entry is None:
+            return
+        next_time, key = next_entry
+        next_time_str = next_time.strftime("%d.%m.%Y %H:%M:%S")
+        if key != 'global':
+            for tab_data in self.iter_tabs_data():
+                if tab_data['schedule_key'] == key:
+                    next_time_str += f" (вкладка «{tab_data['title_edit'].text()}»)"
+                    break
+        self.next_backup_label.setText(f"Следующее копирование: {next_time_str}")
         
     def manual_backup(self):
         """Выполнение ручного резервного копирования в отдельном потоке с проверкой условий"""
@@ -2223,9 +6528,7 @@ class BackupApp(QMainWindow):
                     
                     # Проверяем, что вкладка имеет необходимые данные
                     if (tab_data['source_folders'] or tab_data['source_files']) and tab_data['destination_folder']:
-                        # Вычисляем размер для этой вкладки
-                        tab_size = self.calculate_total_backup_size_for_tab(tab_data)
-                        if tab_size > 0:
+                        if self.has_files_to_backup(tab_data):
                             valid_tabs_count += 1
             
             if valid_tabs_count == 0:
@@ -2241,18 +6544,32 @@ class BackupApp(QMainWindow):
             return True
 
     def perform_backup(self):
-        """Основная логика выполнения резервного копирования (автоматического)"""
-        self.start_backup_thread()
+        """Основная логика выполнения резервного копирования по общему расписанию"""
+        if self.copy_all_tabs.isChecked():
+            # Вкладки с собственным расписанием копируются по нему
+            self.start_backup_all_tabs(JOB_PRIORITY_SCHEDULED, skip_own_schedule=True)
+        else:
+            self.start_backup_current_tab(JOB_PRIORITY_SCHEDULED, skip_own_schedule=True)
 
     def log_message(self, message):
         """Логирование сообщений с временной меткой"""
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         self.log_text.append(f"[{timestamp}] {message}")
         
+    def on_settings_written(self, success):
+        """Сообщает в журнал о неудачной фоновой записи настроек"""
+        if not success:
+            self.log_message(f"✗ Не удалось записать настройки в {self.settings.path}, запись будет повторена")
+
     def closeEvent(self, event):
         """Сохраняем настройки при закрытии приложения"""
         self.settings.setValue("timer_active", self.backup_timer.isActive())
         self.save_settings()
+        # Отложенная запись выполняется сейчас, до выхода из приложения
+        if not self.settings.flush(timeout=5):
+            QMessageBox.warning(self, "Ошибка",
+                                f"Не удалось сохранить настройки в файл {self.settings.path}.\n"
+                                "Последние изменения настроек могут быть потеряны.")
         
         if self.backup_timer.isActive():
             self.backup_timer.stop()
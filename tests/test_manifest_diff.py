@@ -0,0 +1,58 @@
+import importlib.util
+import os
+import random
+
+import pytest
+
+pytest.importorskip("PyQt5.QtWidgets")
+numpy = pytest.importorskip("numpy")
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backup-app.py")
+
+
+@pytest.fixture(scope="module")
+def app_module():
+    spec = importlib.util.spec_from_file_location("backup_app", APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_snapshot(module, rows):
+    """Снимок из строк (хеш, размер, mtime, inode), отсортированный по хешу"""
+    snapshot = module.ManifestSnapshot()
+    for entry, (hash_value, size, mtime_ns, inode) in enumerate(rows):
+        snapshot.columns['hashes'].append(hash_value)
+        snapshot.columns['sizes'].append(size)
+        snapshot.columns['mtimes'].append(mtime_ns)
+        snapshot.columns['inodes'].append(inode)
+        snapshot.entries.append(entry)
+    return snapshot.sorted_by_hash()
+
+
+def diff_result(diff):
+    return (sorted(diff.added), sorted(diff.changed), sorted(diff.deleted), sorted(diff.moved))
+
+
+class TestManifestDiff:
+    def test_paths_agree_on_repeated_inodes(self, app_module):
+        rng = random.Random(28)
+        for _ in range(200):
+            # Мало inode и значений: жесткие ссылки и повторно выданные inode
+            previous_rows = [(rng.randrange(1 << 20), rng.randrange(3), rng.randrange(3), rng.randrange(5))
+                             for _ in range(rng.randrange(30))]
+            current_rows = [(rng.randrange(1 << 20), rng.randrange(3), rng.randrange(3), rng.randrange(5))
+                            for _ in range(rng.randrange(30))]
+            previous = make_snapshot(app_module, previous_rows)
+            current = make_snapshot(app_module, current_rows)
+            assert diff_result(current.diff_vectorized(previous)) == diff_result(current.diff_merge(previous))
+
+    def test_move_needs_same_size_and_mtime(self, app_module):
+        # Два удаленных пути с одним inode: перемещением считается только совпадающий по размеру и mtime
+        previous = make_snapshot(app_module, [(1, 10, 100, 7), (2, 20, 200, 7)])
+        current = make_snapshot(app_module, [(3, 20, 200, 7)])
+        for diff in (current.diff_vectorized(previous), current.diff_merge(previous)):
+            moved_old, moved_new = diff.moved[0]
+            assert len(diff.moved) == 1
+            assert previous.columns['hashes'][moved_old] == 2
+            assert diff.added == [] and len(diff.deleted) == 1